@@ -0,0 +1,196 @@
+import time
+
+from .app_router import *
+
+
+class RateLimit(object):
+    """
+    Token bucket rate limit: rate messages per second on average, with bursts of up to burst messages
+    """
+    def __init__(self, rate: float, burst: int = None):
+        """
+        Create a new RateLimit object
+        :param rate: Number of messages allowed per second
+        :param burst: Number of messages allowed at once after an idle period, rate by default (at least 1)
+        """
+        self.Rate = rate
+        self.Burst = burst if burst is not None else max(rate, 1)
+
+
+class TokenBucket(object):
+    """
+    Token bucket of a connection, refilled at the rate of its RateLimit when it is checked
+    """
+    __slots__ = ('Rate', 'Burst', 'Tokens', 'Updated')
+
+    def __init__(self, limit: RateLimit, now: float):
+        """
+        Create a new, full, TokenBucket object
+        :param limit: RateLimit object
+        :param now: Current time.monotonic() value
+        """
+        self.Rate = limit.Rate
+        self.Burst = limit.Burst
+        self.Tokens = limit.Burst
+        self.Updated = now
+
+    def get_wait(self, now: float) -> float:
+        """
+        Refills the bucket and returns the time until it holds a token
+
+        :param now: Current time.monotonic() value
+        :return: 0 if a token is available, the number of seconds until one is otherwise
+        """
+        tokens = min(self.Burst, self.Tokens + (now - self.Updated) * self.Rate)
+        self.Tokens = tokens
+        self.Updated = now
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.Rate
+
+
+class AdmissionOptions(object):
+    """
+    Admission control of the messages received by a websocket app server, see AdmissionController
+    """
+    def __init__(self, connection_limit: RateLimit = None, name_limits: dict = None, max_in_flight: int = None,
+                 max_background_tasks: int = None, retry_after: float = 1.0):
+        """
+        Create a new AdmissionOptions object
+        :param connection_limit: Optional RateLimit of the messages handled per connection
+        :param name_limits: Optional dictionary of RateLimit objects by message name, or name prefix ending with '*'
+        matching the handlers registered under that prefix. Applied per connection
+        :param max_in_flight: Optional maximum number of handlers, running or dispatched, stream senders and
+        background tasks across all the connections. Messages received beyond it are refused until some complete
+        :param max_background_tasks: Optional maximum number of stream senders and background tasks of a connection,
+        see WebsocketAppClient.create_background_task. Messages of a connection at this limit are refused until some
+        complete
+        :param retry_after: Retry after hint in seconds of the messages refused by max_in_flight or
+        max_background_tasks. Messages refused by a rate limit carry the time until the limit admits them
+        """
+        self.ConnectionLimit = connection_limit
+        self.NameLimits = name_limits or {}
+        self.MaxInFlight = max_in_flight
+        self.MaxBackgroundTasks = max_background_tasks
+        self.RetryAfter = retry_after
+
+    def get_name_limit(self, route_name):
+        """
+        Returns the rate limit of a message handler
+
+        :param route_name: Name the handler is registered under
+        :return: RateLimit object, or None. The limit of the exact name, or of the longest matching name prefix
+        """
+        limit = self.NameLimits.get(route_name)
+        if limit is None:
+            patterns = [pattern for pattern in self.NameLimits if pattern.endswith('*') and
+                        match_route_name(pattern, route_name)]
+            if patterns:
+                limit = self.NameLimits[max(patterns, key=len)]
+        return limit
+
+
+class AdmissionController(object):
+    """
+    Admission control of the messages received on the connections sharing a router, see WebsocketAppRouter.
+    Refuses the messages received beyond the rate limits of their connection and name, or while the server is
+    overloaded, so a single client cannot starve the others. The limits are checked on the read loop, before a message
+    is decoded or dispatched, so a refused message costs no task. Refused requests and stream requests get an
+    ErrorResponse carrying a retry after hint, raised as WebsocketAppOverloadedException by the client; other messages
+    are dropped. Refused messages are counted in the Rejected message metrics.
+    """
+    def __init__(self, options: AdmissionOptions):
+        """
+        Create a new AdmissionController object
+        :param options: AdmissionOptions object
+        """
+        self.Options = options
+        # Handlers, stream senders and background tasks in flight across all the connections
+        self.InFlight = 0
+        # Rate limits by handler name, resolved on first use
+        self.RouteLimits = {}
+
+    def admit(self, client, route: MessageRoute):
+        """
+        Checks the limits of a received message, and takes its tokens from the buckets of the connection
+
+        :param client: WebsocketAppClient object receiving the message
+        :param route: MessageRoute object of the message, None for messages without handler
+        :return: None if the message is admitted, the error message and the retry after hint otherwise
+        """
+        options = self.Options
+        if options.MaxInFlight is not None and self.InFlight >= options.MaxInFlight:
+            return 'Server overloaded', options.RetryAfter
+        if options.MaxBackgroundTasks is not None and (
+                len(client.BackgroundTasks or ()) + len(client.StreamSenders or ()) >= options.MaxBackgroundTasks):
+            return 'Too many requests in progress', options.RetryAfter
+
+        name_limit = None
+        if route is not None:
+            try:
+                name_limit = self.RouteLimits[route.Name]
+            except KeyError:
+                name_limit = self.RouteLimits[route.Name] = options.get_name_limit(route.Name)
+        connection_limit = options.ConnectionLimit
+        if connection_limit is None and name_limit is None:
+            return None
+
+        now = time.monotonic()
+        # Buckets are created on first use, keyed by handler name, None for the connection bucket
+        buckets = client.RateLimits
+        if buckets is None:
+            buckets = client.RateLimits = {}
+        wait = 0.0
+        connection_bucket = None
+        if connection_limit is not None:
+            connection_bucket = buckets.get(None)
+            if connection_bucket is None:
+                connection_bucket = buckets[None] = TokenBucket(connection_limit, now)
+            wait = connection_bucket.get_wait(now)
+        name_bucket = None
+        if name_limit is not None:
+            name_bucket = buckets.get(route.Name)
+            if name_bucket is None:
+                name_bucket = buckets[route.Name] = TokenBucket(name_limit, now)
+            wait = max(wait, name_bucket.get_wait(now))
+
+        # Tokens are only taken from the buckets when all of them admit the message
+        if wait > 0:
+            return 'Rate limit exceeded', wait
+        if connection_bucket is not None:
+            connection_bucket.Tokens -= 1
+        if name_bucket is not None:
+            name_bucket.Tokens -= 1
+        return None
+
+    async def reject_async(self, client, msg: WebsocketAppMessage, error: str, retry_after: float):
+        """
+        Refuses a message: requests and stream requests get an error response with the retry after hint
+
+        :param client: WebsocketAppClient object receiving the message
+        :param msg: Refused WebsocketAppMessage object
+        :param error: Error message string
+        :param retry_after: Seconds after which the message may be admitted
+        :return: Void
+        """
+        client.Metrics.get_message_metrics(msg.Name).Rejected += 1
+        if (msg.MessageType == WebsocketAppMessageType.Request or
+                msg.MessageType == WebsocketAppMessageType.StreamRequest):
+            await client.send_error_response_async(msg, error, round(retry_after, 3))
+
+    def track_task(self, task: asyncio.Task):
+        """
+        Counts a task in the messages in flight until it completes
+
+        :param task: Dispatched handler, stream sender or background task
+        :return: Void
+        """
+        self.InFlight += 1
+        task.add_done_callback(self.release_task)
+
+    def release_task(self, task: asyncio.Task):
+        """
+        Done callback of the tracked tasks
+
+        :param task: Completed task
+        :return: Void
+        """
+        self.InFlight -= 1
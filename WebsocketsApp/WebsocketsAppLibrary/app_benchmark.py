@@ -0,0 +1,451 @@
+import argparse
+import gc
+import json
+import platform
+import sys
+import tracemalloc
+
+from .app_server import *
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class BenchmarkWebsocket(object):
+    """
+    Stand-in for an idle websocket, so the memory benchmark measures the state kept by the library per connection
+    and not the buffers of the websockets package
+    """
+    __slots__ = ('subprotocol',)
+
+    def __init__(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+
+def measure_connection_memory(connections: int, codec: str = JsonCodec.Name) -> dict:
+    """
+    Measures the memory retained by idle client connections on a websocket app server
+
+    :param connections: Number of connections to create
+    :param codec: Negotiated codec name of the connections
+    :return: Dictionary with the total and per connection bytes
+    """
+    server = WebsocketAppServer(0)
+    clients = []
+
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for i in range(connections):
+        client = WebsocketAppClientHandler(BenchmarkWebsocket(codec), server)
+        client.Codec = get_codec(codec)
+        server.Metrics.add_connection(client)
+        clients.append(client)
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    return {
+        'benchmark': 'connection_memory',
+        'connections': connections,
+        'codec': codec,
+        'total_bytes': total,
+        'bytes_per_connection': total / connections
+    }
+
+
+def make_payload(size: int) -> dict:
+    """
+    Returns an order like payload object, padded to about a number of bytes once JSON encoded
+
+    :param size: Approximate JSON size in bytes
+    :return: Payload dictionary
+    """
+    payload = {'Id': 123456789, 'Symbol': 'NSE:INFY', 'Side': 'Buy', 'Quantity': 100, 'Price': 1520.25,
+               'Status': 'Pending', 'Notes': ''}
+    padding = size - len(json.dumps(payload, separators=(',', ':')))
+    if padding > 0:
+        payload['Notes'] = 'x' * padding
+    return payload
+
+
+def measure_codec(codec: str, payload_size: int = 128, iterations: int = 20000) -> dict:
+    """
+    Measures the serialization cost of a codec: encode and decode time per message, and frame size
+
+    :param codec: Codec name
+    :param payload_size: Approximate JSON size in bytes of the payload
+    :param iterations: Number of messages encoded and decoded
+    :return: Dictionary with the frame bytes and the mean encode and decode nanoseconds per message
+    """
+    payload = make_payload(payload_size)
+    # The messages are created up front, only the codec calls are timed
+    msgs = [WebsocketAppMessage('place_order', WebsocketAppMessageType.Request, i + 1, None, None, payload)
+            for i in range(iterations)]
+    encoder = get_codec(codec)
+    decoder = get_codec(codec)
+
+    start = time.perf_counter_ns()
+    frames = [encoder.encode(msg) for msg in msgs]
+    encode_time = time.perf_counter_ns() - start
+
+    start = time.perf_counter_ns()
+    for frame in frames:
+        decoder.decode(frame).Data
+    decode_time = time.perf_counter_ns() - start
+
+    return {
+        'benchmark': 'codec',
+        'codec': codec,
+        'payload_size': payload_size,
+        'iterations': iterations,
+        'frame_bytes': len(frames[-1]),
+        'encode_ns': encode_time / iterations,
+        'decode_ns': decode_time / iterations
+    }
+
+
+class BenchmarkServer(WebsocketAppServer):
+    """
+    Websocket app server of the load benchmarks, serving on a free local port. Echoes the echo requests, and records
+    the latency of the oneway messages, which carry their send time
+    """
+    def __init__(self, codec: str, **server_options):
+        WebsocketAppServer.__init__(self, 0, (codec,), **server_options)
+        self.Serve = None
+        self.OnewayLatency = LatencyHistogram()
+        self.OnewayExpected = 0
+        self.OnewayDone = None
+        self.add_message_handler('echo', self.echo_handler_async)
+        self.add_message_handler('oneway', self.oneway_handler_async)
+
+    async def start_async(self) -> int:
+        """
+        Starts serving on a free port of the loopback interface
+
+        :return: Port number
+        """
+        self.Serve = await websockets.serve(self.handler_async, '127.0.0.1', 0, **self.get_serve_options())
+        self.Port = self.Serve.sockets[0].getsockname()[1]
+        return self.Port
+
+    async def stop_async(self):
+        """
+        Closes the server and its connections
+
+        :return: Void
+        """
+        self.Serve.close()
+        await self.Serve.wait_closed()
+
+    async def echo_handler_async(self, client, msg):
+        await client.send_response_obj_async(msg, msg.Data)
+
+    async def oneway_handler_async(self, client, msg):
+        self.OnewayLatency.record(time.perf_counter_ns() - msg.Data['SentNs'])
+        if self.OnewayLatency.Count >= self.OnewayExpected:
+            self.OnewayDone.set()
+
+
+async def run_load_async(pattern: str, clients: int = 10, in_flight: int = 10, messages: int = 20000,
+                         codec: str = JsonCodec.Name, payload_size: int = 128, timeout: float = 120,
+                         **server_options) -> dict:
+    """
+    Runs a load benchmark against a local websocket app server, in this process
+
+    :param pattern: 'request' for request/response round trips, 'oneway' for one-way messages sent to the server,
+    'broadcast' for messages broadcast by the server to all the clients
+    :param clients: Number of client connections
+    :param in_flight: Requests or one-way messages in flight per client; for broadcasts, the number of broadcasts
+    sent before yielding to the event loop
+    :param messages: Total number of requests or one-way messages, or number of broadcasts
+    :param codec: Codec name of the connections
+    :param payload_size: Approximate JSON size in bytes of the payloads
+    :param timeout: Seconds to wait for the messages to be delivered
+    :param server_options: Keyword arguments of WebsocketAppServer, e.g. max_concurrency
+    :return: Dictionary with the throughput and latency percentiles
+    """
+    server = BenchmarkServer(codec, **server_options)
+    port = await server.start_async()
+    connections = [WebsocketAppClient() for i in range(clients)]
+    await asyncio.gather(*[client.connect_async('ws://127.0.0.1:' + str(port), (codec,)) for client in connections])
+
+    payload = make_payload(payload_size)
+    latency = LatencyHistogram()
+    remaining = [messages]
+    delivered = asyncio.Event()
+
+    async def request_worker_async(client):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter_ns()
+            await client.execute_obj_async('echo', payload)
+            latency.record(time.perf_counter_ns() - start)
+
+    async def oneway_worker_async(client):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            await client.send_obj_async('oneway', {'SentNs': time.perf_counter_ns(), 'Payload': payload})
+
+    async def broadcast_handler_async(msg):
+        latency.record(time.perf_counter_ns() - msg.Data['SentNs'])
+        if latency.Count >= messages * clients:
+            delivered.set()
+
+    if pattern == 'broadcast':
+        for client in connections:
+            client.add_message_handler('broadcast', broadcast_handler_async)
+    server.OnewayExpected = messages
+    server.OnewayDone = delivered
+
+    start = time.perf_counter()
+    try:
+        if pattern == 'request':
+            await asyncio.wait_for(asyncio.gather(*[request_worker_async(client) for client in connections
+                                                    for i in range(in_flight)]), timeout)
+            count = messages
+        elif pattern == 'oneway':
+            await asyncio.gather(*[oneway_worker_async(client) for client in connections for i in range(in_flight)])
+            await asyncio.wait_for(delivered.wait(), timeout)
+            latency = server.OnewayLatency
+            count = messages
+        elif pattern == 'broadcast':
+            for i in range(messages):
+                await server.broadcast_async('broadcast', {'SentNs': time.perf_counter_ns(), 'Payload': payload})
+                if i % in_flight == 0:
+                    await asyncio.sleep(0)
+            await asyncio.wait_for(delivered.wait(), timeout)
+            count = messages * clients
+        else:
+            raise ValueError('Unknown load pattern ' + str(pattern))
+        elapsed = time.perf_counter() - start
+    finally:
+        await asyncio.gather(*[client.disconnect('Benchmark done') for client in connections],
+                             return_exceptions=True)
+        await server.stop_async()
+
+    result = {
+        'benchmark': 'load',
+        'pattern': pattern,
+        'codec': codec,
+        'clients': clients,
+        'in_flight': in_flight,
+        'payload_size': payload_size,
+        'messages': count,
+        'max_concurrency': server_options.get('max_concurrency'),
+        'transport': get_transport_settings(server_options.get('transport')),
+        'elapsed_seconds': elapsed,
+        'throughput_per_second': count / elapsed,
+        'latency_us': latency.snapshot()
+    }
+    if resource is not None:
+        result['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def get_transport_settings(transport) -> dict:
+    """
+    Returns the compression, frame and buffer settings of the server connections of a benchmark
+
+    :param transport: TransportOptions object, or None
+    :return: Dictionary of the settings, with the size of the binary ones such as the zdict. None for the defaults
+    of the websockets library
+    """
+    if transport is None:
+        return None
+    return {key: value if isinstance(value, (str, int, float, bool, type(None))) else len(value)
+            for key, value in vars(transport).items()}
+
+
+def run_load(*args, **kwargs) -> dict:
+    """
+    Runs a load benchmark on a new event loop, see run_load_async
+
+    :return: Dictionary with the throughput and latency percentiles
+    """
+    return asyncio.run(run_load_async(*args, **kwargs))
+
+
+def run_suite(connections: int = 10000, clients: int = 10, in_flight: int = 10, messages: int = 20000,
+              payload_size: int = 128) -> list:
+    """
+    Runs the standard benchmark suite: connection memory, serialization cost of every codec, and the request,
+    oneway and broadcast load patterns with the JSON codec and the preferred binary codec
+
+    :return: List of results
+    """
+    results = [measure_connection_memory(connections)]
+    for codec in sorted(CODECS):
+        results.append(measure_codec(codec, payload_size))
+    load_codecs = [JsonCodec.Name] + [codec for codec in BINARY_CODECS[:1] if codec != JsonCodec.Name]
+    for codec in load_codecs:
+        for pattern in ('request', 'oneway'):
+            results.append(run_load(pattern, clients, in_flight, messages, codec, payload_size))
+        results.append(run_load('broadcast', clients, in_flight, max(messages // clients, 1), codec, payload_size))
+    return results
+
+
+# Keys identifying a result across runs, every setting it was measured with, and the metrics compared with a
+# baseline: True when higher is better
+ResultKeys = ('benchmark', 'pattern', 'codec', 'connections', 'clients', 'in_flight', 'payload_size', 'iterations',
+              'messages', 'max_concurrency', 'transport')
+ComparedMetrics = {
+    'bytes_per_connection': False,
+    'encode_ns': False,
+    'decode_ns': False,
+    'throughput_per_second': True,
+    'latency_us.p99_us': False
+}
+
+
+def get_metric(result: dict, path: str):
+    """
+    Returns a metric of a result by its dotted path, or None
+
+    :param result: Result dictionary
+    :param path: Dotted key path, e.g. latency_us.p99_us
+    :return: Metric value, or None if the result does not have it
+    """
+    for key in path.split('.'):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def get_result_key(result: dict) -> tuple:
+    """
+    Returns the key of a result, so results are only compared with results measured with the same settings
+
+    :param result: Result dictionary
+    :return: Tuple of the values of ResultKeys
+    """
+    return tuple(json.dumps(value, sort_keys=True) if isinstance(value, dict) else value
+                 for value in (result.get(key) for key in ResultKeys))
+
+
+def compare_results(results: list, baseline: list, tolerance: float = 0.1) -> list:
+    """
+    Compares results with the results of a previous run, e.g. of the last release
+
+    :param results: List of results
+    :param baseline: List of results of the previous run
+    :param tolerance: Relative change tolerated before a metric counts as a regression, e.g. 0.1 for 10%
+    :return: List of regressions, dictionaries with the result key, metric, baseline and current value. Results
+    without a baseline result measured with the same settings are not compared, and logged
+    """
+    baseline_results = {get_result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get(get_result_key(result))
+        if previous is None:
+            logger.warning('No baseline result with the same settings for %s',
+                           {key: result[key] for key in ResultKeys if result.get(key) is not None})
+            continue
+        for metric, higher_is_better in ComparedMetrics.items():
+            value = get_metric(result, metric)
+            previous_value = get_metric(previous, metric)
+            if not value or not previous_value:
+                continue
+            change = (value - previous_value) / previous_value
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append({
+                    'result': {key: result[key] for key in ResultKeys if result.get(key) is not None},
+                    'metric': metric,
+                    'baseline': previous_value,
+                    'current': value,
+                    'change': change
+                })
+    return regressions
+
+
+def get_environment() -> dict:
+    """
+    Returns the versions and platform the benchmarks ran on, to tell apart results of different environments
+
+    :return: Dictionary of the environment
+    """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'websockets': getattr(websockets, '__version__', None) or getattr(websockets, 'version', None),
+        'platform': platform.platform(),
+        'time': time.time()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Websocket app server benchmarks')
+    parser.add_argument('--output', help='Write the results to this JSON file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results file of a previous run. Exits with status 1 if a metric '
+                                           'regressed beyond the tolerance')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Tolerated relative regression, 0.1 for 10%%')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    memory_parser = subparsers.add_parser('memory', help='Memory retained per idle connection')
+    memory_parser.add_argument('--connections', type=int, nargs='+', default=[10000, 50000])
+    memory_parser.add_argument('--codec', default=JsonCodec.Name, choices=sorted(CODECS))
+
+    codec_parser = subparsers.add_parser('codec', help='Serialization cost per codec')
+    codec_parser.add_argument('--codecs', nargs='+', default=sorted(CODECS), choices=sorted(CODECS))
+    codec_parser.add_argument('--payload-size', type=int, nargs='+', default=[128, 4096])
+    codec_parser.add_argument('--iterations', type=int, default=20000)
+
+    load_parser = subparsers.add_parser('load', help='Throughput and latency against a local server')
+    load_parser.add_argument('--pattern', nargs='+', default=['request', 'oneway', 'broadcast'],
+                             choices=['request', 'oneway', 'broadcast'])
+    load_parser.add_argument('--clients', type=int, default=10)
+    load_parser.add_argument('--in-flight', type=int, default=10)
+    load_parser.add_argument('--messages', type=int, default=20000)
+    load_parser.add_argument('--codec', default=JsonCodec.Name, choices=sorted(CODECS))
+    load_parser.add_argument('--payload-size', type=int, default=128)
+    load_parser.add_argument('--max-concurrency', type=int, default=None)
+
+    suite_parser = subparsers.add_parser('suite', help='Memory, codec and load benchmarks')
+    suite_parser.add_argument('--connections', type=int, default=10000)
+    suite_parser.add_argument('--clients', type=int, default=10)
+    suite_parser.add_argument('--in-flight', type=int, default=10)
+    suite_parser.add_argument('--messages', type=int, default=20000)
+    suite_parser.add_argument('--payload-size', type=int, default=128)
+
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.benchmark == 'memory':
+        for connections in args.connections:
+            results.append(measure_connection_memory(connections, args.codec))
+    elif args.benchmark == 'codec':
+        for codec in args.codecs:
+            for payload_size in args.payload_size:
+                results.append(measure_codec(codec, payload_size, args.iterations))
+    elif args.benchmark == 'load':
+        for pattern in args.pattern:
+            results.append(run_load(pattern, args.clients, args.in_flight, args.messages, args.codec,
+                                    args.payload_size, max_concurrency=args.max_concurrency))
+    elif args.benchmark == 'suite':
+        results = run_suite(args.connections, args.clients, args.in_flight, args.messages, args.payload_size)
+
+    report = {'environment': get_environment(), 'results': results}
+    regressions = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline['results'] if isinstance(baseline, dict) else baseline,
+                                      args.tolerance)
+        report['regressions'] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
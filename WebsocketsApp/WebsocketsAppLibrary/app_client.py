@@ -1,8 +1,20 @@
+import itertools
+import time
+
 import websockets
-import jsonpickle
-from websockets.exceptions import WebSocketException
+from websockets.exceptions import ConnectionClosed, WebSocketException
 
-from .app_types import *
+from .app_admission import *
+from .app_codec import *
+from .app_dispatch import *
+from .app_executor import *
+from .app_logging import *
+from .app_metrics import *
+from .app_outbound import *
+from .app_router import *
+from .app_session import *
+from .app_stream import *
+from .app_transport import *
 
 
 class WebsocketAppClient(object):
@@ -10,15 +22,91 @@ class WebsocketAppClient(object):
     Class representing the websocket app client. This class object is also available on the websocket app server side
     to represent the remove websocket connection.
     Inherit from this class to build your websocket app client.
+    The connection state is declared in __slots__, application data of a connection, e.g. the logged in user, goes in
+    its State dictionary.
     """
-    def __init__(self):
-        self.MessageHandlerMap = {}
-        self.CorIdMessageMap = {}
-        self.CorIdCounter = ThreadSafeCounter()
+    __slots__ = ('RequestTimeout', 'FrameLogger', 'Metrics', 'MessagesIn', 'MessagesOut', 'Router', 'MaxConcurrency',
+                 'Dispatcher', 'CorIdMessageMap', 'StreamReceivers', 'StreamSenders', 'BackgroundTasks', 'RateLimits',
+                 'CorIdCounter', 'ConflationMaxKeys', 'Conflater', 'SendQueueOptions', 'SendQueue', 'ReconnectOptions',
+                 'Session', 'Transport', 'PayloadCompression', 'Codec', 'Codecs', 'Websocket', 'Url',
+                 'ProcessMessageTask', 'Closed', '_state', '__weakref__')
+
+    def __init__(self, max_concurrency: int = None, log_sample_rate: int = 1, log_max_payload: int = 256,
+                 request_timeout: float = None, thread_safe: bool = False, frame_logger: FrameLogger = None,
+                 metrics: MetricsRegistry = None, conflation_max_keys: int = 10000,
+                 send_queue: SendQueueOptions = None, reconnect: ReconnectOptions = None,
+                 transport: TransportOptions = None, router: WebsocketAppRouter = None):
+        """
+        Create a new WebsocketAppClient object
+
+        :param max_concurrency: Maximum number of message handlers running at a time on this connection.
+        None handles the messages one after the other on the read loop. Messages received while as many handlers
+        again are waiting to run are refused: requests get an error response with a retry after hint, raised as
+        WebsocketAppOverloadedException by the requester, and other messages are dropped
+        :param log_sample_rate: Log one in every log_sample_rate frames, when DEBUG is enabled on the
+        WebsocketsAppLibrary.frames logger
+        :param log_max_payload: Maximum number of characters logged per frame. None logs whole frames
+        :param request_timeout: Default timeout in seconds of execute_async calls. None waits for the response
+        until the connection is closed
+        :param thread_safe: Generate correlation ids under a lock, for sending messages from several threads
+        :param frame_logger: FrameLogger shared with other connections, e.g. by the server. Replaces the log settings
+        :param metrics: MetricsRegistry shared with other connections, e.g. by the server
+        :param conflation_max_keys: Maximum number of conflation keys pending on this connection, see send_conflated
+        :param send_queue: Optional SendQueueOptions. Sends then queue the encoded frames on a bounded send queue
+        written by a single writer task, with optional micro-batching. None sends every frame directly on the websocket
+        :param reconnect: Optional ReconnectOptions. The client then reconnects when its connection is lost, and
+        resumes its session on servers with sessions enabled: the messages sent by either party and not received by
+        the other are replayed, so pending execute_async calls get their responses and no one-way message is missed.
+        None closes the client with its connection
+        :param transport: Optional TransportOptions: compression, frame size, queue and buffer limits of the websocket.
+        None uses the defaults of the websockets library
+        :param router: WebsocketAppRouter shared with other connections, e.g. by the server
+        """
+        self.RequestTimeout = request_timeout
+        self.FrameLogger = frame_logger or FrameLogger('Client', log_sample_rate, log_max_payload)
+        self.Metrics = metrics or MetricsRegistry()
+        self.MessagesIn = 0
+        self.MessagesOut = 0
+        self.Router = router or WebsocketAppRouter()
+        # The dispatcher, correlation map and counter are created on first use, idle connections do not carry them
+        self.MaxConcurrency = max_concurrency
+        self.Dispatcher = None
+        self.CorIdMessageMap = None
+        self.StreamReceivers = None
+        self.StreamSenders = None
+        self.BackgroundTasks = None
+        # Token buckets of the admission control, see AdmissionController
+        self.RateLimits = None
+        self.CorIdCounter = ThreadSafeCounter() if thread_safe else None
+        self.ConflationMaxKeys = conflation_max_keys
+        self.Conflater = None
+        self.SendQueueOptions = send_queue
+        self.SendQueue = None
+        self.ReconnectOptions = reconnect
+        self.Session = None
+        self.Transport = transport
+        self.PayloadCompression = None if transport is None else transport.create_payload_compression(self.Metrics)
+        self.Codec = None
+        self.Codecs = None
         self.Websocket = None
         self.Url = None
         self.ProcessMessageTask = None
         self.Closed = False
+        self._state = None
+
+    @property
+    def State(self) -> dict:
+        """
+        Application data of the connection, e.g. State['User'] set by a login handler. Created on first access, idle
+        connections do not carry it. Kept when a resumed session moves to a new connection
+        """
+        if self._state is None:
+            self._state = {}
+        return self._state
+
+    @State.setter
+    def State(self, value: dict):
+        self._state = value
 
     async def process_messages_async(self):
         """
@@ -26,14 +114,51 @@ class WebsocketAppClient(object):
 
         :return: Void
         """
-        while True:
-            try:
-                message = await self.Websocket.recv()
-                await self.handle_message_async(message)
-            except WebSocketException:
-                self.Closed = True
-                await self.on_connection_closed_async()
-                break
+        try:
+            while True:
+                try:
+                    while True:
+                        message = await self.Websocket.recv()
+                        await self.handle_message_async(message)
+                except (WebSocketException, WebsocketAppConnectionClosedException):
+                    pass
+                except WebsocketAppProtocolException as e:
+                    # A session resumed after a protocol error would replay the same frames, the client closes instead
+                    logger.warning('Closing connection on protocol error: %s', e)
+                    await self.Websocket.close(1002, 'Protocol error')
+                    break
+                if not await self.reconnect_async():
+                    break
+        finally:
+            self.Closed = True
+            if self.SendQueue is not None:
+                self.SendQueue.close()
+            # The streams and tasks of a server side session waiting to be resumed keep sending to the session
+            if self.Session is None or self.Session.Owner is not self:
+                self.cancel_tasks()
+            self.Metrics.remove_connection(self)
+            self.fail_pending_requests(WebsocketAppConnectionClosedException('Connection closed'))
+
+        await self.on_connection_closed_async()
+
+    def fail_pending_requests(self, exception: Exception):
+        """
+        Fails all the execute_async calls waiting for a response, and the streams waiting for messages
+
+        :param exception: Exception raised by the waiting calls
+        :return: Void
+        """
+        for receiver in list((self.StreamReceivers or {}).values()):
+            receiver.put(exception)
+
+        if not self.CorIdMessageMap:
+            return
+
+        pending = list(self.CorIdMessageMap.values())
+        self.CorIdMessageMap.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(exception)
 
     async def on_connection_closed_async(self):
         """
@@ -43,17 +168,261 @@ class WebsocketAppClient(object):
         """
         pass
 
-    async def connect_async(self, url: str):
+    async def on_reconnected_async(self, resumed: bool):
+        """
+        Override for handling the reconnection of a client created with ReconnectOptions
+
+        :param resumed: True if the session was resumed. Otherwise the pending requests and streams were failed, and
+        the state held by the server for the previous connection (e.g. topic subscriptions) is lost
+        :return: Void
+        """
+        pass
+
+    async def reconnect_async(self) -> bool:
+        """
+        Reconnects a client created with ReconnectOptions after its connection is lost, waiting a jittered exponential
+        backoff delay before every attempt. Messages sent meanwhile are kept in the session replay buffer
+
+        :return: False if the client closes instead: it has no ReconnectOptions, disconnect was called or all the
+        attempts failed
+        """
+        options = self.ReconnectOptions
+        if options is None or self.Url is None:
+            return False
+
+        if self.Session is None:
+            self.reset_session()
+        else:
+            self.Session.Client = None
+            self.Session.Receiver = None
+        if self.SendQueue is not None:
+            self.SendQueue.close()
+
+        attempt = 0
+        while True:
+            if options.MaxAttempts is not None and attempt >= options.MaxAttempts:
+                logger.error('Could not reconnect to %s after %d attempts', self.Url, attempt)
+                return False
+            await asyncio.sleep(options.get_delay(attempt))
+            attempt += 1
+            if self.ReconnectOptions is None:
+                return False
+
+            try:
+                resumed = await self.open_connection_async()
+            except (OSError, WebSocketException, WebsocketAppException, asyncio.TimeoutError) as e:
+                logger.warning('Reconnect to %s failed: %s', self.Url, e)
+                continue
+
+            logger.info('Reconnected to %s, session %s', self.Url, 'resumed' if resumed else 'not resumed')
+            await self.on_reconnected_async(resumed)
+            return True
+
+    def reset_session(self):
+        """
+        Fails the pending requests and streams, when the connection is lost without a session to resume
+
+        :return: Void
+        """
+        self.fail_pending_requests(WebsocketAppConnectionClosedException('Connection lost'))
+        self.cancel_tasks()
+
+    def cancel_tasks(self):
+        """
+        Cancels the dispatched handlers, stream senders and background tasks of the connection
+
+        :return: Void
+        """
+        if self.Dispatcher is not None:
+            self.Dispatcher.cancel()
+        for sender in list((self.StreamSenders or {}).values()):
+            sender.Task.cancel()
+        for task in list(self.BackgroundTasks or ()):
+            task.cancel()
+
+    def create_background_task(self, coro) -> asyncio.Task:
+        """
+        Starts a task for work outliving a message handler, e.g. completing an order after responding to it.
+        Prefer this to asyncio.create_task in message handlers: the task is cancelled when the connection is closed,
+        and is bounded by the admission control of the server, see AdmissionOptions
+
+        :param coro: Coroutine to run
+        :return: asyncio.Task object
+        """
+        if self.BackgroundTasks is None:
+            self.BackgroundTasks = set()
+        task = asyncio.create_task(coro)
+        self.BackgroundTasks.add(task)
+        task.add_done_callback(self.BackgroundTasks.discard)
+        if self.Router.Admission is not None:
+            self.Router.Admission.track_task(task)
+        return task
+
+    async def connect_async(self, url: str, codecs=DEFAULT_CODECS):
         """
         Connect to a websocket app server
 
         :param url: Url of the websocket app server to connect
+        :param codecs: Codec names offered to the server, in the order of preference.
+        Servers that do not negotiate a codec are talked to with the jsonpickle compatibility codec
+        Pass BINARY_CODECS to prefer the binary wire format
         :return: Void
         """
+        check_codecs(codecs)
         self.Url = url
-        self.Websocket = await websockets.connect(self.Url)
+        self.Codecs = codecs
+        await self.open_connection_async()
+        self.Metrics.add_connection(self)
         self.ProcessMessageTask = asyncio.create_task(self.process_messages_async())
 
+    async def open_connection_async(self) -> bool:
+        """
+        Opens the websocket to the server, then for a client created with ReconnectOptions, opens or resumes its
+        session
+
+        :return: True if the session was resumed
+        :raises WebsocketAppTimeoutException: No session handshake response within the handshake timeout
+        """
+        self.Websocket = await websockets.connect(self.Url, **self.get_connect_options())
+        self.set_codec(self.Websocket.subprotocol)
+        self.SendQueue = None
+        if self.ReconnectOptions is None:
+            return False
+
+        timeout = self.ReconnectOptions.HandshakeTimeout
+        try:
+            return await asyncio.wait_for(self.open_session_async(), timeout)
+        except asyncio.TimeoutError:
+            await self.Websocket.close(1000, 'Session handshake timeout')
+            raise WebsocketAppTimeoutException('No session handshake response within ' + str(timeout) +
+                                               ' seconds') from None
+
+    def get_connect_options(self) -> dict:
+        """
+        Returns the keyword arguments of websockets.connect, besides the url
+
+        :return: Dictionary of options
+        """
+        options = {'subprotocols': list(self.Codecs) or None}
+        if self.Transport is not None:
+            options.update(self.Transport.get_websocket_options(self.Metrics, False))
+        return options
+
+    def set_codec(self, subprotocol):
+        """
+        Creates the codec of the connection, negotiated through the websocket subprotocol
+
+        :param subprotocol: Subprotocol selected by the server, None if none was
+        :return: Void
+        """
+        self.Codec = get_codec(subprotocol)
+        if self.PayloadCompression is not None and self.Codec.SupportsCompression:
+            self.Codec.Compression = self.PayloadCompression
+
+    async def open_session_async(self) -> bool:
+        """
+        Sends the session handshake request, with the id of the session to resume and the number of session messages
+        received, and handles the messages received until its response
+
+        :return: True if the session was resumed
+        """
+        session = self.Session
+        request = WebsocketAppMessage(SessionMessageName, WebsocketAppMessageType.Request, self.next_cor_id(), None,
+                                      None, {'SessionId': None if session is None else session.SessionId,
+                                             'Received': 0 if session is None else session.Received})
+        future = asyncio.get_running_loop().create_future()
+        if self.CorIdMessageMap is None:
+            self.CorIdMessageMap = {}
+        self.CorIdMessageMap[request.CorId] = future
+        try:
+            await self.write_frame_async(self.Codec.encode(request))
+            # The read loop is not running yet, the response is read here
+            while not future.done():
+                await self.handle_message_async(await self.Websocket.recv())
+        finally:
+            self.CorIdMessageMap.pop(request.CorId, None)
+        return future.result()
+
+    async def handle_session_message_async(self, msg: WebsocketAppMessage) -> bool:
+        """
+        Handles the session control messages: acknowledgements, and the response to the session handshake, which
+        opens or resumes the session, replaying the messages the server did not receive
+
+        :param msg: Decoded WebsocketAppMessage object with a session control message name
+        :return: False if the message is not handled as a session control message
+        """
+        if msg.Name == SessionAckMessageName:
+            if self.Session is not None and isinstance(msg.Data, int):
+                self.Session.acknowledge(msg.Data)
+            return True
+
+        if msg.MessageType != WebsocketAppMessageType.Response:
+            return False
+        future = self.CorIdMessageMap.pop(msg.CorId, None) if self.CorIdMessageMap else None
+        if future is None:
+            return True
+
+        data = msg.Data if isinstance(msg.Data, dict) else {}
+        session_id = data.get('SessionId')
+        session = self.Session
+        resumed = bool(data.get('Resumed')) and session is not None and session.SessionId == session_id
+        if not resumed and session is not None:
+            logger.warning('Session %s to %s could not be resumed', session.SessionId, self.Url)
+            self.reset_session()
+
+        if session_id is None:
+            # The server does not support sessions
+            self.Session = None
+        elif resumed:
+            received = data.get('Received', 0)
+            if not session.can_replay(received):
+                logger.warning('Session %s replay buffer overflowed, %d messages were lost', session_id,
+                               session.Sent - len(session.Replay) - received)
+            session.Receiver = self
+            await self.replay_session_async(session, received)
+        else:
+            self.Session = WebsocketAppSession(session_id, self.ReconnectOptions.ReplayBuffer,
+                                               self.ReconnectOptions.AckInterval)
+            self.Session.Receiver = self
+            self.Session.Client = self
+
+        if not future.done():
+            future.set_result(resumed)
+        return True
+
+    async def replay_session_async(self, session: WebsocketAppSession, received: int):
+        """
+        Writes the session messages the other party did not receive on this connection, including the ones sent while
+        replaying, then makes it the connection of the session
+
+        :param session: WebsocketAppSession object
+        :param received: Number of session messages received by the other party
+        :return: Void
+        """
+        while True:
+            sent = session.Sent
+            entries = session.get_replay(received)
+            if not entries:
+                break
+            for entry in entries:
+                await self.write_frame_async(self.Codec.encode(entry) if isinstance(entry, WebsocketAppMessage)
+                                             else entry)
+            received = sent
+        session.Client = self
+
+    async def send_session_ack_async(self, received: int):
+        """
+        Acknowledges the session messages received, so the other party drops them from its replay buffer
+
+        :param received: Number of session messages received
+        :return: Void
+        """
+        try:
+            await self.write_frame_async(self.Codec.encode(WebsocketAppMessage(
+                SessionAckMessageName, WebsocketAppMessageType.Oneway, None, None, None, received)))
+        except WebSocketException:
+            pass
+
     async def attach_async(self, websocket):
         """
         Attach the underlying remote client socket to the connection.
@@ -63,10 +432,13 @@ class WebsocketAppClient(object):
         :return: Void
         """
         self.Websocket = websocket
+        self.set_codec(websocket.subprotocol)
+        self.Metrics.add_connection(self)
         await self.process_messages_async()
 
     async def execute_async(self,
-                            websocket_message: WebsocketAppMessage) -> \
+                            websocket_message: WebsocketAppMessage,
+                            timeout: float = None) -> \
             WebsocketAppMessage:
         """
         Sends a request websocket app message to the remote party and waits for and returns the response message.
@@ -75,52 +447,320 @@ class WebsocketAppClient(object):
         This method waits until the other party responds with a response message to the request.
         This method handles the correlation between the request and the response message and also throw an exception,
         if other party responds with an error message.
+        The pending request is removed when the call times out, is cancelled or the connection is closed.
 
         :param websocket_message: WebsocketAppMessage object that will be sent as request message
+        :param timeout: Timeout in seconds, RequestTimeout of the client by default
         :return: Response WebsocketAppMessage object
+        :raises WebsocketAppRemoteException: The other party responded with an error message
+        :raises WebsocketAppOverloadedException: The other party refused the request, to be retried later
+        :raises WebsocketAppTimeoutException: No response within the timeout
+        :raises WebsocketAppConnectionClosedException: The connection is closed before the response
         """
-        async_waiter = AsyncWaiter()
-        self.CorIdMessageMap[websocket_message.CorId] = async_waiter
-        await self.Websocket.send(jsonpickle.encode(websocket_message, False))
-        await async_waiter.WaiterEvent.wait()
+        if self.Closed:
+            raise WebsocketAppConnectionClosedException('Connection closed')
+
+        if timeout is None:
+            timeout = self.RequestTimeout
 
-        if async_waiter.Message.MessageType == WebsocketAppMessageType.ErrorResponse:
-            raise Exception(async_waiter.Message.Error)
+        start = time.perf_counter_ns()
+        cor_id = websocket_message.CorId
+        future = asyncio.get_running_loop().create_future()
+        if self.CorIdMessageMap is None:
+            self.CorIdMessageMap = {}
+        self.CorIdMessageMap[cor_id] = future
+        try:
+            await self.send_async(websocket_message)
+            if timeout is None:
+                response = await future
+            else:
+                response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise WebsocketAppTimeoutException('No response to ' + str(websocket_message.Name) + ' within ' +
+                                               str(timeout) + ' seconds') from None
+        finally:
+            self.CorIdMessageMap.pop(cor_id, None)
+
+        metrics = self.Metrics.get_message_metrics(websocket_message.Name)
+        metrics.RoundTrip.record(time.perf_counter_ns() - start)
 
-        return async_waiter.Message
+        if response.MessageType == WebsocketAppMessageType.ErrorResponse:
+            metrics.Errors += 1
+            raise get_remote_exception(response)
+
+        return response
 
     async def handle_message_async(self, message):
         """
         This method reads Websocket app messages and hand over them to user supplied message handlers for processing
 
-        :param message: WebsocketAppMessage object in a JSON string format
+        :param message: WebsocketAppMessage object in the wire format of the connection codec
         :return: Void
         """
-        print('Client Side: ' + message)
+        self.FrameLogger.log_frame('Recv', message)
+
+        if self.Codec.SupportsBatch and self.Codec.is_batch(message):
+            await self.handle_batch_async(message)
+            return
 
-        msg_dict = jsonpickle.decode(message)
-        msg = WebsocketAppMessage(**msg_dict)
+        start = time.perf_counter_ns()
+        msg = self.Codec.decode(message)
+        metrics = self.Metrics.get_message_metrics(msg.Name)
+        metrics.Decode.record(time.perf_counter_ns() - start)
+        metrics.Received += 1
+        metrics.BytesIn += len(message)
+        self.MessagesIn += 1
 
-        if msg.Name in self.MessageHandlerMap:
-            handler = self.MessageHandlerMap[msg.Name]
+        await self.route_message_async(msg)
+
+    async def handle_batch_async(self, message):
+        """
+        Handles a batch frame, see SendQueueOptions. The messages are routed in the order they were sent, and the
+        decode time and frame size are split evenly between them in the metrics
+
+        :param message: Batch frame in the wire format of the connection codec
+        :return: Void
+        """
+        start = time.perf_counter_ns()
+        msgs = self.Codec.decode_batch(message)
+        if not msgs:
+            return
+        decode_time = (time.perf_counter_ns() - start) // len(msgs)
+        size = len(message) // len(msgs)
+        for msg in msgs:
+            metrics = self.Metrics.get_message_metrics(msg.Name)
+            metrics.Decode.record(decode_time)
+            metrics.Received += 1
+            metrics.BytesIn += size
+        self.MessagesIn += len(msgs)
+
+        for msg in msgs:
+            await self.route_message_async(msg)
+
+    async def route_message_async(self, msg: WebsocketAppMessage):
+        """
+        Resolves responses to pending execute_async calls on the read loop, and hands over the other messages to
+        the message handlers, either inline or through the concurrent dispatcher
+
+        :param msg: Decoded WebsocketAppMessage object
+        :return: Void
+        """
+        if msg.Name in SessionMessageNames and await self.handle_session_message_async(msg):
+            return
+        session = self.Session
+        if session is not None and session.Receiver is self and session.record_received():
+            asyncio.create_task(self.send_session_ack_async(session.Received))
+
+        if self.CorIdMessageMap and (msg.MessageType == WebsocketAppMessageType.Response or
+                                     msg.MessageType == WebsocketAppMessageType.ErrorResponse):
+            future = self.CorIdMessageMap.pop(msg.CorId, None)
+            if future is not None:
+                if not future.done():
+                    future.set_result(msg)
+                return
+
+        if msg.MessageType in self.StreamMessageTypes and self.route_stream_message(msg):
+            return
+
+        route = self.Router.get_route(msg.Name)
+        # Admission control runs first, refused messages are neither decoded nor dispatched
+        admission = self.Router.Admission
+        if admission is not None:
+            refusal = admission.admit(self, route)
+            if refusal is not None:
+                await admission.reject_async(self, msg, *refusal)
+                return
+
+        if route is None:
+            await self.handle_unrouted_message_async(msg)
+            return
+
+        # Handlers run by an executor decode their payload in the pool
+        if route.PayloadType is not None and route.Executor is None:
+            msg.Data = decode_payload(msg.Data, route.PayloadType)
+
+        # Stream requests only start their stream sender task
+        if self.MaxConcurrency is None or msg.MessageType == WebsocketAppMessageType.StreamRequest:
+            if admission is None:
+                await self.dispatch_message_async(msg, route)
+                return
+            admission.InFlight += 1
+            try:
+                await self.dispatch_message_async(msg, route)
+            finally:
+                admission.InFlight -= 1
         else:
-            handler = None
+            if self.Dispatcher is None:
+                self.Dispatcher = ConcurrentDispatcher(self.MaxConcurrency)
+            order_key = self.get_message_order_key(msg, route)
+            task = self.Dispatcher.dispatch(self.dispatch_message_async, msg, route,
+                                            None if order_key is None else (msg.Name, order_key))
+            if task is None:
+                # Refused rather than waited for, the read loop keeps resolving the responses to the execute_async
+                # calls of the running handlers
+                self.Metrics.get_message_metrics(msg.Name).Rejected += 1
+                if msg.MessageType == WebsocketAppMessageType.Request:
+                    await self.send_error_response_async(msg, 'Too many requests in progress',
+                                                         ConcurrentDispatcher.RetryAfter)
+            elif admission is not None:
+                admission.track_task(task)
+
+    async def handle_unrouted_message_async(self, msg: WebsocketAppMessage):
+        """
+        Handles a message without handler, without decoding its payload or running the middlewares: requests get an
+        empty response, stream requests an empty stream, and the other messages are dropped
+
+        :param msg: Decoded WebsocketAppMessage object
+        :return: Void
+        """
+        if msg.MessageType == WebsocketAppMessageType.Request:
+            msg.MessageType = WebsocketAppMessageType.Response
+            msg.JsonData = ""
+            await self.send_async(msg)
+        elif msg.MessageType == WebsocketAppMessageType.StreamRequest:
+            await self.send_async(WebsocketAppMessage(
+                msg.Name, WebsocketAppMessageType.StreamEnd, msg.CorId, None, None, None))
+
+    StreamMessageTypes = frozenset((WebsocketAppMessageType.StreamData, WebsocketAppMessageType.StreamEnd,
+                                    WebsocketAppMessageType.StreamCredit, WebsocketAppMessageType.ErrorResponse))
+
+    def route_stream_message(self, msg: WebsocketAppMessage) -> bool:
+        """
+        Hands over the messages of a stream to its receiver (requester side) or its sender (responder side)
+
+        :param msg: Decoded WebsocketAppMessage object with a stream message type, or an ErrorResponse
+        :return: False if the message is an ErrorResponse that is not for a stream
+        """
+        if msg.MessageType == WebsocketAppMessageType.StreamCredit:
+            sender = self.StreamSenders.get(msg.CorId) if self.StreamSenders else None
+            if sender is not None:
+                sender.add_credit(msg.Data)
+            return True
+
+        receiver = self.StreamReceivers.get(msg.CorId) if self.StreamReceivers else None
+        if receiver is None:
+            # Messages of finished or cancelled streams are discarded
+            return msg.MessageType != WebsocketAppMessageType.ErrorResponse
+        receiver.put(msg)
+        return True
+
+    def start_stream(self, msg: WebsocketAppMessage, handler):
+        """
+        Starts the stream handler of a StreamRequest message in its own task
+
+        :param msg: Decoded StreamRequest WebsocketAppMessage object
+        :param handler: Stream handler, an async generator function/method
+        :return: Void
+        """
+        if self.StreamSenders is None:
+            self.StreamSenders = {}
+        sender = StreamSender(self, msg)
+        self.StreamSenders[msg.CorId] = sender
+        sender.Task = asyncio.create_task(sender.run_async(handler))
+        if self.Router.Admission is not None:
+            self.Router.Admission.track_task(sender.Task)
+
+    def invoke_stream_handler(self, handler, msg: WebsocketAppMessage):
+        """
+        Invokes a stream handler
 
-        if handler is None:
+        :param handler: Stream handler, an async generator function/method
+        :param msg: Decoded StreamRequest WebsocketAppMessage object
+        :return: Async iterator of the chunks to send
+        """
+        return handler(msg)
+
+    async def dispatch_message_async(self, msg: WebsocketAppMessage, route: MessageRoute):
+        """
+        Hands over a message to the pipeline of its route: its middlewares, then its message handler.
+        Exceptions of the pipeline are logged and do not close the connection, whether the message is handled on the
+        read loop or by the concurrent dispatcher; requests get an error response with the exception message
+
+        :param msg: Decoded WebsocketAppMessage object
+        :param route: MessageRoute object of the message
+        :return: Void
+        """
+        start = time.perf_counter_ns()
+        try:
+            await route.Pipeline(self, msg)
+        except Exception as e:
+            logger.exception('Message handler failed for %s', msg.Name)
+            self.Metrics.get_message_metrics(msg.Name).Errors += 1
             if msg.MessageType == WebsocketAppMessageType.Request:
-                msg.MessageType = WebsocketAppMessageType.Response
-                msg.JsonData = ""
-                await self.Websocket.send(jsonpickle.encode(msg, False))
-            else:
-                if msg.MessageType == WebsocketAppMessageType.Response or \
-                        msg.MessageType == WebsocketAppMessageType.ErrorResponse:
-                    if msg.CorId in self.CorIdMessageMap:
-                        async_waiter = self.CorIdMessageMap[msg.CorId]
-                        async_waiter.Message = msg
-                        del self.CorIdMessageMap[msg.CorId]
-                        async_waiter.WaiterEvent.set()
-        else:
-            await handler(msg)
+                try:
+                    await self.send_error_response_async(msg, str(e))
+                except (WebSocketException, WebsocketAppConnectionClosedException):
+                    pass
+        finally:
+            self.Metrics.get_message_metrics(msg.Name).Handler.record(time.perf_counter_ns() - start)
+
+    def get_message_handler(self, name):
+        """
+        Returns the message handler of a message name
+
+        :param name: Message name string
+        :return: Handler function/method, or None
+        """
+        route = self.Router.get_route(name)
+        return None if route is None else route.Handler
+
+    def get_message_order_key(self, msg: WebsocketAppMessage, route: MessageRoute):
+        """
+        Returns the order key of a message, for handlers registered with an order key
+
+        :param msg: Decoded WebsocketAppMessage object
+        :param route: MessageRoute object of the message
+        :return: Order key, or None if the message can be handled concurrently with any other message
+        """
+        order_key = route.OrderKey
+        if order_key is None:
+            return None
+        return order_key(msg) if callable(order_key) else order_key
+
+    async def invoke_message_handler_async(self, handler, msg: WebsocketAppMessage):
+        """
+        Invokes a message handler
+
+        :param handler: Handler function/method
+        :param msg: Decoded WebsocketAppMessage object
+        :return: Void
+        """
+        await handler(msg)
+
+    async def invoke_executor_handler_async(self, executor: HandlerExecutor, handler, msg: WebsocketAppMessage,
+                                            payload_type=None):
+        """
+        Invokes a message handler registered with an executor. The handler takes the decoded payload, and for
+        requests its return value is sent as the response, or the exception it raised as an error response
+
+        :param executor: HandlerExecutor object
+        :param handler: Handler function
+        :param msg: Decoded WebsocketAppMessage object, with its payload not yet decoded into the payload type
+        :param payload_type: Optional payload type the handler takes
+        :return: Void
+        """
+        try:
+            result = await executor.run_async(handler, payload_type, msg)
+        except Exception as e:
+            if msg.MessageType != WebsocketAppMessageType.Request:
+                raise
+            logger.exception('Message handler failed for %s', msg.Name)
+            self.Metrics.get_message_metrics(msg.Name).Errors += 1
+            await self.send_error_response_async(msg, str(e))
+            return
+
+        if msg.MessageType == WebsocketAppMessageType.Request:
+            await self.send_response_obj_async(msg, result)
+
+    def next_cor_id(self) -> int:
+        """
+        Returns a new correlation id for an outgoing message
+
+        :return: Integer correlation id
+        """
+        if self.CorIdCounter is None:
+            self.CorIdCounter = itertools.count(1)
+        return next(self.CorIdCounter)
 
     async def send_async(self, websocket_message: WebsocketAppMessage):
         """
@@ -130,8 +770,209 @@ class WebsocketAppClient(object):
 
         :param websocket_message: WebsocketAppMessage
         :return: Void
+        :raises WebsocketAppConnectionClosedException: The connection is closed, without a session replaying the
+        message when it is resumed
+        """
+        session = self.Session
+        if session is not None and session.Client is not self:
+            # A connection replaced by a resumed session, or a session waiting to be resumed
+            await session.send_async(websocket_message)
+            return
+
+        send_queue = self.get_send_queue()
+        if send_queue is not None and not await send_queue.wait_writable_async():
+            self.Metrics.get_message_metrics(websocket_message.Name).Dropped += 1
+            return
+
+        start = time.perf_counter_ns()
+        frame = self.Codec.encode(websocket_message)
+        metrics = self.Metrics.get_message_metrics(websocket_message.Name)
+        metrics.Encode.record(time.perf_counter_ns() - start)
+        metrics.Sent += 1
+        metrics.BytesOut += len(frame)
+
+        self.MessagesOut += 1
+        if session is not None:
+            session.record_sent(websocket_message)
+        if send_queue is not None:
+            # Queued without awaiting after encode, so frames are written in the order they are encoded
+            send_queue.put(frame)
+        else:
+            await self.write_message_frame_async(frame, session is not None)
+
+    async def send_batch_async(self, websocket_messages):
+        """
+        Sends websocket app messages to the remote party in one batch frame, or in one frame each if the codec of the
+        connection does not support batch frames
+
+        :param websocket_messages: List of WebsocketAppMessage objects
+        :return: Void
+        :raises WebsocketAppConnectionClosedException: The connection is closed, without a session replaying the
+        message when it is resumed
+        """
+        session = self.Session
+        if session is not None and session.Client is not self:
+            for websocket_message in websocket_messages:
+                await session.send_async(websocket_message)
+            return
+
+        send_queue = self.get_send_queue()
+        if send_queue is not None and not await send_queue.wait_writable_async():
+            for websocket_message in websocket_messages:
+                self.Metrics.get_message_metrics(websocket_message.Name).Dropped += 1
+            return
+
+        frames = []
+        for websocket_message in websocket_messages:
+            start = time.perf_counter_ns()
+            frame = self.Codec.encode(websocket_message)
+            metrics = self.Metrics.get_message_metrics(websocket_message.Name)
+            metrics.Encode.record(time.perf_counter_ns() - start)
+            metrics.Sent += 1
+            metrics.BytesOut += len(frame)
+            frames.append(frame)
+            if session is not None:
+                session.record_sent(websocket_message)
+        self.MessagesOut += len(frames)
+
+        if self.Codec.SupportsBatch and len(frames) > 1:
+            batch_size = self.Codec.MaxBatchMessages or len(frames)
+            frames = [self.Codec.encode_batch(frames[i:i + batch_size]) for i in range(0, len(frames), batch_size)]
+
+        for frame in frames:
+            if send_queue is not None:
+                send_queue.put(frame)
+            else:
+                await self.write_message_frame_async(frame, session is not None)
+
+    async def send_frame_async(self, frame, msg_name=None):
+        """
+        Sends a frame, already encoded with encode_shared of the connection codec, to the remote party
+
+        :param frame: Frame data, str for text frames and bytes for binary frames
+        :param msg_name: Message name of the frame, for the metrics of messages dropped by the send queue
+        :return: Void
+        :raises WebsocketAppConnectionClosedException: The connection is closed, without a session replaying the
+        message when it is resumed
+        """
+        session = self.Session
+        if session is not None and session.Client is not self:
+            await session.send_frame_async(frame, msg_name)
+            return
+
+        send_queue = self.get_send_queue()
+        if send_queue is not None and not await send_queue.wait_writable_async():
+            if msg_name is not None:
+                self.Metrics.get_message_metrics(msg_name).Dropped += 1
+            return
+
+        self.MessagesOut += 1
+        if session is not None:
+            session.record_sent(frame)
+        if send_queue is not None:
+            send_queue.put(frame)
+        else:
+            await self.write_message_frame_async(frame, session is not None)
+
+    async def write_message_frame_async(self, frame, recorded: bool):
+        """
+        Writes the frame of a sent message on the websocket
+
+        :param frame: Frame data, str for text frames and bytes for binary frames
+        :param recorded: True if the session of the connection keeps the frame for replay. A write failing because
+        the connection is lost is then left to the replay, the frame is sent again when the session is resumed
+        :return: Void
+        :raises WebsocketAppConnectionClosedException: The connection is closed, and the frame is not kept for replay
+        """
+        try:
+            await self.write_frame_async(frame)
+        except ConnectionClosed:
+            if not recorded:
+                raise WebsocketAppConnectionClosedException('Connection closed') from None
+
+    async def write_frame_async(self, frame):
+        """
+        Writes a frame on the websocket
+
+        :param frame: Frame data, str for text frames and bytes for binary frames
+        :return: Void
+        """
+        self.FrameLogger.log_frame('Send', frame)
+        await self.Websocket.send(frame)
+
+    def get_send_queue(self):
         """
-        await self.Websocket.send(jsonpickle.encode(websocket_message, False))
+        Returns the send queue of the connection, creating it on first use
+
+        :return: SendQueue object, or None if the connection sends frames directly
+        """
+        if self.SendQueue is None and self.SendQueueOptions is not None:
+            self.SendQueue = SendQueue(self, self.SendQueueOptions)
+        return self.SendQueue
+
+    def put_frame(self, frame) -> bool:
+        """
+        Queues a frame, already encoded with encode_shared of the connection codec, without waiting for the
+        connection to drain, e.g. for a message published to many connections. A connection sending directly gets a
+        send queue with the default SendQueueOptions, so the frames it sends later stay in order behind this one
+
+        :param frame: Frame data, str for text frames and bytes for binary frames
+        :return: False if the frame was dropped, because the connection is closed or its send queue is above its
+        high watermark
+        """
+        session = self.Session
+        if session is not None and session.Client is not self:
+            if session.Client is None:
+                session.record_sent(frame)
+                return True
+            return session.Client.put_frame(frame)
+        if self.Closed:
+            return False
+
+        send_queue = self.get_send_queue()
+        if send_queue is None:
+            send_queue = self.SendQueue = SendQueue(self, SendQueueOptions())
+        if send_queue.Closed or send_queue.Bytes >= send_queue.Options.HighWatermark:
+            return False
+        self.MessagesOut += 1
+        if session is not None:
+            session.record_sent(frame)
+        send_queue.put(frame)
+        return True
+
+    def send_conflated(self, msg_name, obj, key) -> bool:
+        """
+        Queues a custom object as a one-way message that replaces any pending message with the same name and key.
+        Use it for high rate state updates, e.g. order status keyed by order Id or prices keyed by Symbol,
+        where a slow remote party only needs the latest value. Returns immediately, the message is sent
+        when the previously queued messages are sent
+
+        :param msg_name: Message name string
+        :param obj: Custom object to send to remote party
+        :param key: Conflation key, e.g. the order Id
+        :return: False if the message was dropped, because the connection is closed or too many keys are pending
+        """
+        if self.Closed and self.Session is None:
+            return False
+
+        websocket_message = WebsocketAppMessage(msg_name, WebsocketAppMessageType.Oneway, None, None, None, obj)
+        metrics = self.Metrics.get_message_metrics(msg_name)
+        start = time.perf_counter_ns()
+        frame = self.Codec.encode_shared(websocket_message)
+        metrics.Encode.record(time.perf_counter_ns() - start)
+        return self.put_conflated_frame((msg_name, key), frame)
+
+    def put_conflated_frame(self, key, frame) -> bool:
+        """
+        Queues an encoded frame in the conflation slot of a key
+
+        :param key: Conflation key, a tuple of the message name and the user supplied key
+        :param frame: Frame data encoded with encode_shared of the connection codec
+        :return: False if the frame was dropped
+        """
+        if self.Conflater is None:
+            self.Conflater = ConflatingSender(self, self.ConflationMaxKeys)
+        return self.Conflater.put(key, frame)
 
     async def send_obj_async(self, msg_name, obj):
         """
@@ -147,12 +988,14 @@ class WebsocketAppClient(object):
         await self.send_async(WebsocketAppMessage(
             msg_name,
             WebsocketAppMessageType.Oneway,
-            await self.CorIdCounter.increment_async(),
-            jsonpickle.encode(obj, False),
-            None
+            self.next_cor_id(),
+            None,
+            None,
+            obj
         ))
 
-    async def execute_obj_async(self, msg_name, obj) -> WebsocketAppMessage:
+    async def execute_obj_async(self, msg_name, obj, timeout: float = None,
+                                response_type=None) -> WebsocketAppMessage:
         """
         Sends a request object to the remote party along with message name and waits for and
         returns the response message.
@@ -164,15 +1007,190 @@ class WebsocketAppClient(object):
 
         :param msg_name: Message name string
         :param obj: Custom object to send to remote party
+        :param timeout: Timeout in seconds, RequestTimeout of the client by default
+        :param response_type: Optional payload type (see websocket_app_payload) the response Data is decoded into
         :return: Response WebsocketAppMessage object
         """
-        return await self.execute_async(WebsocketAppMessage(
+        response = await self.execute_async(WebsocketAppMessage(
             msg_name,
             WebsocketAppMessageType.Request,
-            await self.CorIdCounter.increment_async(),
-            jsonpickle.encode(obj, False),
-            None
-        ))
+            self.next_cor_id(),
+            None,
+            None,
+            obj
+        ), timeout)
+
+        if response_type is not None:
+            response.Data = decode_payload(response.Data, response_type)
+
+        return response
+
+    async def execute_many_async(self, msg_name, objs, timeout: float = None, response_type=None) -> list:
+        """
+        Sends many request objects with the same message name to the remote party in one batch frame, and waits
+        for and returns all the responses. See execute_many_iter_async
+
+        :param msg_name: Message name string
+        :param objs: List of custom objects to send as requests
+        :param timeout: Timeout in seconds for the whole batch, RequestTimeout of the client by default
+        :param response_type: Optional payload type (see websocket_app_payload) the response Data is decoded into
+        :return: List in the order of objs, of response WebsocketAppMessage objects, or WebsocketAppRemoteException
+        objects for the requests the other party responded to with an error message
+        :raises WebsocketAppTimeoutException: Not all the responses arrived within the timeout
+        :raises WebsocketAppConnectionClosedException: The connection is closed before all the responses arrived
+        """
+        results = [None] * len(objs)
+        async for index, result in self.execute_many_iter_async(msg_name, objs, timeout, response_type):
+            results[index] = result
+        return results
+
+    async def execute_many_iter_async(self, msg_name, objs, timeout: float = None, response_type=None):
+        """
+        Sends many request objects with the same message name to the remote party in one batch frame, and yields the
+        responses as they arrive. The remote party handles the requests like separately sent requests, concurrently
+        when it dispatches messages concurrently (see max_concurrency). Codecs without batch frames send the requests
+        one frame each.
+
+            async for index, result in client.execute_many_iter_async('place_order', requests):
+                ...
+
+        :param msg_name: Message name string
+        :param objs: List of custom objects to send as requests
+        :param timeout: Timeout in seconds for the whole batch, RequestTimeout of the client by default
+        :param response_type: Optional payload type (see websocket_app_payload) the response Data is decoded into
+        :return: Async iterator of (index in objs, result) tuples. The result is the response WebsocketAppMessage
+        object, or a WebsocketAppRemoteException object if the other party responded with an error message
+        :raises WebsocketAppTimeoutException: Not all the responses arrived within the timeout
+        :raises WebsocketAppConnectionClosedException: The connection is closed before all the responses arrived
+        """
+        if self.Closed:
+            raise WebsocketAppConnectionClosedException('Connection closed')
+
+        if timeout is None:
+            timeout = self.RequestTimeout
+
+        msgs = [WebsocketAppMessage(msg_name, WebsocketAppMessageType.Request, self.next_cor_id(), None, None, obj)
+                for obj in objs]
+        if not msgs:
+            return
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter_ns()
+        deadline = None if timeout is None else loop.time() + timeout
+        if self.CorIdMessageMap is None:
+            self.CorIdMessageMap = {}
+        indexes = {}
+        for index, msg in enumerate(msgs):
+            future = loop.create_future()
+            self.CorIdMessageMap[msg.CorId] = future
+            indexes[future] = index
+
+        metrics = self.Metrics.get_message_metrics(msg_name)
+        try:
+            await self.send_batch_async(msgs)
+            pending = set(indexes)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=None if deadline is None else max(deadline - loop.time(), 0),
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise WebsocketAppTimeoutException(str(len(pending)) + ' of ' + str(len(msgs)) + ' ' +
+                                                       str(msg_name) + ' requests without response within ' +
+                                                       str(timeout) + ' seconds')
+
+                for future in sorted(done, key=indexes.get):
+                    response = future.result()
+                    metrics.RoundTrip.record(time.perf_counter_ns() - start)
+                    if response.MessageType == WebsocketAppMessageType.ErrorResponse:
+                        metrics.Errors += 1
+                        yield indexes[future], get_remote_exception(response)
+                    else:
+                        if response_type is not None:
+                            response.Data = decode_payload(response.Data, response_type)
+                        yield indexes[future], response
+        finally:
+            for msg in msgs:
+                self.CorIdMessageMap.pop(msg.CorId, None)
+
+    async def stream_obj_async(self, msg_name, obj, credit: int = 16, timeout: float = None, response_type=None):
+        """
+        Sends a stream request object to the remote party along with a message name, and yields the messages
+        streamed back in response, e.g. order status changes or the rows of a large snapshot.
+        The remote party handles the request with a stream handler, an async generator yielding the chunks to send.
+        At most credit messages are sent ahead of the ones consumed here; more credit is granted as they are consumed.
+        Leaving the loop early cancels the stream on the remote party.
+
+            async for msg in client.stream_obj_async('order_updates', place_order_request):
+                ...
+
+        :param msg_name: Message name string
+        :param obj: Custom object to send as request
+        :param credit: Maximum number of messages in flight and queued, at least 1
+        :param timeout: Maximum time in seconds to wait for each message, RequestTimeout of the client by default
+        :param response_type: Optional payload type (see websocket_app_payload) the message Data is decoded into
+        :return: Async iterator of StreamData WebsocketAppMessage objects
+        :raises WebsocketAppRemoteException: The other party failed the stream with an error message
+        :raises WebsocketAppOverloadedException: The other party refused the stream request, to be retried later
+        :raises WebsocketAppTimeoutException: No message within the timeout
+        :raises WebsocketAppConnectionClosedException: The connection is closed before the stream ended
+        """
+        if self.Closed:
+            raise WebsocketAppConnectionClosedException('Connection closed')
+
+        if timeout is None:
+            timeout = self.RequestTimeout
+
+        start = time.perf_counter_ns()
+        request = WebsocketAppMessage(msg_name, WebsocketAppMessageType.StreamRequest, self.next_cor_id(), None, None,
+                                      obj)
+        receiver = StreamReceiver()
+        if self.StreamReceivers is None:
+            self.StreamReceivers = {}
+        self.StreamReceivers[request.CorId] = receiver
+        metrics = self.Metrics.get_message_metrics(msg_name)
+        ended = False
+        try:
+            await self.send_batch_async([request, WebsocketAppMessage(
+                msg_name, WebsocketAppMessageType.StreamCredit, request.CorId, None, None, credit)])
+
+            consumed = 0
+            while True:
+                try:
+                    msg = await receiver.get_async(timeout)
+                except asyncio.TimeoutError:
+                    raise WebsocketAppTimeoutException('No ' + str(msg_name) + ' stream message within ' +
+                                                       str(timeout) + ' seconds') from None
+
+                if isinstance(msg, Exception):
+                    ended = True
+                    raise msg
+                if msg.MessageType == WebsocketAppMessageType.StreamEnd:
+                    ended = True
+                    metrics.RoundTrip.record(time.perf_counter_ns() - start)
+                    return
+                if msg.MessageType == WebsocketAppMessageType.ErrorResponse:
+                    ended = True
+                    metrics.Errors += 1
+                    raise get_remote_exception(msg)
+
+                if response_type is not None:
+                    msg.Data = decode_payload(msg.Data, response_type)
+                yield msg
+
+                # Credit is granted in halves of the window, not per message
+                consumed += 1
+                if consumed * 2 >= credit:
+                    await self.send_async(WebsocketAppMessage(
+                        msg_name, WebsocketAppMessageType.StreamCredit, request.CorId, None, None, consumed))
+                    consumed = 0
+        finally:
+            self.StreamReceivers.pop(request.CorId, None)
+            if not ended and not self.Closed:
+                try:
+                    await self.send_async(WebsocketAppMessage(
+                        msg_name, WebsocketAppMessageType.StreamCredit, request.CorId, None, None, 0))
+                except (WebSocketException, WebsocketAppConnectionClosedException):
+                    pass
 
     async def send_response_obj_async(self, websocket_message, obj):
         """
@@ -189,11 +1207,13 @@ class WebsocketAppClient(object):
             websocket_message.Name,
             WebsocketAppMessageType.Response,
             websocket_message.CorId,
-            jsonpickle.encode(obj, False),
-            None
+            None,
+            None,
+            obj
         ))
 
-    async def send_error_response_async(self, websocket_message: WebsocketAppMessage, error_message):
+    async def send_error_response_async(self, websocket_message: WebsocketAppMessage, error_message,
+                                        retry_after: float = None):
         """
         Sends a error response websocket app message to the remote party.
         This is an awaitable method that takes in request message and a error message string as inputs,
@@ -202,31 +1222,96 @@ class WebsocketAppClient(object):
 
         :param websocket_message:  WebsocketAppMessage object of the request
         :param error_message: Error message string
+        :param retry_after: Optional number of seconds after which the request can be retried. The remote party then
+        raises WebsocketAppOverloadedException
         :return: Void
         """
         await self.send_async(WebsocketAppMessage(
             websocket_message.Name,
             WebsocketAppMessageType.ErrorResponse,
             websocket_message.CorId,
-            "",
-            error_message
+            "" if retry_after is None else None,
+            error_message,
+            None if retry_after is None else {'RetryAfter': retry_after}
         ))
 
-    def add_message_handler(self, name, handler):
+    def add_message_handler(self, name, handler, order_key=None, payload_type=None, executor=None):
         """
         Add a message handler method/function to a message name
 
-        :param name: Message name string
-        :param handler: Handler function/method to handle this message
+        :param name: Message name string, or name prefix ending with '*' (e.g. 'orders.*') to handle the messages
+        starting with the prefix and without a handler of their own
+        :param handler: Handler function/method to handle this message. Messages requested with stream_obj_async
+        are handled by a stream handler instead, an async generator function/method yielding the objects to stream
+        :param order_key: Used with concurrent dispatch. Messages of this name with equal order keys are handled
+        in order. Either a function taking the message and returning its key (e.g. the order symbol),
+        or a constant to handle all messages of this name in order
+        :param payload_type: Optional payload type (see websocket_app_payload). The message Data is decoded into this
+        type before the order key and the handler are called
+        :param executor: Optional HandlerExecutorType, or HandlerExecutor object, to run a CPU bound handler on a
+        thread or process pool instead of the event loop. Such a handler is a plain function taking the message
+        payload, decoded into payload_type in the pool, and returning the response object of requests.
+        Process pool handlers must be picklable, e.g. module level functions. Stream requests of such a handler are
+        refused with an error response
+        :return: Void
+        """
+        if executor is not None:
+            executor = get_handler_executor(executor)
+            self.Metrics.add_executor(executor)
+        self.Router.add_route(name, handler, order_key, payload_type, executor)
+
+    def add_middleware(self, middleware, names=None):
+        """
+        Add a middleware around the message handlers. The middleware chain of each handler is composed when the
+        handler or a middleware is added, not per message. See WebsocketAppRouter
+
+        :param middleware: Middleware factory, taking the next step of the pipeline and the MessageRoute of the
+        handler, and returning a coroutine function taking the connection and the message
+        :param names: Optional list of message names and name prefixes ending with '*' the middleware applies to,
+        all handlers by default
         :return: Void
         """
-        self.MessageHandlerMap[name] = handler
+        self.Router.add_middleware(middleware, names)
+
+    async def ping_async(self, timeout: float = None) -> float:
+        """
+        Sends a websocket ping to the remote party and waits for its pong
+
+        :param timeout: Timeout in seconds, None waits until the pong or the connection close
+        :return: Round trip time in seconds
+        :raises WebsocketAppTimeoutException: No pong within the timeout
+        :raises WebsocketAppConnectionClosedException: The connection is closed
+        """
+        if self.Closed:
+            raise WebsocketAppConnectionClosedException('Connection closed')
+
+        start = time.perf_counter()
+        try:
+            pong = await self.Websocket.ping()
+            await asyncio.wait_for(pong, timeout)
+        except asyncio.TimeoutError:
+            raise WebsocketAppTimeoutException('No pong within ' + str(timeout) + ' seconds') from None
+        except WebSocketException:
+            raise WebsocketAppConnectionClosedException('Connection closed') from None
+        return time.perf_counter() - start
 
     async def disconnect(self, reason: str):
         """
-        Disconnect the websocket connection
+        Disconnect the websocket connection. A reconnecting client stops reconnecting
 
         :param reason: Disconnect reason string
         :return:
         """
-        await self.Websocket.close(1000, reason)
+        self.ReconnectOptions = None
+        await self.close_connection_async(1000, reason)
+
+    async def close_connection_async(self, code: int, reason: str):
+        """
+        Closes the websocket connection only. A client created with ReconnectOptions then reconnects and resumes its
+        session, and the server keeps the session of the connection for the client to resume it
+
+        :param code: Websocket close code
+        :param reason: Close reason string
+        :return: Void
+        """
+        await self.Websocket.close(code, reason)
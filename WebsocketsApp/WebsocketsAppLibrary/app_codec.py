@@ -0,0 +1,564 @@
+import json
+import struct
+import time
+import zlib
+
+from .app_logging import *
+from .app_types import *
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def to_json_value(obj):
+    """
+    Default hook used by the JSON codecs for objects that are not natively JSON serializable
+    :param obj: Object to convert
+    :return: JSON serializable representation of the object
+    """
+    to_dict = getattr(obj, 'to_dict', None)
+    if to_dict is not None:
+        return to_dict()
+    if hasattr(obj, '__dict__'):
+        return obj.__dict__
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError('Object of type ' + type(obj).__name__ + ' is not JSON serializable')
+
+
+# Dictionary priming the payload compression with the tokens and field names frequent in small JSON payloads.
+# zlib favours the strings at the end of the dictionary, see build_zdict
+DEFAULT_ZDICT = (b'"Timestamp":"Quantity":"Price":"Symbol":"Status":"Type":"Side":"Name":"Data":"Error":'
+                 b'"Id":"id":"name":"type":"status":"value":null,true,false,0.0,[{"}],{"":":"","')
+
+
+def build_zdict(samples, max_size: int = 32768) -> bytes:
+    """
+    Builds a payload compression dictionary from sample payloads, e.g. typical response objects of the application,
+    so their field names and repeated values compress well even in small payloads. Both parties of a connection must
+    use the same dictionary, see TransportOptions
+
+    :param samples: List of sample payloads: bytes, str, or objects encoded as JSON. Put the most typical last
+    :param max_size: Maximum dictionary size in bytes, zlib uses at most 32KiB
+    :return: Dictionary bytes
+    """
+    parts = [DEFAULT_ZDICT]
+    for sample in samples:
+        if isinstance(sample, str):
+            sample = sample.encode()
+        elif not isinstance(sample, bytes):
+            sample = json.dumps(sample, separators=(',', ':'), default=to_json_value).encode()
+        parts.append(sample)
+    return b''.join(parts)[-max_size:]
+
+
+class PayloadCompression(object):
+    """
+    Size aware zlib compression of message payloads, with a preset dictionary. Payloads below the threshold, and
+    payloads that do not shrink, are sent uncompressed
+    """
+    def __init__(self, threshold: int = None, level: int = 6, zdict: bytes = DEFAULT_ZDICT, max_size: int = 2 ** 20,
+                 metrics=None):
+        """
+        Create a new PayloadCompression object
+        :param threshold: Minimum payload size in bytes to compress, None never compresses but still decompresses
+        :param level: zlib compression level, 1 (fastest) to 9 (smallest)
+        :param zdict: Preset dictionary, the same for both parties. None for no dictionary
+        :param max_size: Maximum decompressed payload size in bytes
+        :param metrics: Optional CompressionMetrics object
+        """
+        self.Threshold = threshold
+        self.Level = level
+        self.ZDict = zdict
+        self.MaxSize = max_size
+        self.Metrics = metrics
+
+    def compress(self, payload: bytes):
+        """
+        Compresses a payload if it is large enough
+
+        :param payload: Payload bytes
+        :return: Compressed bytes, or None to send the payload uncompressed
+        """
+        if self.Threshold is None:
+            return None
+        if len(payload) < self.Threshold:
+            if self.Metrics is not None:
+                self.Metrics.Skipped += 1
+            return None
+
+        start = time.perf_counter_ns()
+        if self.ZDict:
+            compressor = zlib.compressobj(self.Level, zdict=self.ZDict)
+        else:
+            compressor = zlib.compressobj(self.Level)
+        compressed = compressor.compress(payload) + compressor.flush()
+        if self.Metrics is not None:
+            self.Metrics.record_compress(len(payload), len(compressed), time.perf_counter_ns() - start)
+        return compressed if len(compressed) < len(payload) else None
+
+    def decompress(self, data) -> bytes:
+        """
+        Decompresses a compressed payload
+
+        :param data: Compressed bytes
+        :return: Payload bytes
+        :raises ValueError: The payload is larger than MaxSize
+        """
+        start = time.perf_counter_ns()
+        decompressor = zlib.decompressobj(zdict=self.ZDict) if self.ZDict else zlib.decompressobj()
+        payload = decompressor.decompress(data, self.MaxSize)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Compressed payload over the size limit of ' + str(self.MaxSize) + ' bytes')
+        if self.Metrics is not None:
+            self.Metrics.record_decompress(time.perf_counter_ns() - start)
+        return payload
+
+
+class WebsocketAppCodec(object):
+    """
+    Base class for the codecs used to encode and decode WebsocketAppMessage objects to and from websocket frames.
+    The codec of a connection is negotiated through the websocket subprotocol, using the codec Name.
+    """
+    Name = None
+    # Codecs supporting batch frames, several messages sent in one websocket frame
+    SupportsBatch = False
+    # Maximum number of messages in a batch frame, None for no limit
+    MaxBatchMessages = None
+    # Codecs compressing payloads with their Compression, a PayloadCompression object
+    SupportsCompression = False
+
+    @classmethod
+    def create(cls):
+        """
+        Creates the codec object used by a single connection. Stateless codecs share one object across connections
+
+        :return: WebsocketAppCodec object
+        """
+        return cls()
+
+    def encode(self, websocket_message: WebsocketAppMessage):
+        """
+        Encodes a websocket app message into a websocket frame
+
+        :param websocket_message: WebsocketAppMessage object
+        :return: Frame data, str for text frames and bytes for binary frames
+        """
+        raise NotImplementedError
+
+    def encode_shared(self, websocket_message: WebsocketAppMessage):
+        """
+        Encodes a websocket app message into a frame that can be sent on any connection using the same codec type,
+        e.g. for publishing a message to many connections
+
+        :param websocket_message: WebsocketAppMessage object
+        :return: Frame data, str for text frames and bytes for binary frames
+        """
+        return self.encode(websocket_message)
+
+    def decode(self, frame) -> WebsocketAppMessage:
+        """
+        Decodes a websocket frame into a websocket app message
+
+        :param frame: Frame data received from the websocket
+        :return: WebsocketAppMessage object
+        :raises WebsocketAppProtocolException: The frame is malformed
+        """
+        raise NotImplementedError
+
+    def encode_batch(self, frames):
+        """
+        Combines frames encoded by this codec into one batch frame. Only for codecs that SupportsBatch
+
+        :param frames: List of frames
+        :return: Batch frame data
+        """
+        raise NotImplementedError
+
+    def is_batch(self, frame) -> bool:
+        """
+        Tells whether a received frame is a batch frame
+
+        :param frame: Frame data received from the websocket
+        :return: True for batch frames
+        """
+        return False
+
+    def decode_batch(self, frame):
+        """
+        Decodes a batch frame into its websocket app messages. Batch frames nested in a batch frame, e.g. a request
+        batch combined with other frames by the send queue, are flattened
+
+        :param frame: Batch frame data received from the websocket
+        :return: List of WebsocketAppMessage objects
+        :raises WebsocketAppProtocolException: The frame is malformed
+        """
+        raise NotImplementedError
+
+
+class JsonPickleCodec(WebsocketAppCodec):
+    """
+    Compatibility codec for peers that do not negotiate a codec. The payload is encoded with jsonpickle into the
+    JsonData string, which is then encoded again as part of the message envelope.
+    """
+    Name = 'wsapp.jsonpickle'
+    Instance = None
+
+    @classmethod
+    def create(cls):
+        if cls.Instance is None:
+            cls.Instance = cls()
+        return cls.Instance
+
+    def encode(self, websocket_message: WebsocketAppMessage):
+        return json.dumps({
+            'Name': websocket_message.Name,
+            'MessageType': websocket_message.MessageType,
+            'CorId': websocket_message.CorId,
+            'JsonData': websocket_message.JsonData,
+            'Error': websocket_message.Error
+        }, default=to_json_value)
+
+    def decode(self, frame) -> WebsocketAppMessage:
+        try:
+            msg_dict = json.loads(frame)
+            return WebsocketAppMessage(
+                msg_dict.get('Name'),
+                msg_dict.get('MessageType'),
+                msg_dict.get('CorId'),
+                msg_dict.get('JsonData'),
+                msg_dict.get('Error')
+            )
+        except (ValueError, TypeError, AttributeError) as e:
+            raise WebsocketAppProtocolException('Invalid frame: ' + str(e)) from None
+
+
+class JsonCodec(WebsocketAppCodec):
+    """
+    Single pass JSON codec. The payload is embedded in the message envelope as a JSON value (the Data key), so the
+    whole message is encoded and decoded with one json call. Batch frames are JSON arrays of message envelopes.
+    """
+    Name = 'wsapp.json'
+    SupportsBatch = True
+    Instance = None
+
+    @classmethod
+    def create(cls):
+        if cls.Instance is None:
+            cls.Instance = cls()
+        return cls.Instance
+
+    def encode(self, websocket_message: WebsocketAppMessage):
+        return json.dumps({
+            'Name': websocket_message.Name,
+            'MessageType': websocket_message.MessageType,
+            'CorId': websocket_message.CorId,
+            'Data': websocket_message.Data,
+            'Error': websocket_message.Error
+        }, separators=(',', ':'), default=to_json_value)
+
+    def decode(self, frame) -> WebsocketAppMessage:
+        try:
+            return self.message_from_dict(json.loads(frame))
+        except (ValueError, TypeError, AttributeError) as e:
+            raise WebsocketAppProtocolException('Invalid frame: ' + str(e)) from None
+
+    @staticmethod
+    def message_from_dict(msg_dict) -> WebsocketAppMessage:
+        return WebsocketAppMessage(
+            msg_dict.get('Name'),
+            msg_dict.get('MessageType'),
+            msg_dict.get('CorId'),
+            None,
+            msg_dict.get('Error'),
+            msg_dict.get('Data')
+        )
+
+    def encode_batch(self, frames):
+        # Frames are JSON objects already, joining them into an array needs no encoding
+        return '[' + ','.join(frames) + ']'
+
+    def is_batch(self, frame) -> bool:
+        return frame[:1] == '['
+
+    def decode_batch(self, frame):
+        try:
+            return self.messages_from_list(json.loads(frame))
+        except (ValueError, TypeError, AttributeError) as e:
+            raise WebsocketAppProtocolException('Invalid batch frame: ' + str(e)) from None
+
+    def messages_from_list(self, msg_list):
+        messages = []
+        for msg_dict in msg_list:
+            if type(msg_dict) is list:
+                messages.extend(self.messages_from_list(msg_dict))
+            else:
+                messages.append(self.message_from_dict(msg_dict))
+        return messages
+
+
+class BinaryCodec(WebsocketAppCodec):
+    """
+    Binary codec, sent as binary websocket frames. Each frame starts with a compact header:
+    flags byte (message type code and presence bits), 64 bit correlation id and 16 bit message name id.
+    Message names are interned per connection; the name text is sent inline only the first time a name id is used.
+    The header is followed by the optional error text and the payload.
+    Payloads are compact JSON; see MsgPackCodec for MessagePack payloads.
+    Batch frames have their own header, the batch flag and the frame count, followed by the length prefixed
+    frames.
+    Payloads above the threshold of the codec Compression are zlib compressed, flagged in the header.
+    """
+    Name = 'wsapp.binary'
+    SupportsBatch = True
+    SupportsCompression = True
+    # Decompresses the payloads of peers, set per connection to compress payloads too, see TransportOptions
+    Compression = PayloadCompression()
+
+    Header = struct.Struct('!BQH')
+    Length16 = struct.Struct('!H')
+    Length32 = struct.Struct('!I')
+    BatchHeader = struct.Struct('!BH')
+
+    NameDefinitionFlag = 0x08
+    ErrorFlag = 0x10
+    BatchFlag = 0x20
+    CompressedFlag = 0x40
+    MessageTypeMask = 0x07
+    # Name id used for names sent inline once the intern table is full, the receiver does not store them
+    InlineNameId = 0xFFFF
+
+    MessageTypeCodes = {
+        WebsocketAppMessageType.Request: 0,
+        WebsocketAppMessageType.Response: 1,
+        WebsocketAppMessageType.Oneway: 2,
+        WebsocketAppMessageType.ErrorResponse: 3,
+        WebsocketAppMessageType.StreamRequest: 4,
+        WebsocketAppMessageType.StreamData: 5,
+        WebsocketAppMessageType.StreamEnd: 6,
+        WebsocketAppMessageType.StreamCredit: 7
+    }
+    MessageTypes = {code: message_type for message_type, code in MessageTypeCodes.items()}
+    MaxBatchMessages = 0xFFFF
+
+    def __init__(self):
+        self.NameIds = {}
+        self.Names = {}
+
+    def encode_payload(self, data) -> bytes:
+        """
+        Encodes the message payload into bytes
+
+        :param data: Payload object, not None
+        :return: Payload bytes
+        """
+        return json.dumps(data, separators=(',', ':'), default=to_json_value).encode()
+
+    def decode_payload(self, payload: bytes):
+        """
+        Decodes the message payload bytes
+
+        :param payload: Payload bytes, not empty
+        :return: Payload object
+        """
+        return json.loads(payload)
+
+    def encode(self, websocket_message: WebsocketAppMessage):
+        return self.encode_frame(websocket_message, True)
+
+    def encode_shared(self, websocket_message: WebsocketAppMessage):
+        # The name is always sent inline, as the interned name ids differ between connections
+        return self.encode_frame(websocket_message, False)
+
+    def encode_frame(self, websocket_message: WebsocketAppMessage, intern: bool):
+        """
+        Encodes a websocket app message into a binary frame
+
+        :param websocket_message: WebsocketAppMessage object
+        :param intern: Use and extend the interned names of the connection, otherwise send the name inline
+        :return: Frame bytes
+        """
+        flags = self.MessageTypeCodes[websocket_message.MessageType]
+        parts = []
+
+        name_id = self.NameIds.get(websocket_message.Name) if intern else None
+        if name_id is None:
+            flags |= self.NameDefinitionFlag
+            name = websocket_message.Name.encode()
+            parts.append(self.Length16.pack(len(name)))
+            parts.append(name)
+            if intern and len(self.NameIds) < self.InlineNameId:
+                name_id = len(self.NameIds)
+                self.NameIds[websocket_message.Name] = name_id
+            else:
+                name_id = self.InlineNameId
+
+        if websocket_message.Error is not None:
+            flags |= self.ErrorFlag
+            error = str(websocket_message.Error).encode()
+            parts.append(self.Length32.pack(len(error)))
+            parts.append(error)
+
+        data = websocket_message.Data
+        if data is not None:
+            payload = self.encode_payload(data)
+            compressed = self.Compression.compress(payload)
+            if compressed is not None:
+                flags |= self.CompressedFlag
+                payload = compressed
+            parts.append(payload)
+
+        return self.Header.pack(flags, websocket_message.CorId or 0, name_id) + b''.join(parts)
+
+    def read_field(self, frame, offset: int, length_struct: struct.Struct):
+        """
+        Reads a length prefixed field of a frame
+
+        :param frame: Frame bytes
+        :param offset: Offset of the length prefix
+        :param length_struct: Struct of the length prefix
+        :return: Field bytes, and the offset following the field
+        :raises WebsocketAppProtocolException: The frame ends before the field
+        """
+        start = offset + length_struct.size
+        if start > len(frame):
+            raise WebsocketAppProtocolException('Truncated frame')
+        length, = length_struct.unpack_from(frame, offset)
+        end = start + length
+        if end > len(frame):
+            raise WebsocketAppProtocolException('Truncated frame')
+        return frame[start:end], end
+
+    def decode(self, frame) -> WebsocketAppMessage:
+        if isinstance(frame, str) or len(frame) < self.Header.size:
+            raise WebsocketAppProtocolException('Invalid frame header')
+        flags, cor_id, name_id = self.Header.unpack_from(frame)
+        offset = self.Header.size
+
+        try:
+            if flags & self.NameDefinitionFlag:
+                name, offset = self.read_field(frame, offset, self.Length16)
+                name = name.decode()
+                if name_id != self.InlineNameId:
+                    self.Names[name_id] = name
+            else:
+                name = self.Names.get(name_id)
+                if name is None:
+                    raise WebsocketAppProtocolException('Unknown message name id ' + str(name_id))
+
+            error = None
+            if flags & self.ErrorFlag:
+                error, offset = self.read_field(frame, offset, self.Length32)
+                error = error.decode()
+
+            data = None
+            if offset < len(frame):
+                payload = frame[offset:]
+                if flags & self.CompressedFlag:
+                    payload = self.Compression.decompress(payload)
+                data = self.decode_payload(payload)
+        except WebsocketAppProtocolException:
+            raise
+        except Exception as e:
+            # Invalid text, compressed data or payload encoding
+            raise WebsocketAppProtocolException('Invalid frame: ' + str(e)) from None
+
+        return WebsocketAppMessage(
+            name,
+            self.MessageTypes[flags & self.MessageTypeMask],
+            cor_id or None,
+            None,
+            error,
+            data
+        )
+
+    def encode_batch(self, frames):
+        parts = [self.BatchHeader.pack(self.BatchFlag, len(frames))]
+        for frame in frames:
+            parts.append(self.Length32.pack(len(frame)))
+            parts.append(frame)
+        return b''.join(parts)
+
+    def is_batch(self, frame) -> bool:
+        # Text and empty frames are left to decode, which refuses them
+        return not isinstance(frame, str) and len(frame) > 0 and frame[0] & self.BatchFlag != 0
+
+    def decode_batch(self, frame):
+        if len(frame) < self.BatchHeader.size:
+            raise WebsocketAppProtocolException('Invalid batch frame header')
+        flags, count = self.BatchHeader.unpack_from(frame)
+        offset = self.BatchHeader.size
+        messages = []
+        for i in range(count):
+            inner_frame, offset = self.read_field(frame, offset, self.Length32)
+            if self.is_batch(inner_frame):
+                messages.extend(self.decode_batch(inner_frame))
+            else:
+                messages.append(self.decode(inner_frame))
+        return messages
+
+
+class MsgPackCodec(BinaryCodec):
+    """
+    Binary codec with MessagePack payloads. Available when the msgpack package is installed
+    """
+    Name = 'wsapp.msgpack'
+
+    def encode_payload(self, data) -> bytes:
+        return msgpack.packb(data, default=to_json_value)
+
+    def decode_payload(self, payload: bytes):
+        return msgpack.unpackb(payload)
+
+
+# Codecs available for negotiation, by websocket subprotocol name
+CODECS = {
+    JsonCodec.Name: JsonCodec,
+    JsonPickleCodec.Name: JsonPickleCodec,
+    BinaryCodec.Name: BinaryCodec
+}
+
+if msgpack is not None:
+    CODECS[MsgPackCodec.Name] = MsgPackCodec
+
+# Codecs offered by default, in the order of preference
+DEFAULT_CODECS = (JsonCodec.Name, JsonPickleCodec.Name)
+
+# Binary codecs first, falling back to the default codecs for peers without binary support
+BINARY_CODECS = tuple(name for name in (MsgPackCodec.Name, BinaryCodec.Name) if name in CODECS) + DEFAULT_CODECS
+
+# Set once the fallback of BINARY_CODECS to wsapp.binary is logged
+msgpack_fallback_logged = False
+
+
+def check_codecs(codecs):
+    """
+    Logs once that BINARY_CODECS does not offer the MessagePack codec, when the msgpack package is not installed
+    :param codecs: Codec names offered by a websocket app server or client
+    :return: Void
+    """
+    global msgpack_fallback_logged
+    if msgpack is None and not msgpack_fallback_logged and codecs == BINARY_CODECS:
+        msgpack_fallback_logged = True
+        logger.warning('msgpack is not installed, BINARY_CODECS falls back to %s. Install the msgpack extra '
+                       '(pip install WebsocketsAppLibrary[msgpack]) for %s', BinaryCodec.Name, MsgPackCodec.Name)
+
+
+def register_codec(codec_type):
+    """
+    Registers a codec type so it can be negotiated by websocket app servers and clients
+    :param codec_type: WebsocketAppCodec subclass with a unique Name
+    :return: Void
+    """
+    CODECS[codec_type.Name] = codec_type
+
+
+def get_codec(subprotocol) -> WebsocketAppCodec:
+    """
+    Returns the codec for the negotiated websocket subprotocol.
+    Peers that did not negotiate a subprotocol use the jsonpickle compatibility codec.
+    :param subprotocol: Negotiated subprotocol name or None
+    :return: WebsocketAppCodec object
+    """
+    return CODECS.get(subprotocol, JsonPickleCodec).create()
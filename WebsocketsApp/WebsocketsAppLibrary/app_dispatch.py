@@ -0,0 +1,89 @@
+from .app_logging import *
+from .app_types import *
+
+
+class ConcurrentDispatcher(object):
+    """
+    Runs the message handlers of a connection as tasks, so a slow handler does not stall the read loop of the
+    connection. At most max_concurrency handlers run at a time. Messages dispatched with the same order key
+    are handled one after the other, in the order they were received.
+    At most max_concurrency + max_pending handlers are dispatched at a time, running or waiting; messages beyond are
+    refused instead of waiting on the read loop, which keeps reading the responses the running handlers may wait for.
+    """
+    # Retry after hint in seconds of the requests refused when too many handlers are dispatched
+    RetryAfter = 0.1
+
+    def __init__(self, max_concurrency: int, max_pending: int = None):
+        """
+        Create a new ConcurrentDispatcher object
+        :param max_concurrency: Maximum number of handlers running at a time
+        :param max_pending: Maximum number of handlers waiting to run, max_concurrency by default
+        """
+        self.Semaphore = asyncio.BoundedSemaphore(max_concurrency)
+        self.MaxDispatched = max_concurrency + (max_concurrency if max_pending is None else max_pending)
+        self.Tasks = set()
+        self.OrderTails = {}
+
+    def dispatch(self, handle_async, msg: WebsocketAppMessage, route, order_key=None):
+        """
+        Schedules a message handler, unless too many handlers are dispatched
+
+        :param handle_async: Coroutine function handling the message, taking the message and its route.
+        It handles its own exceptions
+        :param msg: WebsocketAppMessage object to handle
+        :param route: MessageRoute object of the message, resolved on the read loop
+        :param order_key: Optional key; messages with the same key are handled in order
+        :return: Handler task, or None if the message is refused
+        """
+        if len(self.Tasks) >= self.MaxDispatched:
+            return None
+
+        previous = None
+        if order_key is not None:
+            previous = self.OrderTails.get(order_key)
+
+        task = asyncio.create_task(self.run_async(handle_async, msg, route, previous))
+        self.Tasks.add(task)
+        # Removed by a done callback, which also runs for tasks cancelled before they started
+        task.add_done_callback(self.Tasks.discard)
+
+        if order_key is not None:
+            self.OrderTails[order_key] = task
+            task.add_done_callback(lambda t: self.release_order_key(order_key, t))
+        return task
+
+    def release_order_key(self, order_key, task):
+        """
+        Removes the order key once its last scheduled handler completes
+
+        :param order_key: Order key of the completed handler
+        :param task: Completed handler task
+        :return: Void
+        """
+        if self.OrderTails.get(order_key) is task:
+            del self.OrderTails[order_key]
+
+    def cancel(self):
+        """
+        Cancels the dispatched handlers, when the connection is closed
+
+        :return: Void
+        """
+        for task in list(self.Tasks):
+            task.cancel()
+
+    async def run_async(self, handle_async, msg: WebsocketAppMessage, route, previous):
+        """
+        Runs a message handler after the previous handler with the same order key, within the concurrency limit
+
+        :param handle_async: Coroutine function handling the message, taking the message and its route
+        :param msg: WebsocketAppMessage object to handle
+        :param route: MessageRoute object of the message
+        :param previous: Task of the previous handler with the same order key, or None
+        :return: Void
+        """
+        if previous is not None:
+            await asyncio.wait((previous,))
+
+        async with self.Semaphore:
+            await handle_async(msg, route)
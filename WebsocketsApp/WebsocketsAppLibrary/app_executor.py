@@ -0,0 +1,143 @@
+import concurrent.futures
+import os
+
+from .app_types import *
+
+
+class HandlerExecutorType:
+    # Handlers run on a thread pool, for blocking calls and code releasing the GIL
+    Thread = 'thread'
+    # Handlers run on a process pool, for CPU bound python code
+    Process = 'process'
+
+
+def run_executor_handler(handler, payload_type, json_data, data):
+    """
+    Runs a handler in a pool worker: decodes the message payload, then calls the handler with it.
+    A module level function, so it can be sent to process pool workers
+
+    :param handler: Handler function taking the payload and returning the response object
+    :param payload_type: Optional payload type the payload is decoded into
+    :param json_data: JSON data of the message, decoded here if data is None
+    :param data: Payload object of the message
+    :return: Return value of the handler
+    """
+    if data is None and json_data:
+        data = jsonpickle.decode(json_data)
+    if payload_type is not None:
+        data = decode_payload(data, payload_type)
+    return handler(data)
+
+
+class HandlerExecutor(object):
+    """
+    Bounded thread or process pool running message handlers off the event loop.
+    At most max_workers handlers run at a time and max_queue more wait in the pool queue; further messages wait
+    for a free slot, which holds back the connections sending them instead of growing the queue.
+    """
+    def __init__(self, executor_type=HandlerExecutorType.Thread, max_workers: int = None, max_queue: int = None,
+                 name: str = None):
+        """
+        Create a new HandlerExecutor object
+        :param executor_type: HandlerExecutorType
+        :param max_workers: Number of worker threads or processes, the number of CPUs by default
+        :param max_queue: Number of handlers queued in the pool beyond the running ones, 4 * max_workers by default
+        :param name: Name of the executor in the metrics, executor_type by default
+        """
+        self.ExecutorType = executor_type
+        self.MaxWorkers = max_workers or os.cpu_count() or 1
+        self.MaxQueue = self.MaxWorkers * 4 if max_queue is None else max_queue
+        self.Name = name or executor_type
+        # The pool and the slots semaphore are created on first use, on the running event loop
+        self.Executor = None
+        self.Slots = None
+        self.Submitted = 0
+        self.Waiting = 0
+
+    def get_executor(self) -> concurrent.futures.Executor:
+        """
+        Returns the pool, creating it on first use
+
+        :return: ThreadPoolExecutor or ProcessPoolExecutor object
+        """
+        if self.Executor is None:
+            if self.ExecutorType == HandlerExecutorType.Process:
+                self.Executor = concurrent.futures.ProcessPoolExecutor(self.MaxWorkers)
+            else:
+                self.Executor = concurrent.futures.ThreadPoolExecutor(self.MaxWorkers, 'wsapp-' + self.Name)
+        return self.Executor
+
+    async def run_async(self, handler, payload_type, msg: WebsocketAppMessage):
+        """
+        Runs a handler in the pool, see run_executor_handler. Waits for a free slot when the pool queue is full
+
+        :param handler: Handler function taking the payload and returning the response object. Handlers run on a
+        process pool, their payload types and return values must be picklable, e.g. module level functions
+        :param payload_type: Optional payload type the payload is decoded into
+        :param msg: Received WebsocketAppMessage object
+        :return: Return value of the handler
+        """
+        if self.Slots is None:
+            self.Slots = asyncio.Semaphore(self.MaxWorkers + self.MaxQueue)
+
+        self.Waiting += 1
+        try:
+            await self.Slots.acquire()
+        finally:
+            self.Waiting -= 1
+
+        self.Submitted += 1
+        try:
+            # The raw payload is handed over, so its decoding runs in the worker too
+            return await asyncio.get_running_loop().run_in_executor(
+                self.get_executor(), run_executor_handler, handler, payload_type, msg._json_data, msg._data)
+        finally:
+            self.Submitted -= 1
+            self.Slots.release()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the gauges of the executor
+
+        :return: Dictionary with the number of workers, running handlers and queued handlers
+        """
+        active = min(self.Submitted, self.MaxWorkers)
+        return {
+            'type': self.ExecutorType,
+            'workers': self.MaxWorkers,
+            'active': active,
+            'queue_depth': self.Submitted - active + self.Waiting
+        }
+
+    def shutdown(self, wait: bool = True):
+        """
+        Shuts down the pool
+
+        :param wait: Wait for the running handlers to complete
+        :return: Void
+        """
+        if self.Executor is not None:
+            self.Executor.shutdown(wait)
+            self.Executor = None
+
+
+# Pools shared by the handlers registered with an executor type instead of a HandlerExecutor object
+DefaultExecutors = {}
+
+
+def get_handler_executor(executor) -> HandlerExecutor:
+    """
+    Returns the HandlerExecutor of a handler registration option
+
+    :param executor: HandlerExecutorType, for the shared default pool of that type, or a HandlerExecutor object
+    :return: HandlerExecutor object
+    """
+    if isinstance(executor, HandlerExecutor):
+        return executor
+    if executor not in (HandlerExecutorType.Thread, HandlerExecutorType.Process):
+        raise ValueError('Unknown handler executor ' + str(executor))
+    handler_executor = DefaultExecutors.get(executor)
+    if handler_executor is None:
+        handler_executor = HandlerExecutor(executor)
+        DefaultExecutors[executor] = handler_executor
+    return handler_executor
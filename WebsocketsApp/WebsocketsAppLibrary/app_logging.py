@@ -0,0 +1,47 @@
+import logging
+
+# Logger for the library events (connections, handler errors)
+logger = logging.getLogger('WebsocketsAppLibrary')
+
+# Logger for the websocket frames sent and received, enable DEBUG level on it to trace the frames
+frame_logger = logging.getLogger('WebsocketsAppLibrary.frames')
+
+
+class FrameLogger(object):
+    """
+    Logs websocket frames at DEBUG level on the WebsocketsAppLibrary.frames logger.
+    Nothing is counted or formatted unless DEBUG is enabled on that logger.
+    """
+    def __init__(self, side: str, sample_rate: int = 1, max_payload: int = 256):
+        """
+        Create a new FrameLogger object
+        :param side: Side of the connection included in the log records, e.g. Client or Server
+        :param sample_rate: Log one in every sample_rate frames
+        :param max_payload: Maximum number of characters (or bytes for binary frames) logged per frame.
+        None logs the whole frame
+        """
+        self.Side = side
+        self.SampleRate = sample_rate
+        self.MaxPayload = max_payload
+        self.Count = 0
+
+    def log_frame(self, direction: str, frame):
+        """
+        Logs a websocket frame, if DEBUG is enabled and the frame is sampled
+
+        :param direction: Direction of the frame, Recv or Send
+        :param frame: Frame data, str or bytes
+        :return: Void
+        """
+        if not frame_logger.isEnabledFor(logging.DEBUG):
+            return
+
+        self.Count += 1
+        if self.Count % self.SampleRate:
+            return
+
+        if self.MaxPayload is not None and len(frame) > self.MaxPayload:
+            frame_logger.debug('%s %s (%d of %d): %r...', self.Side, direction, self.MaxPayload, len(frame),
+                               frame[:self.MaxPayload])
+        else:
+            frame_logger.debug('%s %s: %r', self.Side, direction, frame)
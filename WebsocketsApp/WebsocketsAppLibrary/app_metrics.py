@@ -0,0 +1,535 @@
+import asyncio
+import time
+import weakref
+
+
+class LatencyHistogram(object):
+    """
+    HDR style latency histogram with microsecond resolution.
+    Values below 32us are counted exactly, larger values in log2 ranges split into 16 linear sub-buckets,
+    which bounds the relative error to about 6% with a fixed number of buckets.
+    """
+    SubBucketBits = 4
+    SubBucketCount = 1 << SubBucketBits
+    BucketCount = 64 * SubBucketCount
+
+    def __init__(self):
+        self.Counts = [0] * self.BucketCount
+        self.Count = 0
+        self.Sum = 0
+        self.Max = 0
+
+    def record(self, nanoseconds: int):
+        """
+        Records a latency value
+
+        :param nanoseconds: Latency in nanoseconds, e.g. a difference of time.perf_counter_ns values
+        :return: Void
+        """
+        value = nanoseconds // 1000
+        shift = value.bit_length() - self.SubBucketBits - 1
+        if shift <= 0:
+            index = value
+        else:
+            index = shift * self.SubBucketCount + (value >> shift)
+        self.Counts[index] += 1
+        self.Count += 1
+        self.Sum += value
+        if value > self.Max:
+            self.Max = value
+
+    def bucket_value(self, index: int) -> int:
+        """
+        Returns the highest value counted in a bucket
+
+        :param index: Bucket index
+        :return: Value in microseconds
+        """
+        if index < 2 * self.SubBucketCount:
+            return index
+        shift = index // self.SubBucketCount - 1
+        return ((index - shift * self.SubBucketCount + 1) << shift) - 1
+
+    def percentile(self, percent: float) -> int:
+        """
+        Returns the value at a percentile
+
+        :param percent: Percentile between 0 and 100
+        :return: Value in microseconds
+        """
+        if self.Count == 0:
+            return 0
+        threshold = self.Count * percent / 100
+        total = 0
+        for index, count in enumerate(self.Counts):
+            total += count
+            if count and total >= threshold:
+                return min(self.bucket_value(index), self.Max)
+        return self.Max
+
+    def snapshot(self) -> dict:
+        """
+        Returns the summary of the histogram
+
+        :return: Dictionary with count, mean, max and percentile values in microseconds
+        """
+        return {
+            'count': self.Count,
+            'mean_us': self.Sum / self.Count if self.Count else 0,
+            'p50_us': self.percentile(50),
+            'p90_us': self.percentile(90),
+            'p99_us': self.percentile(99),
+            'p999_us': self.percentile(99.9),
+            'max_us': self.Max
+        }
+
+    def export_state(self) -> dict:
+        """
+        Returns the raw state of the histogram, to merge it into a histogram of another process
+
+        :return: Dictionary with the non zero bucket counts, count, sum and max
+        """
+        return {
+            'counts': {index: count for index, count in enumerate(self.Counts) if count},
+            'count': self.Count,
+            'sum': self.Sum,
+            'max': self.Max
+        }
+
+    def merge_state(self, state: dict):
+        """
+        Adds the values of an exported histogram state to this histogram
+
+        :param state: Dictionary returned by export_state
+        :return: Void
+        """
+        for index, count in state['counts'].items():
+            self.Counts[index] += count
+        self.Count += state['count']
+        self.Sum += state['sum']
+        self.Max = max(self.Max, state['max'])
+
+
+class MessageMetrics(object):
+    """
+    Counters and latency histograms of a single message name
+    """
+    Counters = ('Received', 'Sent', 'Errors', 'Dropped', 'Conflated', 'Rejected', 'BytesIn', 'BytesOut')
+    Histograms = ('Decode', 'Handler', 'Encode', 'RoundTrip')
+
+    def __init__(self):
+        self.Received = 0
+        self.Sent = 0
+        self.Errors = 0
+        self.Dropped = 0
+        self.Conflated = 0
+        # Received messages refused by admission control, see AdmissionController
+        self.Rejected = 0
+        self.BytesIn = 0
+        self.BytesOut = 0
+        self.Decode = LatencyHistogram()
+        self.Handler = LatencyHistogram()
+        self.Encode = LatencyHistogram()
+        self.RoundTrip = LatencyHistogram()
+
+    def snapshot(self) -> dict:
+        return {
+            'received': self.Received,
+            'sent': self.Sent,
+            'errors': self.Errors,
+            'dropped': self.Dropped,
+            'conflated': self.Conflated,
+            'rejected': self.Rejected,
+            'bytes_in': self.BytesIn,
+            'bytes_out': self.BytesOut,
+            'decode': self.Decode.snapshot(),
+            'handler': self.Handler.snapshot(),
+            'encode': self.Encode.snapshot(),
+            'round_trip': self.RoundTrip.snapshot()
+        }
+
+    def export_state(self) -> dict:
+        """
+        Returns the raw state of the counters and histograms, to merge them into the metrics of another process
+
+        :return: Dictionary of the counter values and histogram states
+        """
+        state = {counter: getattr(self, counter) for counter in self.Counters}
+        for histogram in self.Histograms:
+            state[histogram] = getattr(self, histogram).export_state()
+        return state
+
+    def merge_state(self, state: dict):
+        """
+        Adds the values of exported message metrics to these metrics
+
+        :param state: Dictionary returned by export_state
+        :return: Void
+        """
+        for counter in self.Counters:
+            setattr(self, counter, getattr(self, counter) + state[counter])
+        for histogram in self.Histograms:
+            getattr(self, histogram).merge_state(state[histogram])
+
+
+class CompressionMetrics(object):
+    """
+    Counters and latency histograms of a compression mechanism: frames or payloads compressed and skipped for being
+    under the size threshold, bytes before and after compression, and the CPU time spent compressing and decompressing
+    """
+    Counters = ('Compressed', 'Skipped', 'Decompressed', 'BytesIn', 'BytesOut')
+    Histograms = ('Compress', 'Decompress')
+
+    def __init__(self):
+        self.Compressed = 0
+        self.Skipped = 0
+        self.Decompressed = 0
+        self.BytesIn = 0
+        self.BytesOut = 0
+        self.Compress = LatencyHistogram()
+        self.Decompress = LatencyHistogram()
+
+    def record_compress(self, size: int, compressed_size: int, nanoseconds: int):
+        """
+        Records a compression
+
+        :param size: Size in bytes before compression
+        :param compressed_size: Size in bytes after compression
+        :param nanoseconds: Time spent compressing
+        :return: Void
+        """
+        self.Compressed += 1
+        self.BytesIn += size
+        self.BytesOut += compressed_size
+        self.Compress.record(nanoseconds)
+
+    def record_decompress(self, nanoseconds: int):
+        """
+        Records a decompression
+
+        :param nanoseconds: Time spent decompressing
+        :return: Void
+        """
+        self.Decompressed += 1
+        self.Decompress.record(nanoseconds)
+
+    def snapshot(self) -> dict:
+        return {
+            'compressed': self.Compressed,
+            'skipped': self.Skipped,
+            'decompressed': self.Decompressed,
+            'bytes_in': self.BytesIn,
+            'bytes_out': self.BytesOut,
+            'ratio': self.BytesOut / self.BytesIn if self.BytesIn else 1.0,
+            'compress': self.Compress.snapshot(),
+            'decompress': self.Decompress.snapshot()
+        }
+
+    def export_state(self) -> dict:
+        state = {counter: getattr(self, counter) for counter in self.Counters}
+        for histogram in self.Histograms:
+            state[histogram] = getattr(self, histogram).export_state()
+        return state
+
+    def merge_state(self, state: dict):
+        for counter in self.Counters:
+            setattr(self, counter, getattr(self, counter) + state[counter])
+        for histogram in self.Histograms:
+            getattr(self, histogram).merge_state(state[histogram])
+
+
+class MetricsRegistry(object):
+    """
+    Metrics of a websocket app server or client: per message name counters and latency histograms,
+    and gauges computed from the live connections when a snapshot is taken.
+    """
+    # Message names beyond this limit are counted under OtherName, so peers cannot grow the registry without bound
+    MaxMessageNames = 1000
+    OtherName = '__other__'
+
+    def __init__(self):
+        self.Messages = {}
+        self.Connections = weakref.WeakSet()
+        self.Executors = {}
+        self.Compression = {}
+        # Gauges merged from the metrics of other processes, see merge_state
+        self.MergedGauges = None
+        self.StartTime = time.time()
+
+    def get_message_metrics(self, name) -> MessageMetrics:
+        """
+        Returns the metrics of a message name, creating them on first use
+
+        :param name: Message name string. Names of other types, sent by peers, are recorded as strings
+        :return: MessageMetrics object
+        """
+        try:
+            metrics = self.Messages.get(name)
+        except TypeError:
+            metrics = None
+        if metrics is None:
+            if not isinstance(name, str):
+                name = str(name)
+                metrics = self.Messages.get(name)
+        if metrics is None:
+            if len(self.Messages) >= self.MaxMessageNames:
+                name = self.OtherName
+                metrics = self.Messages.get(name)
+            if metrics is None:
+                metrics = MessageMetrics()
+                self.Messages[name] = metrics
+        return metrics
+
+    def get_compression_metrics(self, kind: str) -> CompressionMetrics:
+        """
+        Returns the metrics of a compression mechanism, creating them on first use
+
+        :param kind: Compression mechanism, 'permessage_deflate' or 'payload'
+        :return: CompressionMetrics object
+        """
+        metrics = self.Compression.get(kind)
+        if metrics is None:
+            metrics = CompressionMetrics()
+            self.Compression[kind] = metrics
+        return metrics
+
+    def add_connection(self, client):
+        """
+        Adds a connection to the gauges
+
+        :param client: WebsocketAppClient object
+        :return: Void
+        """
+        self.Connections.add(client)
+
+    def remove_connection(self, client):
+        """
+        Removes a closed connection from the gauges
+
+        :param client: WebsocketAppClient object
+        :return: Void
+        """
+        self.Connections.discard(client)
+
+    def add_executor(self, executor):
+        """
+        Adds a handler executor to the gauges
+
+        :param executor: HandlerExecutor object
+        :return: Void
+        """
+        self.Executors[executor.Name] = executor
+
+    @staticmethod
+    def get_send_queue_size(client) -> int:
+        """
+        Returns the number of bytes waiting in the send queue and the send buffer of a connection
+
+        :param client: WebsocketAppClient object
+        :return: Queued and buffered bytes
+        """
+        transport = getattr(client.Websocket, 'transport', None)
+        size = transport.get_write_buffer_size() if transport is not None else 0
+        if client.SendQueue is not None:
+            size += client.SendQueue.Bytes
+        return size
+
+    def snapshot(self, include_connections: bool = False) -> dict:
+        """
+        Returns the current metrics
+
+        :param include_connections: Include the gauges of every connection
+        :return: Dictionary of metrics
+        """
+        connections = []
+        in_flight = 0
+        send_queue_size = 0
+        max_send_queue_size = 0
+        for client in list(self.Connections):
+            client_in_flight = len(client.CorIdMessageMap or ())
+            client_send_queue_size = self.get_send_queue_size(client)
+            in_flight += client_in_flight
+            send_queue_size += client_send_queue_size
+            max_send_queue_size = max(max_send_queue_size, client_send_queue_size)
+            if include_connections:
+                connections.append({
+                    'connection': id(client),
+                    'messages_in': client.MessagesIn,
+                    'messages_out': client.MessagesOut,
+                    'in_flight': client_in_flight,
+                    'send_queue_bytes': client_send_queue_size
+                })
+
+        connection_count = len(self.Connections)
+        executors = {name: executor.snapshot() for name, executor in list(self.Executors.items())}
+        if self.MergedGauges is not None:
+            connection_count += self.MergedGauges['connections']
+            in_flight += self.MergedGauges['in_flight_requests']
+            send_queue_size += self.MergedGauges['send_queue_bytes']
+            max_send_queue_size = max(max_send_queue_size, self.MergedGauges['max_send_queue_bytes'])
+            executors.update(self.MergedGauges['executors'])
+
+        snapshot = {
+            'uptime_seconds': time.time() - self.StartTime,
+            'connections': connection_count,
+            'in_flight_requests': in_flight,
+            'send_queue_bytes': send_queue_size,
+            'max_send_queue_bytes': max_send_queue_size,
+            'executors': executors,
+            'compression': {kind: metrics.snapshot() for kind, metrics in list(self.Compression.items())},
+            'messages': {name: metrics.snapshot() for name, metrics in list(self.Messages.items())}
+        }
+        if include_connections:
+            snapshot['connection_details'] = connections
+        return snapshot
+
+    def export_state(self) -> dict:
+        """
+        Returns the raw state of the metrics, to aggregate the metrics of several processes, see merge_state
+
+        :return: Dictionary of the gauges and the per message name metrics states
+        """
+        snapshot = self.snapshot()
+        return {
+            'gauges': {key: snapshot[key] for key in ('connections', 'in_flight_requests', 'send_queue_bytes',
+                                                      'max_send_queue_bytes', 'executors')},
+            'messages': {name: metrics.export_state() for name, metrics in list(self.Messages.items())},
+            'compression': {kind: metrics.export_state() for kind, metrics in list(self.Compression.items())}
+        }
+
+    def merge_state(self, state: dict, prefix: str = ''):
+        """
+        Adds the metrics exported by another process to this registry. Counters, histograms and gauges are summed,
+        the max send queue size is the max of both
+
+        :param state: Dictionary returned by export_state
+        :param prefix: Prefix of the executor names of the other process, to keep their gauges apart
+        :return: Void
+        """
+        for name, message_state in state['messages'].items():
+            self.get_message_metrics(name).merge_state(message_state)
+        for kind, compression_state in state.get('compression', {}).items():
+            self.get_compression_metrics(kind).merge_state(compression_state)
+
+        gauges = state['gauges']
+        if self.MergedGauges is None:
+            self.MergedGauges = {'connections': 0, 'in_flight_requests': 0, 'send_queue_bytes': 0,
+                                 'max_send_queue_bytes': 0, 'executors': {}}
+        for key in ('connections', 'in_flight_requests', 'send_queue_bytes'):
+            self.MergedGauges[key] += gauges[key]
+        self.MergedGauges['max_send_queue_bytes'] = max(self.MergedGauges['max_send_queue_bytes'],
+                                                        gauges['max_send_queue_bytes'])
+        for name, executor in gauges['executors'].items():
+            self.MergedGauges['executors'][prefix + name] = executor
+
+    def prometheus_text(self) -> str:
+        """
+        Returns the current metrics in the Prometheus text exposition format
+
+        :return: Metrics text
+        """
+        snapshot = self.snapshot()
+        lines = [
+            '# TYPE wsapp_connections gauge',
+            'wsapp_connections ' + str(snapshot['connections']),
+            '# TYPE wsapp_in_flight_requests gauge',
+            'wsapp_in_flight_requests ' + str(snapshot['in_flight_requests']),
+            '# TYPE wsapp_send_queue_bytes gauge',
+            'wsapp_send_queue_bytes ' + str(snapshot['send_queue_bytes']),
+            '# TYPE wsapp_max_send_queue_bytes gauge',
+            'wsapp_max_send_queue_bytes ' + str(snapshot['max_send_queue_bytes'])
+        ]
+
+        for key, metric in (('active', 'wsapp_executor_active'), ('queue_depth', 'wsapp_executor_queue_depth')):
+            lines.append('# TYPE ' + metric + ' gauge')
+            for name, executor in snapshot['executors'].items():
+                lines.append(metric + '{executor="' + name + '"} ' + str(executor[key]))
+
+        compression = snapshot['compression']
+        for key, metric in (('bytes_in', 'wsapp_compression_bytes_in_total'),
+                            ('bytes_out', 'wsapp_compression_bytes_out_total')):
+            lines.append('# TYPE ' + metric + ' counter')
+            for kind, metrics in compression.items():
+                lines.append(metric + '{kind="' + kind + '"} ' + str(metrics[key]))
+        lines.append('# TYPE wsapp_compression_total counter')
+        for kind, metrics in compression.items():
+            for key in ('compressed', 'skipped', 'decompressed'):
+                lines.append('wsapp_compression_total{kind="' + kind + '",result="' + key + '"} ' + str(metrics[key]))
+        lines.append('# TYPE wsapp_compression_ratio gauge')
+        for kind, metrics in compression.items():
+            lines.append('wsapp_compression_ratio{kind="' + kind + '"} ' + str(metrics['ratio']))
+        for stage in ('compress', 'decompress'):
+            metric = 'wsapp_' + stage + '_latency_us'
+            lines.append('# TYPE ' + metric + ' summary')
+            for kind, metrics in compression.items():
+                histogram = metrics[stage]
+                for quantile, key in (('0.5', 'p50_us'), ('0.99', 'p99_us')):
+                    lines.append(metric + '{kind="' + kind + '",quantile="' + quantile + '"} ' + str(histogram[key]))
+                lines.append(metric + '_sum{kind="' + kind + '"} ' + str(histogram['mean_us'] * histogram['count']))
+                lines.append(metric + '_count{kind="' + kind + '"} ' + str(histogram['count']))
+
+        # Label values escaped as required by the text format, message names come from the peers
+        labels = {name: 'name="' + str(name).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+                  for name in snapshot['messages']}
+
+        counters = (('received', 'wsapp_messages_received_total'), ('sent', 'wsapp_messages_sent_total'),
+                    ('errors', 'wsapp_message_errors_total'), ('dropped', 'wsapp_messages_dropped_total'),
+                    ('conflated', 'wsapp_messages_conflated_total'), ('rejected', 'wsapp_messages_rejected_total'),
+                    ('bytes_in', 'wsapp_bytes_in_total'), ('bytes_out', 'wsapp_bytes_out_total'))
+        for key, metric in counters:
+            lines.append('# TYPE ' + metric + ' counter')
+            for name, metrics in snapshot['messages'].items():
+                lines.append(metric + '{' + labels[name] + '} ' + str(metrics[key]))
+
+        for stage in ('decode', 'handler', 'encode', 'round_trip'):
+            metric = 'wsapp_' + stage + '_latency_us'
+            lines.append('# TYPE ' + metric + ' summary')
+            for name, metrics in snapshot['messages'].items():
+                histogram = metrics[stage]
+                for quantile, key in (('0.5', 'p50_us'), ('0.9', 'p90_us'), ('0.99', 'p99_us'),
+                                      ('0.999', 'p999_us')):
+                    lines.append(metric + '{' + labels[name] + ',quantile="' + quantile + '"} ' +
+                                 str(histogram[key]))
+                lines.append(metric + '_sum{' + labels[name] + '} ' + str(histogram['mean_us'] * histogram['count']))
+                lines.append(metric + '_count{' + labels[name] + '} ' + str(histogram['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    async def prometheus_text_async(self) -> str:
+        """
+        Returns the metrics text served on the metrics port. Override to collect metrics from elsewhere first
+
+        :return: Metrics text
+        """
+        return self.prometheus_text()
+
+    async def handle_metrics_request_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answers a HTTP request on the metrics port with the Prometheus text of the metrics
+
+        :param reader: Stream reader of the HTTP connection
+        :param writer: Stream writer of the HTTP connection
+        :return: Void
+        """
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = (await self.prometheus_text_async()).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                         b'Connection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start_http_server_async(self, port: int, host: str = ''):
+        """
+        Starts serving the metrics in the Prometheus text format over HTTP on a side port
+
+        :param port: Port to listen on
+        :param host: Host/IP to listen on, any IP of the current system by default
+        :return: asyncio Server object
+        """
+        return await asyncio.start_server(self.handle_metrics_request_async, host or None, port)
@@ -0,0 +1,203 @@
+import collections
+
+from websockets.exceptions import WebSocketException
+
+from .app_logging import *
+from .app_types import *
+
+
+class SendQueuePolicy:
+    """
+    What a send does when the send queue of the connection is above its high watermark
+    """
+    # Wait until the writer drains the queue below the low watermark
+    Block = 'Block'
+    # Drop the message
+    Drop = 'Drop'
+    # Close the connection of the slow remote party, a reconnecting client then reconnects
+    Disconnect = 'Disconnect'
+
+
+class SendQueueOptions(object):
+    """
+    Options of the per connection send queue, see SendQueue
+    """
+    def __init__(self, high_watermark: int = 1048576, low_watermark: int = 262144, policy=SendQueuePolicy.Block,
+                 batch_window: float = None, batch_max_messages: int = 64):
+        """
+        Create a new SendQueueOptions object
+        :param high_watermark: Queued bytes above which the policy applies to new messages
+        :param low_watermark: Queued bytes below which blocked senders resume
+        :param policy: SendQueuePolicy applied above the high watermark
+        :param batch_window: Seconds the writer waits for more messages before sending a batch frame,
+        0 to batch only the messages queued while the previous frame was sent, None to send one frame per message.
+        Batching applies to codecs that support batch frames
+        :param batch_max_messages: Maximum number of messages in a batch frame, up to 65535
+        """
+        self.HighWatermark = high_watermark
+        self.LowWatermark = low_watermark
+        self.Policy = policy
+        self.BatchWindow = batch_window
+        self.BatchMaxMessages = batch_max_messages
+
+
+class SendQueue(object):
+    """
+    Outbound queue of a connection with a single writer task. Senders queue encoded frames and return, the writer
+    sends them in order, optionally combining several frames into one batch frame. The queued bytes are bounded by
+    the high watermark, see SendQueuePolicy.
+    """
+    __slots__ = ('Client', 'Options', 'Frames', 'Bytes', 'Writable', 'WriterTask', 'Closed')
+
+    def __init__(self, client, options: SendQueueOptions):
+        """
+        Create a new SendQueue object
+        :param client: WebsocketAppClient object owning the connection
+        :param options: SendQueueOptions object
+        """
+        self.Client = client
+        self.Options = options
+        self.Frames = collections.deque()
+        self.Bytes = 0
+        self.Writable = asyncio.Event()
+        self.Writable.set()
+        self.WriterTask = None
+        self.Closed = False
+
+    async def wait_writable_async(self) -> bool:
+        """
+        Applies the policy when the queue is above the high watermark. Call before encoding and queuing a frame,
+        so frames are queued in the order they are encoded
+
+        :return: False if the message must be dropped
+        :raises WebsocketAppConnectionClosedException: The connection is closed, or disconnected by the policy
+        """
+        while not self.Closed and self.Bytes >= self.Options.HighWatermark:
+            if self.Options.Policy == SendQueuePolicy.Drop:
+                return False
+            if self.Options.Policy == SendQueuePolicy.Disconnect:
+                logger.warning('Disconnecting slow remote party with %d bytes queued', self.Bytes)
+                self.close()
+                # Only the connection is closed, a reconnecting client reconnects and resumes its session
+                asyncio.create_task(self.Client.close_connection_async(1013, 'Send queue full'))
+                break
+            self.Writable.clear()
+            await self.Writable.wait()
+
+        if self.Closed:
+            raise WebsocketAppConnectionClosedException('Connection closed')
+        return True
+
+    def put(self, frame):
+        """
+        Queues an encoded frame and starts the writer if it is not running
+
+        :param frame: Frame data
+        :return: Void
+        """
+        self.Frames.append(frame)
+        self.Bytes += len(frame)
+        if self.WriterTask is None:
+            self.WriterTask = asyncio.create_task(self.write_async())
+
+    async def write_async(self):
+        """
+        Sends the queued frames until the queue is empty
+
+        :return: Void
+        """
+        options = self.Options
+        batch = options.BatchWindow is not None and self.Client.Codec.SupportsBatch
+        try:
+            while self.Frames:
+                if batch and len(self.Frames) < options.BatchMaxMessages:
+                    await asyncio.sleep(options.BatchWindow)
+
+                if batch and len(self.Frames) > 1:
+                    frames = [self.Frames.popleft() for i in range(min(len(self.Frames), options.BatchMaxMessages))]
+                    size = sum(len(frame) for frame in frames)
+                    frame = self.Client.Codec.encode_batch(frames)
+                else:
+                    frame = self.Frames.popleft()
+                    size = len(frame)
+
+                self.Bytes -= size
+                if self.Bytes <= options.LowWatermark:
+                    self.Writable.set()
+
+                await self.Client.write_frame_async(frame)
+        except WebSocketException:
+            self.close()
+        finally:
+            self.WriterTask = None
+
+    def close(self):
+        """
+        Discards the queued frames and fails the blocked and later senders
+
+        :return: Void
+        """
+        self.Closed = True
+        self.Frames.clear()
+        self.Bytes = 0
+        self.Writable.set()
+
+
+class ConflatingSender(object):
+    """
+    Outbound slots of a connection for conflated messages. Only the latest pending frame is kept per
+    conflation key, and the pending frames are sent one at a time by a flush task. While a send waits for the
+    socket to drain, newer values replace the pending ones, so a slow client receives the latest state instead of
+    every intermediate update, and the memory held per connection is bounded by the number of keys.
+    """
+    __slots__ = ('Client', 'MaxKeys', 'Pending', 'FlushTask')
+
+    def __init__(self, client, max_keys: int):
+        """
+        Create a new ConflatingSender object
+        :param client: WebsocketAppClient object owning the connection
+        :param max_keys: Maximum number of pending conflation keys
+        """
+        self.Client = client
+        self.MaxKeys = max_keys
+        self.Pending = {}
+        self.FlushTask = None
+
+    def put(self, key, frame) -> bool:
+        """
+        Replaces the pending frame of a conflation key, or queues it if the key has no pending frame
+
+        :param key: Conflation key, a tuple of the message name and the user supplied key
+        :param frame: Frame data encoded with encode_shared of the connection codec
+        :return: False if the frame was dropped because MaxKeys keys are already pending
+        """
+        metrics = self.Client.Metrics.get_message_metrics(key[0])
+        if key in self.Pending:
+            metrics.Conflated += 1
+        elif len(self.Pending) >= self.MaxKeys:
+            metrics.Dropped += 1
+            return False
+
+        self.Pending[key] = frame
+        if self.FlushTask is None:
+            self.FlushTask = asyncio.create_task(self.flush_async())
+        return True
+
+    async def flush_async(self):
+        """
+        Sends the pending frames in the order their keys were queued, until no frame is pending
+
+        :return: Void
+        """
+        try:
+            while self.Pending:
+                key = next(iter(self.Pending))
+                frame = self.Pending.pop(key)
+                metrics = self.Client.Metrics.get_message_metrics(key[0])
+                metrics.Sent += 1
+                metrics.BytesOut += len(frame)
+                await self.Client.send_frame_async(frame, key[0])
+        except (WebSocketException, WebsocketAppConnectionClosedException):
+            self.Pending.clear()
+        finally:
+            self.FlushTask = None
@@ -0,0 +1,114 @@
+import copy
+import typing
+
+
+def get_payload_decoder(annotation):
+    """
+    Returns the decoder of a field annotated with a payload type, or a list of payload types
+
+    :param annotation: Field annotation
+    :return: Tuple of the decoded value class (dict or list) and its decoder function, or None for plain fields
+    """
+    if hasattr(annotation, 'from_dict'):
+        return dict, annotation.from_dict
+
+    if typing.get_origin(annotation) is list:
+        args = typing.get_args(annotation)
+        if args and hasattr(args[0], 'from_dict'):
+            item_from_dict = args[0].from_dict
+            return list, lambda values: [item_from_dict(value) if type(value) is dict else value for value in values]
+
+    return None
+
+
+def websocket_app_payload(cls):
+    """
+    Class decorator for message payload types. Fields are declared as annotated class attributes, with their
+    default values:
+
+        @websocket_app_payload
+        class PlaceOrderRequest(object):
+            Symbol: str = None
+            Quantity: int = 0
+
+    The decorated class is rebuilt with __slots__, and its __init__(**kwargs), from_dict(dict) and to_dict() methods
+    are generated once here, so decoding a payload assigns the fields directly, without per message reflection.
+    Fields annotated with another payload type, or a list of payload types, are decoded into those types.
+    Keys that are not declared fields are ignored. Mutable default values are copied for every object.
+
+    :param cls: Payload class
+    :return: Payload class with __slots__ and the generated methods
+    """
+    fields = []
+    for base in reversed(cls.__mro__):
+        for field in base.__dict__.get('__annotations__', {}):
+            if field not in fields:
+                fields.append(field)
+
+    base_slots = set()
+    for base in cls.__mro__[1:]:
+        base_slots.update(base.__dict__.get('__slots__', ()))
+
+    own_annotations = cls.__dict__.get('__annotations__', {})
+    namespace = {name: value for name, value in cls.__dict__.items()
+                 if name not in own_annotations and name not in ('__dict__', '__weakref__')}
+    namespace['__slots__'] = tuple(field for field in own_annotations if field not in base_slots)
+    payload_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+
+    annotations = {}
+    defaults = {}
+    for base in reversed(cls.__mro__):
+        annotations.update(base.__dict__.get('__annotations__', {}))
+        for field in base.__dict__.get('__annotations__', {}):
+            if field in base.__dict__:
+                defaults[field] = base.__dict__[field]
+
+    scope = {'new': object.__new__, 'cls': payload_cls, 'copy': copy.copy}
+    assign_lines = []
+    for index, field in enumerate(fields):
+        default = defaults.get(field)
+        scope['default_' + str(index)] = default
+        default_expr = 'default_' + str(index)
+        if isinstance(default, (list, dict, set)):
+            default_expr = 'copy(' + default_expr + ')'
+
+        decoder = get_payload_decoder(annotations.get(field))
+        if decoder is None:
+            assign_lines.append('    obj.' + field + ' = d.get(' + repr(field) + ', ' + default_expr + ')')
+        else:
+            scope['class_' + str(index)], scope['decode_' + str(index)] = decoder
+            assign_lines.append('    value = d.get(' + repr(field) + ', ' + default_expr + ')')
+            assign_lines.append('    obj.' + field + ' = decode_' + str(index) + '(value) if type(value) is class_' +
+                                str(index) + ' else value')
+
+    source = '\n'.join(
+        ['def from_dict(d):', '    obj = new(cls)'] + assign_lines + ['    return obj', ''] +
+        ['def __init__(obj, **d):'] + (assign_lines or ['    pass']) + [''] +
+        ['def to_dict(obj):', '    return {' + ', '.join(repr(field) + ': obj.' + field for field in fields) + '}', ''] +
+        ['def __setstate__(obj, d):'] + (assign_lines or ['    pass'])
+    )
+    exec(source, scope)
+
+    payload_cls.from_dict = staticmethod(scope['from_dict'])
+    payload_cls.__init__ = scope['__init__']
+    payload_cls.to_dict = scope['to_dict']
+    payload_cls.__getstate__ = scope['to_dict']
+    payload_cls.__setstate__ = scope['__setstate__']
+    payload_cls.PayloadFields = tuple(fields)
+    return payload_cls
+
+
+def decode_payload(data, payload_type):
+    """
+    Decodes a message payload into a payload type
+
+    :param data: Payload decoded by the codec, usually a dict
+    :param payload_type: Class decorated with websocket_app_payload, or any class taking the fields as kwargs
+    :return: Payload object, or data unchanged if it is not a dict
+    """
+    if type(data) is not dict:
+        return data
+    from_dict = getattr(payload_type, 'from_dict', None)
+    if from_dict is not None:
+        return from_dict(data)
+    return payload_type(**data)
@@ -0,0 +1,259 @@
+from .app_client import *
+
+
+class WebsocketAppClientPool(object):
+    """
+    Pool of websocket app client connections to one or several websocket app servers.
+    Requests and messages are routed to the connection with the fewest requests in flight, or, when a key is given,
+    to the connection the key hashes to, so all the messages with the same key (e.g. a symbol) are sent in order on
+    one connection. Connections are health checked with websocket pings, and closed connections are replaced.
+    """
+    def __init__(self, urls, size: int = 4, codecs=DEFAULT_CODECS, client_factory=None,
+                 health_check_interval: float = 10, health_check_timeout: float = 5, reconnect_delay: float = 0.5,
+                 max_reconnect_delay: float = 30, connect_timeout: float = 10, **client_options):
+        """
+        Create a new WebsocketAppClientPool object
+
+        :param urls: Url of the websocket app server, or list of urls the connections are spread over
+        :param size: Number of connections
+        :param codecs: Codec names offered to the servers, see WebsocketAppClient.connect_async
+        :param client_factory: Optional function returning a new, not connected, WebsocketAppClient object, e.g. a
+        subclass with message handlers. By default WebsocketAppClient objects sharing the Metrics of the pool
+        :param health_check_interval: Seconds between the pings of every connection, None disables the health checks
+        :param health_check_timeout: Seconds to wait for a pong, before the connection is closed and replaced
+        :param reconnect_delay: Seconds to wait before reconnecting after a failed connect, doubled on every
+        further failure
+        :param max_reconnect_delay: Maximum seconds to wait before reconnecting
+        :param connect_timeout: Seconds connect_async and the routed calls wait for a connection to be available
+        :param client_options: Keyword arguments of WebsocketAppClient for the default client factory
+        """
+        self.Urls = [urls] if isinstance(urls, str) else list(urls)
+        self.Size = size
+        self.Codecs = codecs
+        self.Metrics = client_options.pop('metrics', None) or MetricsRegistry()
+        self.ClientFactory = client_factory or (lambda: WebsocketAppClient(metrics=self.Metrics, **client_options))
+        self.HealthCheckInterval = health_check_interval
+        self.HealthCheckTimeout = health_check_timeout
+        self.ReconnectDelay = reconnect_delay
+        self.MaxReconnectDelay = max_reconnect_delay
+        self.ConnectTimeout = connect_timeout
+        self.MessageHandlers = []
+        self.Middlewares = []
+        self.Clients = [None] * size
+        self.SlotReady = None
+        self.Available = None
+        self.Tasks = []
+        self.Closed = False
+
+    def add_message_handler(self, name, handler, order_key=None, payload_type=None, executor=None):
+        """
+        Add a message handler method/function to a message name, on every connection of the pool.
+        See WebsocketAppClient.add_message_handler
+
+        :return: Void
+        """
+        self.MessageHandlers.append((name, handler, order_key, payload_type, executor))
+        for client in self.Clients:
+            if client is not None:
+                client.add_message_handler(name, handler, order_key, payload_type, executor)
+
+    def add_middleware(self, middleware, names=None):
+        """
+        Add a middleware around the message handlers of every connection of the pool.
+        See WebsocketAppClient.add_middleware
+
+        :return: Void
+        """
+        self.Middlewares.append((middleware, names))
+        for client in self.Clients:
+            if client is not None:
+                client.add_middleware(middleware, names)
+
+    async def connect_async(self):
+        """
+        Starts connecting the pool, and waits until at least one connection is available
+
+        :return: Void
+        :raises WebsocketAppConnectionClosedException: No connection could be made within the connect timeout
+        """
+        self.SlotReady = [asyncio.Event() for i in range(self.Size)]
+        self.Available = asyncio.Event()
+        self.Tasks = [asyncio.create_task(self.maintain_connection_async(index)) for index in range(self.Size)]
+        if self.HealthCheckInterval is not None:
+            self.Tasks.append(asyncio.create_task(self.health_check_async()))
+        await self.wait_available_async(self.Available)
+
+    async def maintain_connection_async(self, index: int):
+        """
+        Keeps a connection of the pool connected, replacing it when it is closed
+
+        :param index: Index of the connection in the pool
+        :return: Void
+        """
+        url = self.Urls[index % len(self.Urls)]
+        delay = self.ReconnectDelay
+        while not self.Closed:
+            client = self.ClientFactory()
+            for registration in self.MessageHandlers:
+                client.add_message_handler(*registration)
+            for registration in self.Middlewares:
+                client.add_middleware(*registration)
+            try:
+                await client.connect_async(url, self.Codecs)
+            except (OSError, WebSocketException, WebsocketAppException, asyncio.TimeoutError) as e:
+                logger.warning('Pool connection %d to %s failed: %s', index, url, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MaxReconnectDelay)
+                continue
+
+            delay = self.ReconnectDelay
+            self.Clients[index] = client
+            self.SlotReady[index].set()
+            self.Available.set()
+            try:
+                # The read loop of the client ends when its connection is closed
+                await asyncio.wait((client.ProcessMessageTask,))
+            finally:
+                self.Clients[index] = None
+                self.SlotReady[index].clear()
+                if not any(self.Clients):
+                    self.Available.clear()
+
+            if not self.Closed:
+                logger.warning('Pool connection %d to %s closed, reconnecting', index, url)
+
+    async def health_check_async(self):
+        """
+        Pings every connection of the pool periodically, and closes the ones that do not answer in time
+
+        :return: Void
+        """
+        while not self.Closed:
+            await asyncio.sleep(self.HealthCheckInterval)
+            clients = [client for client in self.Clients if client is not None]
+            results = await asyncio.gather(*[client.ping_async(self.HealthCheckTimeout) for client in clients],
+                                           return_exceptions=True)
+            for client, result in zip(clients, results):
+                if isinstance(result, WebsocketAppTimeoutException):
+                    logger.warning('Pool connection to %s failed its health check, replacing it', client.Url)
+                    asyncio.create_task(client.disconnect('Health check failed'))
+
+    async def wait_available_async(self, event: asyncio.Event):
+        """
+        Waits for a pool connection, up to the connect timeout
+
+        :param event: Event set while the connection is available
+        :return: Void
+        :raises WebsocketAppConnectionClosedException: No connection became available within the connect timeout
+        """
+        if event.is_set():
+            return
+        if self.Closed:
+            raise WebsocketAppConnectionClosedException('Connection pool closed')
+        try:
+            await asyncio.wait_for(event.wait(), self.ConnectTimeout)
+        except asyncio.TimeoutError:
+            raise WebsocketAppConnectionClosedException('No pool connection available within ' +
+                                                        str(self.ConnectTimeout) + ' seconds') from None
+
+    async def get_client_async(self, key=None) -> WebsocketAppClient:
+        """
+        Returns the connection a message is routed to
+
+        :param key: Optional routing key. Messages with equal keys are routed to the same connection, waiting for it
+        to be replaced if it is closed. Without a key, the open connection with the fewest requests in flight
+        :return: WebsocketAppClient object
+        :raises WebsocketAppConnectionClosedException: No connection became available within the connect timeout
+        """
+        if key is not None:
+            index = hash(key) % self.Size
+            while True:
+                client = self.Clients[index]
+                if client is None:
+                    await self.wait_available_async(self.SlotReady[index])
+                elif client.Closed:
+                    # Removed from the pool once its read loop ends
+                    await asyncio.wait((client.ProcessMessageTask,))
+                else:
+                    return client
+
+        while True:
+            best = None
+            best_in_flight = 0
+            closed = []
+            for client in self.Clients:
+                if client is None:
+                    continue
+                if client.Closed:
+                    closed.append(client.ProcessMessageTask)
+                    continue
+                in_flight = len(client.CorIdMessageMap or ()) + len(client.StreamReceivers or ())
+                if best is None or in_flight < best_in_flight:
+                    best = client
+                    best_in_flight = in_flight
+            if best is not None:
+                return best
+            if closed:
+                await asyncio.wait(closed, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await self.wait_available_async(self.Available)
+
+    async def execute_obj_async(self, msg_name, obj, timeout: float = None, response_type=None,
+                                key=None) -> WebsocketAppMessage:
+        """
+        Sends a request object on a pool connection and waits for and returns the response message.
+        See WebsocketAppClient.execute_obj_async
+
+        :param key: Optional routing key, see get_client_async
+        :return: Response WebsocketAppMessage object
+        """
+        client = await self.get_client_async(key)
+        return await client.execute_obj_async(msg_name, obj, timeout, response_type)
+
+    async def execute_many_async(self, msg_name, objs, timeout: float = None, response_type=None,
+                                 key=None) -> list:
+        """
+        Sends many request objects in one batch frame on a pool connection and returns the responses.
+        See WebsocketAppClient.execute_many_async
+
+        :param key: Optional routing key, see get_client_async
+        :return: List of response WebsocketAppMessage objects or WebsocketAppRemoteException objects
+        """
+        client = await self.get_client_async(key)
+        return await client.execute_many_async(msg_name, objs, timeout, response_type)
+
+    async def send_obj_async(self, msg_name, obj, key=None):
+        """
+        Sends a custom object as a one-way message on a pool connection. See WebsocketAppClient.send_obj_async
+
+        :param key: Optional routing key, see get_client_async
+        :return: Void
+        """
+        client = await self.get_client_async(key)
+        await client.send_obj_async(msg_name, obj)
+
+    async def stream_obj_async(self, msg_name, obj, credit: int = 16, timeout: float = None, response_type=None,
+                               key=None):
+        """
+        Sends a stream request object on a pool connection and yields the streamed messages.
+        See WebsocketAppClient.stream_obj_async
+
+        :param key: Optional routing key, see get_client_async
+        :return: Async iterator of StreamData WebsocketAppMessage objects
+        """
+        client = await self.get_client_async(key)
+        async for msg in client.stream_obj_async(msg_name, obj, credit, timeout, response_type):
+            yield msg
+
+    async def disconnect(self, reason: str):
+        """
+        Closes all the connections of the pool, without replacing them
+
+        :param reason: Disconnect reason string
+        :return: Void
+        """
+        self.Closed = True
+        for task in self.Tasks:
+            task.cancel()
+        await asyncio.gather(*[client.disconnect(reason) for client in self.Clients if client is not None],
+                             return_exceptions=True)
@@ -0,0 +1,178 @@
+from .app_types import *
+
+
+class MessageRoute(object):
+    """
+    Registration of a message handler: the handler and its options, and its pipeline, the handler wrapped by the
+    middlewares applying to the route, composed once when the route or a middleware is registered
+    """
+    __slots__ = ('Name', 'Handler', 'OrderKey', 'PayloadType', 'Executor', 'Pipeline')
+
+    def __init__(self, name: str, handler, order_key=None, payload_type=None, executor=None):
+        """
+        Create a new MessageRoute object
+        :param name: Message name, or prefix pattern ending with '*'
+        :param handler: Handler function/method
+        :param order_key: Optional order key, see WebsocketAppClient.add_message_handler
+        :param payload_type: Optional payload type
+        :param executor: Optional HandlerExecutor object
+        """
+        self.Name = name
+        self.Handler = handler
+        self.OrderKey = order_key
+        self.PayloadType = payload_type
+        self.Executor = executor
+        self.Pipeline = None
+
+
+def match_route_name(pattern: str, name) -> bool:
+    """
+    Tells whether a message name matches a route or middleware name pattern
+
+    :param pattern: Message name, or prefix pattern ending with '*', e.g. 'orders.*', '*' matching every name
+    :param name: Message name
+    :return: True if the name matches
+    """
+    if pattern.endswith('*'):
+        return isinstance(name, str) and name.startswith(pattern[:-1])
+    return pattern == name
+
+
+class WebsocketAppRouter(object):
+    """
+    Routes received messages to their handlers. Routes are registered for a message name, or for a name prefix
+    ending with '*'; exact names take precedence over prefixes, and longer prefixes over shorter ones.
+    Middlewares are factories called once per route when it is compiled, with the next step of the pipeline and the
+    route, and returning the coroutine function the messages of the route go through:
+
+        def require_login(next_async, route):
+            async def middleware_async(client, msg):
+                if client.State.get('User') is None:
+                    raise PermissionError('Not logged in')
+                await next_async(client, msg)
+            return middleware_async
+
+    so handling a message is a single lookup and a chain of calls, with no allocation per middleware.
+    """
+    # Resolved names beyond this limit are not cached, so peers sending random names cannot grow the cache
+    MaxCachedNames = 10000
+
+    def __init__(self):
+        self.Routes = {}
+        self.PrefixRoutes = []
+        self.Middlewares = []
+        # Routes resolved by name, including the names matching a prefix route or no route (None)
+        self.Cache = {}
+        # Optional AdmissionController, checking the messages on the read loop before they are dispatched
+        self.Admission = None
+
+    def add_route(self, name: str, handler, order_key=None, payload_type=None, executor=None) -> MessageRoute:
+        """
+        Registers the handler of a message name or name prefix, replacing any handler of the same name
+
+        :param name: Message name, or prefix pattern ending with '*'
+        :param handler: Handler function/method
+        :param order_key: Optional order key, see WebsocketAppClient.add_message_handler
+        :param payload_type: Optional payload type
+        :param executor: Optional HandlerExecutor object
+        :return: MessageRoute object
+        """
+        route = MessageRoute(name, handler, order_key, payload_type, executor)
+        if isinstance(name, str) and name.endswith('*'):
+            self.PrefixRoutes = [prefix_route for prefix_route in self.PrefixRoutes if prefix_route.Name != name]
+            self.PrefixRoutes.append(route)
+            self.PrefixRoutes.sort(key=lambda prefix_route: len(prefix_route.Name), reverse=True)
+        else:
+            self.Routes[name] = route
+        self.compile_route(route)
+        self.Cache.clear()
+        return route
+
+    def remove_route(self, name: str):
+        """
+        Removes the handler of a message name or name prefix
+
+        :param name: Message name, or prefix pattern ending with '*'
+        :return: Void
+        """
+        self.Routes.pop(name, None)
+        self.PrefixRoutes = [prefix_route for prefix_route in self.PrefixRoutes if prefix_route.Name != name]
+        self.Cache.clear()
+
+    def add_middleware(self, middleware, names=None):
+        """
+        Adds a middleware to the pipelines of the routes, and recompiles them. Middlewares added first run first
+
+        :param middleware: Middleware factory, taking the next step of the pipeline and the MessageRoute, and
+        returning a coroutine function taking the client connection and the message
+        :param names: Optional list of message names and prefix patterns the middleware applies to, all by default.
+        Names are matched against the route names
+        :return: Void
+        """
+        self.Middlewares.append((middleware, None if names is None else tuple(names)))
+        for route in self.get_routes():
+            self.compile_route(route)
+
+    def get_routes(self) -> list:
+        """
+        Returns all the registered routes
+
+        :return: List of MessageRoute objects
+        """
+        return list(self.Routes.values()) + self.PrefixRoutes
+
+    def compile_route(self, route: MessageRoute):
+        """
+        Composes the pipeline of a route: its middlewares around the invocation of its handler
+
+        :param route: MessageRoute object
+        :return: Void
+        """
+        handler = route.Handler
+        executor = route.Executor
+        payload_type = route.PayloadType
+
+        if executor is None:
+            async def invoke_async(client, msg):
+                if msg.MessageType == WebsocketAppMessageType.StreamRequest:
+                    client.start_stream(msg, handler)
+                else:
+                    await client.invoke_message_handler_async(handler, msg)
+        else:
+            async def invoke_async(client, msg):
+                if msg.MessageType == WebsocketAppMessageType.StreamRequest:
+                    # Executor handlers return a single response, the requester is told rather than left waiting
+                    await client.send_error_response_async(msg, 'Message {} does not support streaming'.format(msg.Name))
+                else:
+                    await client.invoke_executor_handler_async(executor, handler, msg, payload_type)
+
+        pipeline = invoke_async
+        for middleware, names in reversed(self.Middlewares):
+            if names is None or any(match_route_name(pattern, route.Name) for pattern in names):
+                pipeline = middleware(pipeline, route)
+        route.Pipeline = pipeline
+
+    def get_route(self, name):
+        """
+        Returns the route of a message name
+
+        :param name: Message name
+        :return: MessageRoute object, or None if no route matches the name
+        """
+        try:
+            return self.Cache[name]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable names sent by peers match no route
+            return None
+
+        route = self.Routes.get(name)
+        if route is None:
+            for prefix_route in self.PrefixRoutes:
+                if match_route_name(prefix_route.Name, name):
+                    route = prefix_route
+                    break
+        if len(self.Cache) < self.MaxCachedNames:
+            self.Cache[name] = route
+        return route
@@ -1,4 +1,7 @@
+import uuid
+
 from .app_client import *
+from .app_workers import *
 
 
 class WebsocketAppServer(object):
@@ -6,9 +9,71 @@ class WebsocketAppServer(object):
     Class representing the websocket app server.
     Inherit from this class to build your websocket app server
     """
-    def __init__(self, port: int):
+    def __init__(self, port: int, codecs=DEFAULT_CODECS, max_concurrency: int = None, log_sample_rate: int = 1,
+                 log_max_payload: int = 256, metrics_port: int = None, request_timeout: float = None,
+                 slow_consumer_bytes: int = 65536, conflation_max_keys: int = 10000,
+                 send_queue: SendQueueOptions = None, session_timeout: float = None,
+                 session_replay_buffer: int = 10000, session_ack_interval: int = 32,
+                 transport: TransportOptions = None, admission: AdmissionOptions = None):
+        """
+        Create a new WebsocketAppServer object
+
+        :param port: Port to listen on
+        :param codecs: Codec names accepted from the clients, in the order of preference.
+        Clients that do not negotiate a codec are talked to with the jsonpickle compatibility codec
+        Pass BINARY_CODECS to prefer the binary wire format
+        :param max_concurrency: Maximum number of message handlers running at a time on each client connection.
+        None handles the messages of a connection one after the other. Messages received on a connection while as
+        many handlers again are waiting to run are refused, see WebsocketAppClient
+        :param log_sample_rate: Log one in every log_sample_rate frames across all connections, when DEBUG is
+        enabled on the WebsocketsAppLibrary.frames logger
+        :param log_max_payload: Maximum number of characters logged per frame. None logs whole frames
+        :param metrics_port: Optional side port serving the metrics in the Prometheus text format over HTTP
+        :param request_timeout: Default timeout in seconds of execute_async calls made to the clients
+        :param slow_consumer_bytes: Published and broadcast messages are skipped for clients with more than this
+        number of bytes waiting in their send queue and send buffer
+        :param conflation_max_keys: Maximum number of conflation keys pending on each client connection
+        :param send_queue: Optional SendQueueOptions of the client connections, see WebsocketAppClient
+        :param session_timeout: Seconds the session of a lost client connection is kept for the client to resume it,
+        see ReconnectOptions. Meanwhile the connection stays registered and subscribed to its topics, and the messages
+        sent to it are kept for replay. None disables sessions. Sessions are kept by the process that opened them, so
+        they are only resumed by a single process server, see run_workers
+        :param session_replay_buffer: Maximum number of unacknowledged messages kept for replay per session
+        :param session_ack_interval: Number of messages received in a session after which they are acknowledged
+        :param transport: Optional TransportOptions of the client connections: compression, frame size, queue and
+        buffer limits. None uses the defaults of the websockets library
+        :param admission: Optional AdmissionOptions: rate limits per connection and message name, and caps on the
+        handlers and background tasks in flight. Refused requests get an error response with a retry after hint
+        """
+        self.SendQueueOptions = send_queue
+        self.SessionTimeout = session_timeout
+        self.SessionReplayBuffer = session_replay_buffer
+        self.SessionAckInterval = session_ack_interval
+        # Sessions by session id, in this process only: a worker of a multi-process server cannot resume the sessions
+        # opened on other workers
+        self.Sessions = {}
+        # Set in the worker processes of a multi-process server, see run_workers
+        self.WorkerIndex = None
+        self.WorkerCount = 1
+        self.Bus = None
+        self.ConflationMaxKeys = conflation_max_keys
+        self.Connections = {}
+        self.ConnectionIdCounter = itertools.count(1)
+        self.TopicSubscribers = {}
+        self.SlowConsumerBytes = slow_consumer_bytes
+        self.RequestTimeout = request_timeout
+        self.Metrics = MetricsRegistry()
+        self.Transport = transport
+        self.PayloadCompression = None if transport is None else transport.create_payload_compression(self.Metrics)
+        self.MetricsPort = metrics_port
+        self.FrameLogger = FrameLogger('Server', log_sample_rate, log_max_payload)
         self.Port = port
-        self.MessageHandlerMap = {}
+        check_codecs(codecs)
+        self.Codecs = codecs
+        self.MaxConcurrency = max_concurrency
+        self.Router = WebsocketAppRouter()
+        self.Admission = None if admission is None else AdmissionController(admission)
+        self.Router.Admission = self.Admission
 
     async def handler_async(self, websocket):
         """
@@ -18,8 +83,316 @@ class WebsocketAppServer(object):
         :return: Void
         """
         client = WebsocketAppClientHandler(websocket, self)
-        await self.on_new_connection_async(client)
-        await client.initialize_async()
+        self.Connections[client.ConnectionId] = client
+        try:
+            await self.on_new_connection_async(client)
+            await client.initialize_async()
+        finally:
+            if client.Session is not None and client.Session.Owner is client:
+                self.detach_session(client.Session)
+            else:
+                self.remove_connection(client)
+
+    def remove_connection(self, client):
+        """
+        Removes a closed client connection from the connection registry and from all its topics
+
+        :param client: WebsocketAppClientHandler object
+        :return: Void
+        """
+        if self.Connections.get(client.ConnectionId) is client:
+            del self.Connections[client.ConnectionId]
+        for topic in list(client.Topics or ()):
+            self.unsubscribe(client, topic)
+
+    async def open_session_async(self, client, msg: WebsocketAppMessage):
+        """
+        Handles the session handshake request of a client connection: resumes the session it names if all the
+        messages the client did not receive can be replayed, or opens a new session.
+        A resumed session moves the connection id, topics and streams of the replaced connection to the new one, and
+        the messages sent to the replaced connection since the client last received one are replayed
+
+        :param client: WebsocketAppClientHandler object
+        :param msg: Session handshake request WebsocketAppMessage object
+        :return: Void
+        """
+        data = msg.Data if isinstance(msg.Data, dict) else {}
+        received = data.get('Received', 0)
+        session = self.Sessions.get(data.get('SessionId'))
+        resumed = session is not None and session.Owner is not None and session.can_replay(received)
+        if session is not None and not resumed:
+            logger.warning('Session %s cannot be resumed, its replay buffer overflowed', session.SessionId)
+            self.expire_session(session)
+
+        if resumed:
+            if session.ExpiryHandle is not None:
+                session.ExpiryHandle.cancel()
+                session.ExpiryHandle = None
+            # Until the replay completes, the messages sent in the session are only kept for replay
+            session.Client = None
+            self.transfer_connection(session.Owner, client)
+        else:
+            session = WebsocketAppSession(uuid.uuid4().hex, self.SessionReplayBuffer, self.SessionAckInterval)
+            self.Sessions[session.SessionId] = session
+        session.Owner = client
+        session.Receiver = client
+        client.Session = session
+
+        await client.write_frame_async(client.Codec.encode(WebsocketAppMessage(
+            msg.Name, WebsocketAppMessageType.Response, msg.CorId, None, None,
+            {'SessionId': session.SessionId, 'Resumed': resumed, 'Received': session.Received})))
+        if resumed:
+            await client.replay_session_async(session, received)
+        else:
+            session.Client = client
+
+    def transfer_connection(self, old_client, client):
+        """
+        Moves the connection id, state, topic subscriptions, handlers, streams and background tasks of a connection
+        replaced by a resumed session
+
+        :param old_client: Replaced WebsocketAppClientHandler object
+        :param client: WebsocketAppClientHandler object resuming the session
+        :return: Void
+        """
+        if self.Connections.get(client.ConnectionId) is client:
+            del self.Connections[client.ConnectionId]
+        client.ConnectionId = old_client.ConnectionId
+        self.Connections[client.ConnectionId] = client
+        client._state = old_client._state
+        for topic in list(old_client.Topics or ()):
+            self.unsubscribe(old_client, topic)
+            self.subscribe(client, topic)
+        # Running handlers and background tasks keep sending through the replaced connection, redirected to the
+        # session. They are moved, so closing the replaced connection does not cancel them
+        client.Dispatcher = old_client.Dispatcher
+        old_client.Dispatcher = None
+        client.BackgroundTasks = old_client.BackgroundTasks
+        old_client.BackgroundTasks = None
+        client.StreamSenders = old_client.StreamSenders
+        old_client.StreamSenders = None
+        for sender in (client.StreamSenders or {}).values():
+            sender.Client = client
+        if not old_client.Closed:
+            asyncio.create_task(old_client.disconnect('Session resumed'))
+
+    def detach_session(self, session: WebsocketAppSession):
+        """
+        Keeps the session of a lost connection for SessionTimeout seconds, for its client to resume it
+
+        :param session: WebsocketAppSession object
+        :return: Void
+        """
+        session.Client = None
+        session.Receiver = None
+        session.ExpiryHandle = asyncio.get_running_loop().call_later(self.SessionTimeout, self.expire_session, session)
+
+    def expire_session(self, session: WebsocketAppSession):
+        """
+        Drops a session, and removes its connection if it is closed
+
+        :param session: WebsocketAppSession object
+        :return: Void
+        """
+        if session.ExpiryHandle is not None:
+            session.ExpiryHandle.cancel()
+            session.ExpiryHandle = None
+        if self.Sessions.get(session.SessionId) is session:
+            del self.Sessions[session.SessionId]
+        session.Replay.clear()
+
+        client = session.Owner
+        session.Owner = None
+        session.Client = None
+        if client is not None:
+            client.Session = None
+            if client.Closed:
+                client.cancel_tasks()
+                self.remove_connection(client)
+
+    def get_connection(self, connection_id: int):
+        """
+        Returns a connected client by its connection id
+
+        :param connection_id: ConnectionId of the client
+        :return: WebsocketAppClientHandler object, or None if the client is not connected
+        """
+        return self.Connections.get(connection_id)
+
+    def subscribe(self, client, topic):
+        """
+        Subscribes a client connection to a topic, e.g. a symbol like NSE:INFY
+
+        :param client: WebsocketAppClientHandler object
+        :param topic: Topic string
+        :return: Void
+        """
+        if client.Closed:
+            return
+        self.TopicSubscribers.setdefault(topic, set()).add(client)
+        if client.Topics is None:
+            client.Topics = set()
+        client.Topics.add(topic)
+
+    def unsubscribe(self, client, topic):
+        """
+        Unsubscribes a client connection from a topic
+
+        :param client: WebsocketAppClientHandler object
+        :param topic: Topic string
+        :return: Void
+        """
+        subscribers = self.TopicSubscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self.TopicSubscribers[topic]
+        if client.Topics is not None:
+            client.Topics.discard(topic)
+
+    async def publish_async(self, topic, msg_name, obj, conflation_key=None) -> int:
+        """
+        Sends a custom object as a one-way message to all the clients subscribed to a topic.
+        The message is encoded once per codec and queued on the send queue of every subscriber, without waiting
+        for any of them to drain. Subscribers with more than SlowConsumerBytes waiting in their send queue and send
+        buffer are skipped, and counted as dropped.
+        With a conflation key, the message is instead queued in the conflation slot of the message name and key
+        of every subscriber (see WebsocketAppClient.send_conflated), so slow subscribers get the latest value
+        and the publisher never waits for a send.
+
+        :param topic: Topic string
+        :param msg_name: Message name string
+        :param obj: Custom object to send
+        :param conflation_key: Optional conflation key, e.g. the order Id or Symbol
+        :return: Number of clients of this process the message was sent or queued to. On a multi-process server
+        the message is also posted to the other workers
+        """
+        if self.Bus is not None:
+            self.Bus.post((BusPublish, topic, msg_name, obj, conflation_key))
+        return await self.publish_local_async(topic, msg_name, obj, conflation_key)
+
+    async def publish_local_async(self, topic, msg_name, obj, conflation_key=None) -> int:
+        """
+        Sends a custom object to the clients of this process subscribed to a topic, see publish_async
+
+        :param topic: Topic string
+        :param msg_name: Message name string
+        :param obj: Custom object to send
+        :param conflation_key: Optional conflation key
+        :return: Number of clients the message was sent or queued to
+        """
+        subscribers = self.TopicSubscribers.get(topic)
+        if not subscribers:
+            return 0
+        return await self.fan_out_async(list(subscribers), WebsocketAppMessage(
+            msg_name, WebsocketAppMessageType.Oneway, None, None, None, obj), conflation_key)
+
+    async def broadcast_async(self, msg_name, obj) -> int:
+        """
+        Sends a custom object as a one-way message to all the connected clients, the same way as publish_async
+
+        :param msg_name: Message name string
+        :param obj: Custom object to send
+        :return: Number of clients of this process the message was sent to. On a multi-process server the message is
+        also posted to the other workers
+        """
+        if self.Bus is not None:
+            self.Bus.post((BusBroadcast, msg_name, obj))
+        return await self.broadcast_local_async(msg_name, obj)
+
+    async def broadcast_local_async(self, msg_name, obj) -> int:
+        """
+        Sends a custom object to all the clients of this process, see broadcast_async
+
+        :param msg_name: Message name string
+        :param obj: Custom object to send
+        :return: Number of clients the message was sent to
+        """
+        return await self.fan_out_async(list(self.Connections.values()), WebsocketAppMessage(
+            msg_name, WebsocketAppMessageType.Oneway, None, None, None, obj))
+
+    async def send_to_connection_async(self, connection_id: int, msg_name, obj) -> bool:
+        """
+        Sends a custom object as a one-way message to a client by its connection id. On a multi-process server,
+        clients connected to another worker are reached through the inter-worker bus
+
+        :param connection_id: ConnectionId of the client
+        :param msg_name: Message name string
+        :param obj: Custom object to send
+        :return: False if the client is not connected. True if the message was sent, or posted to another worker
+        """
+        if self.Bus is not None and self.get_connection_worker(connection_id) != self.WorkerIndex:
+            self.Bus.post((BusSend, connection_id, msg_name, obj))
+            return True
+        return await self.send_to_local_connection_async(connection_id, msg_name, obj)
+
+    async def send_to_local_connection_async(self, connection_id: int, msg_name, obj) -> bool:
+        """
+        Sends a custom object as a one-way message to a client of this process, see send_to_connection_async
+
+        :param connection_id: ConnectionId of the client
+        :param msg_name: Message name string
+        :param obj: Custom object to send
+        :return: False if the client is not connected
+        """
+        client = self.get_connection(connection_id)
+        if client is None or (client.Closed and client.Session is None):
+            return False
+        await client.send_obj_async(msg_name, obj)
+        return True
+
+    def get_connection_worker(self, connection_id: int) -> int:
+        """
+        Returns the index of the worker process a connection id belongs to
+
+        :param connection_id: ConnectionId of a client
+        :return: Worker index
+        """
+        return (connection_id - 1) % self.WorkerCount
+
+    async def fan_out_async(self, clients, websocket_message: WebsocketAppMessage, conflation_key=None) -> int:
+        """
+        Sends a websocket app message to many clients, encoding it once per codec type
+
+        :param clients: List of WebsocketAppClientHandler objects
+        :param websocket_message: WebsocketAppMessage object
+        :param conflation_key: Optional conflation key, queues the message in the conflation slots of the clients
+        :return: Number of clients the message was sent or queued to
+        """
+        metrics = self.Metrics.get_message_metrics(websocket_message.Name)
+        frames = {}
+        queued = 0
+        for client in clients:
+            # Closed connections with a session keep the messages for replay
+            if client.Codec is None or (client.Closed and client.Session is None):
+                continue
+            if conflation_key is None and MetricsRegistry.get_send_queue_size(client) > self.SlowConsumerBytes:
+                metrics.Dropped += 1
+                continue
+
+            codec_type = type(client.Codec)
+            frame = frames.get(codec_type)
+            if frame is None:
+                start = time.perf_counter_ns()
+                frame = client.Codec.encode_shared(websocket_message)
+                metrics.Encode.record(time.perf_counter_ns() - start)
+                frames[codec_type] = frame
+
+            if conflation_key is not None:
+                if client.put_conflated_frame((websocket_message.Name, conflation_key), frame):
+                    queued += 1
+                continue
+
+            # Queued without waiting, so a client that does not drain cannot hold up the publisher
+            if client.put_frame(frame):
+                metrics.Sent += 1
+                metrics.BytesOut += len(frame)
+                queued += 1
+            else:
+                metrics.Dropped += 1
+        # Lets the send queue writers run, so a publisher sending in a loop does not fill the queues of fast clients
+        await asyncio.sleep(0)
+        return queued
 
     async def initialize_async(self):
         """
@@ -27,18 +400,115 @@ class WebsocketAppServer(object):
 
         :return: Void
         """
-        async with websockets.serve(self.handler_async, "", self.Port):
+        if self.MetricsPort is not None:
+            await self.Metrics.start_http_server_async(self.MetricsPort)
+
+        async with websockets.serve(self.handler_async, "", self.Port, **self.get_serve_options()):
             await asyncio.Future()  # run forever
 
-    def add_message_handler(self, name, handler):
+    def get_serve_options(self) -> dict:
+        """
+        Returns the keyword arguments of websockets.serve, besides the handler, host and port
+
+        :return: Dictionary of options
+        """
+        options = {'subprotocols': list(self.Codecs) or None}
+        if self.Transport is not None:
+            options.update(self.Transport.get_websocket_options(self.Metrics, True))
+        return options
+
+    def run_workers(self, workers: int, reuse_port: bool = True):
+        """
+        Runs the websocket app server in several worker processes on the same port, to use several CPU cores.
+        The worker processes are forked from this one and each runs its own event loop. Blocks until SIGINT/SIGTERM.
+        publish_async, broadcast_async and send_to_connection_async reach the clients of all the workers through an
+        inter-worker bus, and the metrics port serves the metrics of all the workers. Call instead of
+        initialize_async, outside of any event loop, on a platform supporting fork.
+        Sessions are not shared between the workers: a reconnecting client reaches any worker, which opens a new
+        session when it does not have the previous one, so the messages pending replay are lost
+
+        :param workers: Number of worker processes
+        :param reuse_port: Bind the port in every worker with SO_REUSEPORT, so the kernel balances the connections.
+        Otherwise, or if SO_REUSEPORT is not supported, the workers accept on a listening socket shared by this process
+        :return: Void
+        """
+        if self.SessionTimeout is not None and workers > 1:
+            logger.warning('Sessions are only resumed on the worker that opened them, with %d workers most '
+                           'reconnecting clients start a new session', workers)
+        WorkerSupervisor(self, workers, reuse_port).run()
+
+    async def run_worker_async(self, index: int, workers: int, bus_socket, listen_socket):
+        """
+        Runs a worker process of a multi-process server, see run_workers
+
+        :param index: Index of the worker
+        :param workers: Number of workers
+        :param bus_socket: Worker end of the inter-worker bus socket pair
+        :param listen_socket: Listening socket shared by the workers, None to bind the port with SO_REUSEPORT
+        :return: Void
+        """
+        self.WorkerIndex = index
+        self.WorkerCount = workers
+        # Connection ids are unique across the workers, and tell the worker of a connection
+        self.ConnectionIdCounter = itertools.count(index + 1, workers)
+        self.Bus = WorkerBus(self, bus_socket)
+        await self.Bus.connect_async()
+
+        if listen_socket is None:
+            serve = websockets.serve(self.handler_async, "", self.Port, reuse_port=True, **self.get_serve_options())
+        else:
+            serve = websockets.serve(self.handler_async, sock=listen_socket, **self.get_serve_options())
+
+        async with serve:
+            self.Bus.post((BusReady, index))
+            await self.Bus.run_async()
+
+    def get_metrics_snapshot(self, include_connections: bool = False) -> dict:
+        """
+        Returns the current metrics of the server: per message name counters and latency histograms
+        (decode, handler, encode, round trip), in flight requests, bytes in/out and send queue sizes
+
+        :param include_connections: Include the gauges of every client connection
+        :return: Dictionary of metrics
+        """
+        return self.Metrics.snapshot(include_connections)
+
+    def add_message_handler(self, name, handler, order_key=None, payload_type=None, executor=None):
         """
         Add a message handler method/function to a message name
 
-        :param name: Message name string
-        :param handler: Handler function/method to handle this message
+        :param name: Message name string, or name prefix ending with '*' (e.g. 'orders.*') to handle the messages
+        starting with the prefix and without a handler of their own
+        :param handler: Handler function/method to handle this message. Messages requested with stream_obj_async
+        are handled by a stream handler instead, an async generator function/method yielding the objects to stream
+        :param order_key: Used with concurrent dispatch. Messages of this name with equal order keys are handled
+        in order on a connection. Either a function taking the message and returning its key (e.g. the order symbol),
+        or a constant to handle all messages of this name in order
+        :param payload_type: Optional payload type (see websocket_app_payload). The message Data is decoded into this
+        type before the order key and the handler are called
+        :param executor: Optional HandlerExecutorType, or HandlerExecutor object, to run a CPU bound handler on a
+        thread or process pool instead of the event loop. Such a handler is a plain function taking the message
+        payload, decoded into payload_type in the pool, and returning the response object of requests.
+        Process pool handlers must be picklable, e.g. module level functions
+        :return: Void
+        """
+        if executor is not None:
+            executor = get_handler_executor(executor)
+            self.Metrics.add_executor(executor)
+        self.Router.add_route(name, handler, order_key, payload_type, executor)
+
+    def add_middleware(self, middleware, names=None):
+        """
+        Add a middleware around the message handlers of every connection. The middleware chain of each handler is
+        composed when the handler or a middleware is added, not per message. See WebsocketAppRouter
+
+        :param middleware: Middleware factory, taking the next step of the pipeline and the MessageRoute of the
+        handler, and returning a coroutine function taking the client connection and the message
+        :param names: Optional list of message names and name prefixes ending with '*' the middleware applies to,
+        all handlers by default
         :return: Void
         """
-        self.MessageHandlerMap[name] = handler
+        self.Router.add_middleware(middleware, names)
 
     async def on_new_connection_async(self, client):
         """
@@ -59,12 +529,23 @@ class WebsocketAppServer(object):
 
 class WebsocketAppClientHandler(WebsocketAppClient):
     """
-
+    Class representing a client connection on the websocket app server.
+    Message handlers, logging and metrics are shared with the server, so an idle connection only carries its own
+    connection state.
     """
+    __slots__ = ('Server', 'ConnectionId', 'Topics')
+
     def __init__(self, websocket, server: WebsocketAppServer):
-        WebsocketAppClient.__init__(self)
+        WebsocketAppClient.__init__(self, server.MaxConcurrency, request_timeout=server.RequestTimeout,
+                                    frame_logger=server.FrameLogger, metrics=server.Metrics,
+                                    conflation_max_keys=server.ConflationMaxKeys,
+                                    send_queue=server.SendQueueOptions, router=server.Router)
         self.Server = server
+        self.ConnectionId = next(server.ConnectionIdCounter)
+        self.Topics = None
         self.Websocket = websocket
+        self.Transport = server.Transport
+        self.PayloadCompression = server.PayloadCompression
 
     async def initialize_async(self):
         await self.attach_async(self.Websocket)
@@ -72,29 +553,17 @@ class WebsocketAppClientHandler(WebsocketAppClient):
     async def on_connection_closed_async(self):
         await self.Server.on_connection_closed_async(self)
 
-    async def handle_message_async(self, message):
-        print('WebsocketsApp Side: ' + message)
+    async def invoke_message_handler_async(self, handler, msg: WebsocketAppMessage):
+        await handler(self, msg)
 
-        msg_dict = jsonpickle.decode(message)
-        msg = WebsocketAppMessage(**msg_dict)
+    def invoke_stream_handler(self, handler, msg: WebsocketAppMessage):
+        return handler(self, msg)
 
-        if msg.Name in self.Server.MessageHandlerMap:
-            handler = self.Server.MessageHandlerMap[msg.Name]
-        else:
-            handler = None
-
-        if handler is None:
-            if msg.MessageType == WebsocketAppMessageType.Request:
-                msg.MessageType = WebsocketAppMessageType.Response
-                msg.JsonData = ""
-                await self.send_async(msg)
-            else:
-                if msg.MessageType == WebsocketAppMessageType.Response or \
-                        msg.MessageType == WebsocketAppMessageType.ErrorResponse:
-                    if msg.CorId in self.CorIdMessageMap:
-                        async_waiter = self.CorIdMessageMap[msg.CorId]
-                        async_waiter.Message = msg
-                        del self.CorIdMessageMap[msg.CorId]
-                        async_waiter.WaiterEvent.set()
-        else:
-            await handler(self, msg)
+    async def handle_session_message_async(self, msg: WebsocketAppMessage) -> bool:
+        if msg.Name == SessionMessageName and msg.MessageType == WebsocketAppMessageType.Request:
+            if self.Server.SessionTimeout is None:
+                # Handled as a request without handler, telling the client sessions are not supported
+                return False
+            await self.Server.open_session_async(self, msg)
+            return True
+        return await WebsocketAppClient.handle_session_message_async(self, msg)
@@ -0,0 +1,160 @@
+import collections
+import itertools
+import random
+
+from .app_types import *
+
+
+# Names of the session control messages, handled by the library and not counted in the session
+SessionMessageName = '__session'
+SessionAckMessageName = '__ack'
+SessionMessageNames = frozenset((SessionMessageName, SessionAckMessageName))
+
+
+class ReconnectOptions(object):
+    """
+    Options of a reconnecting websocket app client, see WebsocketAppClient
+    """
+    def __init__(self, initial_delay: float = 0.5, max_delay: float = 30, multiplier: float = 2,
+                 max_attempts: int = None, replay_buffer: int = 10000, ack_interval: int = 32,
+                 handshake_timeout: float = 10):
+        """
+        Create a new ReconnectOptions object
+        :param initial_delay: Upper bound in seconds of the delay before the first reconnect attempt
+        :param max_delay: Maximum upper bound in seconds of the delay between reconnect attempts
+        :param multiplier: Factor applied to the upper bound of the delay on every failed attempt
+        :param max_attempts: Attempts after which the client gives up and closes, None retries forever
+        :param replay_buffer: Maximum number of sent messages kept until the server acknowledges them
+        :param ack_interval: Number of received messages after which the client acknowledges them
+        :param handshake_timeout: Seconds to wait for the server to answer the session handshake
+        """
+        self.InitialDelay = initial_delay
+        self.MaxDelay = max_delay
+        self.Multiplier = multiplier
+        self.MaxAttempts = max_attempts
+        self.ReplayBuffer = replay_buffer
+        self.AckInterval = ack_interval
+        self.HandshakeTimeout = handshake_timeout
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        Returns the delay before a reconnect attempt, with full jitter: a random delay up to an exponentially growing
+        bound, so the clients dropped together do not reconnect together
+
+        :param attempt: Number of failed attempts so far
+        :return: Delay in seconds
+        """
+        return random.uniform(0, min(self.MaxDelay, self.InitialDelay * self.Multiplier ** attempt))
+
+
+class WebsocketAppSession(object):
+    """
+    State of a resumable session, outliving its connections: the count of messages received, and the sent messages
+    not yet acknowledged by the other party, in a bounded replay buffer.
+    Both parties count the messages sent and received in the session, excluding the session control messages, so
+    when a connection is replaced, each party replays the messages the other did not receive, in order.
+    """
+    __slots__ = ('SessionId', 'MaxReplay', 'AckInterval', 'Sent', 'Received', 'Acknowledged', 'Replay', 'Client',
+                 'Receiver', 'Owner', 'ExpiryHandle')
+
+    def __init__(self, session_id: str, max_replay: int = 10000, ack_interval: int = 32):
+        """
+        Create a new WebsocketAppSession object
+        :param session_id: Session id string
+        :param max_replay: Maximum number of unacknowledged sent messages kept for replay
+        :param ack_interval: Number of received messages after which they are acknowledged
+        """
+        self.SessionId = session_id
+        self.MaxReplay = max_replay
+        self.AckInterval = ack_interval
+        self.Sent = 0
+        self.Received = 0
+        self.Acknowledged = 0
+        self.Replay = collections.deque()
+        # Connection the session messages are written to, None while the session waits to be resumed
+        self.Client = None
+        # Connection the session messages are counted on
+        self.Receiver = None
+        # Server side, the connection registered for the session, see WebsocketAppServer
+        self.Owner = None
+        self.ExpiryHandle = None
+
+    def record_sent(self, entry):
+        """
+        Counts a sent message and keeps it for replay
+
+        :param entry: WebsocketAppMessage object, or a frame encoded with encode_shared
+        :return: Void
+        """
+        self.Sent += 1
+        self.Replay.append(entry)
+        if len(self.Replay) > self.MaxReplay:
+            self.Replay.popleft()
+
+    def record_received(self) -> bool:
+        """
+        Counts a received message
+
+        :return: True if the received messages must be acknowledged now
+        """
+        self.Received += 1
+        if self.Received - self.Acknowledged >= self.AckInterval:
+            self.Acknowledged = self.Received
+            return True
+        return False
+
+    def acknowledge(self, received: int):
+        """
+        Drops the sent messages the other party acknowledged from the replay buffer
+
+        :param received: Number of session messages received by the other party
+        :return: Void
+        """
+        first = self.Sent - len(self.Replay)
+        for i in range(min(received - first, len(self.Replay))):
+            self.Replay.popleft()
+
+    def can_replay(self, received: int) -> bool:
+        """
+        Tells whether all the messages the other party did not receive are still in the replay buffer
+
+        :param received: Number of session messages received by the other party
+        :return: True if the session can be resumed without losing messages
+        """
+        return self.Sent - len(self.Replay) <= received <= self.Sent
+
+    def get_replay(self, received: int) -> list:
+        """
+        Returns the messages to replay to the other party
+
+        :param received: Number of session messages received by the other party
+        :return: List of WebsocketAppMessage objects and frames, in the order they were sent
+        """
+        first = self.Sent - len(self.Replay)
+        return list(itertools.islice(self.Replay, max(received - first, 0), None))
+
+    async def send_async(self, websocket_message: WebsocketAppMessage):
+        """
+        Sends a message of a replaced connection on the current connection of the session, or only keeps it for
+        replay while the session waits to be resumed
+
+        :param websocket_message: WebsocketAppMessage object
+        :return: Void
+        """
+        if self.Client is None:
+            self.record_sent(websocket_message)
+        else:
+            await self.Client.send_async(websocket_message)
+
+    async def send_frame_async(self, frame, msg_name=None):
+        """
+        Sends a frame encoded with encode_shared the same way as send_async
+
+        :param frame: Frame data
+        :param msg_name: Message name of the frame
+        :return: Void
+        """
+        if self.Client is None:
+            self.record_sent(frame)
+        else:
+            await self.Client.send_frame_async(frame, msg_name)
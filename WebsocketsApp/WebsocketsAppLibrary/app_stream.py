@@ -0,0 +1,124 @@
+import collections
+
+from websockets.exceptions import WebSocketException
+
+from .app_logging import *
+from .app_types import *
+
+
+class StreamReceiver(object):
+    """
+    Requester side of a streamed response: the messages received for a StreamRequest, waiting to be consumed by
+    stream_obj_async. At most the granted credit of StreamData messages is queued.
+    """
+    __slots__ = ('Messages', 'Ready')
+
+    def __init__(self):
+        self.Messages = collections.deque()
+        self.Ready = asyncio.Event()
+
+    def put(self, msg):
+        """
+        Queues a received message, or an exception failing the stream
+
+        :param msg: StreamData, StreamEnd or ErrorResponse WebsocketAppMessage object, or an exception
+        :return: Void
+        """
+        self.Messages.append(msg)
+        self.Ready.set()
+
+    async def get_async(self, timeout: float = None):
+        """
+        Returns the next queued message, waiting for it if none is queued
+
+        :param timeout: Timeout in seconds, None waits until a message is received
+        :return: WebsocketAppMessage object, or an exception failing the stream
+        :raises asyncio.TimeoutError: No message within the timeout
+        """
+        while not self.Messages:
+            self.Ready.clear()
+            if timeout is None:
+                await self.Ready.wait()
+            else:
+                await asyncio.wait_for(self.Ready.wait(), timeout)
+        return self.Messages.popleft()
+
+
+class StreamSender(object):
+    """
+    Responder side of a streamed response. Runs the stream handler, an async generator, in its own task and sends
+    every chunk it yields as a StreamData message. The handler is only resumed while the requester has granted credit,
+    so a slow requester holds back the handler instead of growing the send buffers.
+    """
+    __slots__ = ('Client', 'Request', 'Credit', 'CreditAvailable', 'Task')
+
+    def __init__(self, client, request: WebsocketAppMessage):
+        """
+        Create a new StreamSender object
+        :param client: WebsocketAppClient object the StreamRequest was received on
+        :param request: StreamRequest WebsocketAppMessage object
+        """
+        self.Client = client
+        self.Request = request
+        self.Credit = 0
+        self.CreditAvailable = asyncio.Event()
+        self.Task = None
+
+    def add_credit(self, credit):
+        """
+        Grants credit for more StreamData messages, or cancels the stream for a credit of 0
+
+        :param credit: Number of messages
+        :return: Void
+        """
+        if not credit:
+            if self.Task is not None:
+                self.Task.cancel()
+            return
+        self.Credit += credit
+        self.CreditAvailable.set()
+
+    async def run_async(self, handler):
+        """
+        Sends the chunks yielded by the stream handler, then a StreamEnd message. An exception raised by the handler
+        is sent as an ErrorResponse message
+
+        :param handler: Stream handler function/method, None for names without a handler, which send an empty stream
+        :return: Void
+        """
+        request = self.Request
+        chunks = None
+        try:
+            if handler is not None:
+                chunks = self.Client.invoke_stream_handler(handler, request)
+                while True:
+                    while self.Credit <= 0:
+                        self.CreditAvailable.clear()
+                        await self.CreditAvailable.wait()
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    self.Credit -= 1
+                    await self.Client.send_async(WebsocketAppMessage(
+                        request.Name, WebsocketAppMessageType.StreamData, request.CorId, None, None, chunk))
+
+            await self.Client.send_async(WebsocketAppMessage(
+                request.Name, WebsocketAppMessageType.StreamEnd, request.CorId, None, None, None))
+        except asyncio.CancelledError:
+            # Cancelled by the requester, or the connection is closed
+            pass
+        except (WebSocketException, WebsocketAppConnectionClosedException):
+            pass
+        except Exception as e:
+            logger.exception('Stream handler of %s failed', request.Name)
+            self.Client.Metrics.get_message_metrics(request.Name).Errors += 1
+            try:
+                await self.Client.send_error_response_async(request, str(e))
+            except (WebSocketException, WebsocketAppConnectionClosedException):
+                pass
+        finally:
+            if chunks is not None:
+                await chunks.aclose()
+            if self.Client.StreamSenders is not None:
+                self.Client.StreamSenders.pop(request.CorId, None)
@@ -0,0 +1,171 @@
+import time
+
+from websockets import frames
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory, PerMessageDeflate, \
+    ServerPerMessageDeflateFactory
+
+from .app_codec import *
+from .app_metrics import *
+
+
+class TransportOptions(object):
+    """
+    Options of the websocket connections of a websocket app server or client: permessage-deflate compression,
+    compression of the binary codec payloads, and the frame size, queue and buffer limits of the websockets library
+    """
+    def __init__(self, compression: str = 'deflate', compression_threshold: int = 256, compression_level: int = 6,
+                 max_window_bits: int = None, payload_compression_threshold: int = None,
+                 payload_compression_level: int = 6, zdict: bytes = DEFAULT_ZDICT, max_size: int = 2 ** 20,
+                 max_queue: int = 32, write_limit: int = 2 ** 16, ping_interval: float = 20,
+                 ping_timeout: float = 20):
+        """
+        Create a new TransportOptions object
+        :param compression: 'deflate' to negotiate permessage-deflate, None to disable it
+        :param compression_threshold: Messages smaller than this number of bytes are sent uncompressed by
+        permessage-deflate, as compressing them costs more CPU than it saves bandwidth
+        :param compression_level: zlib level of permessage-deflate, 1 (fastest) to 9 (smallest)
+        :param max_window_bits: Optional zlib window size of permessage-deflate, 8 to 15. Smaller windows use less
+        memory per connection and compress less
+        :param payload_compression_threshold: Payloads of the binary codecs of at least this number of bytes are zlib
+        compressed with the zdict preset dictionary, see PayloadCompression. None disables it. Use it instead of
+        permessage-deflate, e.g. with peers or proxies that do not support it
+        :param payload_compression_level: zlib level of the payload compression
+        :param zdict: Preset dictionary of the payload compression, the same for both parties, see build_zdict
+        :param max_size: Maximum size in bytes of a received message, also of a decompressed payload
+        :param max_queue: Maximum number of received messages buffered before the websockets library stops reading
+        :param write_limit: High water mark in bytes of the websocket write buffer
+        :param ping_interval: Seconds between keepalive pings, None disables them
+        :param ping_timeout: Seconds to wait for a keepalive pong before closing the connection
+        """
+        if compression not in ('deflate', None):
+            raise ValueError('Unsupported compression ' + str(compression))
+        self.Compression = compression
+        self.CompressionThreshold = compression_threshold
+        self.CompressionLevel = compression_level
+        self.MaxWindowBits = max_window_bits
+        self.PayloadCompressionThreshold = payload_compression_threshold
+        self.PayloadCompressionLevel = payload_compression_level
+        self.ZDict = zdict
+        self.MaxSize = max_size
+        self.MaxQueue = max_queue
+        self.WriteLimit = write_limit
+        self.PingInterval = ping_interval
+        self.PingTimeout = ping_timeout
+
+    def get_websocket_options(self, metrics: MetricsRegistry, server: bool) -> dict:
+        """
+        Returns the keyword arguments of websockets.serve or websockets.connect
+
+        :param metrics: MetricsRegistry recording the permessage-deflate metrics
+        :param server: True for websockets.serve, False for websockets.connect
+        :return: Dictionary of options
+        """
+        options = {
+            'max_size': self.MaxSize,
+            'max_queue': self.MaxQueue,
+            'write_limit': self.WriteLimit,
+            'ping_interval': self.PingInterval,
+            'ping_timeout': self.PingTimeout,
+            'compression': None
+        }
+        if self.Compression == 'deflate':
+            factory_type = MeteredServerDeflateFactory if server else MeteredClientDeflateFactory
+            options['extensions'] = [factory_type(self, metrics.get_compression_metrics('permessage_deflate'))]
+        return options
+
+    def create_payload_compression(self, metrics: MetricsRegistry) -> PayloadCompression:
+        """
+        Returns the payload compression of the binary codecs
+
+        :param metrics: MetricsRegistry recording the payload compression metrics
+        :return: PayloadCompression object, shared by the connections. None if payload compression is disabled and
+        the default dictionary is used, payloads of peers are then decompressed by the codec default
+        """
+        if self.PayloadCompressionThreshold is None and self.ZDict == DEFAULT_ZDICT:
+            return None
+        return PayloadCompression(self.PayloadCompressionThreshold, self.PayloadCompressionLevel, self.ZDict,
+                                  self.MaxSize, metrics.get_compression_metrics('payload'))
+
+
+class MeteredPerMessageDeflate(PerMessageDeflate):
+    """
+    permessage-deflate extension sending messages under a size threshold uncompressed, which the protocol allows
+    per message, and recording the compression ratio and CPU time
+    """
+    def __init__(self, extension: PerMessageDeflate, threshold: int, metrics: CompressionMetrics):
+        """
+        Create a new MeteredPerMessageDeflate object
+        :param extension: PerMessageDeflate object negotiated by the websockets library
+        :param threshold: Minimum message size in bytes to compress
+        :param metrics: CompressionMetrics object
+        """
+        PerMessageDeflate.__init__(self, extension.remote_no_context_takeover, extension.local_no_context_takeover,
+                                   extension.remote_max_window_bits, extension.local_max_window_bits,
+                                   extension.compress_settings)
+        self.Threshold = threshold
+        self.Metrics = metrics
+
+    def encode(self, frame: frames.Frame) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+        # Only whole messages are skipped, the continuation frames of a compressed message must be compressed
+        if frame.fin and frame.opcode is not frames.OP_CONT and len(frame.data) < self.Threshold:
+            self.Metrics.Skipped += 1
+            return frame
+
+        start = time.perf_counter_ns()
+        encoded = PerMessageDeflate.encode(self, frame)
+        self.Metrics.record_compress(len(frame.data), len(encoded.data), time.perf_counter_ns() - start)
+        return encoded
+
+    def decode(self, frame: frames.Frame, *, max_size: int = None) -> frames.Frame:
+        if not frame.rsv1 and not (frame.opcode is frames.OP_CONT and self.decode_cont_data):
+            return PerMessageDeflate.decode(self, frame, max_size=max_size)
+
+        start = time.perf_counter_ns()
+        decoded = PerMessageDeflate.decode(self, frame, max_size=max_size)
+        self.Metrics.record_decompress(time.perf_counter_ns() - start)
+        return decoded
+
+
+def get_deflate_settings(options: TransportOptions) -> dict:
+    """
+    Returns the keyword arguments of the permessage-deflate extension factories
+
+    :param options: TransportOptions object
+    :return: Dictionary of factory arguments
+    """
+    # memLevel 5 is the default of the websockets library, trading a little compression for memory per connection
+    return {'server_max_window_bits': options.MaxWindowBits,
+            'compress_settings': {'memLevel': 5, 'level': options.CompressionLevel}}
+
+
+class MeteredServerDeflateFactory(ServerPerMessageDeflateFactory):
+    """
+    Server side permessage-deflate factory negotiating MeteredPerMessageDeflate extensions
+    """
+    def __init__(self, options: TransportOptions, metrics: CompressionMetrics):
+        ServerPerMessageDeflateFactory.__init__(self, client_max_window_bits=options.MaxWindowBits,
+                                                **get_deflate_settings(options))
+        self.Threshold = options.CompressionThreshold
+        self.Metrics = metrics
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = ServerPerMessageDeflateFactory.process_request_params(
+            self, params, accepted_extensions)
+        return response_params, MeteredPerMessageDeflate(extension, self.Threshold, self.Metrics)
+
+
+class MeteredClientDeflateFactory(ClientPerMessageDeflateFactory):
+    """
+    Client side permessage-deflate factory negotiating MeteredPerMessageDeflate extensions
+    """
+    def __init__(self, options: TransportOptions, metrics: CompressionMetrics):
+        ClientPerMessageDeflateFactory.__init__(self, client_max_window_bits=options.MaxWindowBits or True,
+                                                **get_deflate_settings(options))
+        self.Threshold = options.CompressionThreshold
+        self.Metrics = metrics
+
+    def process_response_params(self, params, accepted_extensions):
+        extension = ClientPerMessageDeflateFactory.process_response_params(self, params, accepted_extensions)
+        return MeteredPerMessageDeflate(extension, self.Threshold, self.Metrics)
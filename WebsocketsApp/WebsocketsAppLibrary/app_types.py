@@ -1,37 +1,118 @@
 import asyncio
+import functools
+import threading
+import jsonpickle
 from collections import namedtuple
 
+from .app_payload import *
+
+
+@functools.lru_cache(maxsize=1024)
+def get_namedtuple_type(name, fields):
+    """
+    Returns the namedtuple class for a property name and its nested keys, created once per distinct key set
+    :param name: Property name
+    :param fields: Tuple of the nested keys
+    :return: namedtuple class
+    """
+    return namedtuple(name, fields)
+
 
 def fill_obj(obj, **kwargs):
     """
-    Fills a custom object with the properties available in the kwargs
+    Fills a custom object with the properties available in the kwargs.
+    Prefer websocket_app_payload classes for message payloads, which are decoded without this reflection
     :param obj: Object to be filled
     :param kwargs: kwargs with the properties
     :return: Void
     """
     for a in kwargs:
         if type(kwargs[a]) is dict:
-            obj_inner = namedtuple(a, kwargs[a].keys())(*kwargs[a].values())
+            obj_inner = get_namedtuple_type(a, tuple(kwargs[a].keys()))(*kwargs[a].values())
             setattr(obj, a, obj_inner)
         else:
             setattr(obj, a, kwargs[a])
 
 
 class ThreadSafeCounter(object):
-    def __init__(self):
-        self.value = 0
-        self._lock = asyncio.Lock()
+    """
+    Correlation id counter for clients sending messages from several threads.
+    Clients used from their event loop only use itertools.count, which needs no lock.
+    """
+    def __init__(self, start: int = 1):
+        self.value = start - 1
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
 
-    async def increment_async(self):
-        async with self._lock:
+    def __next__(self) -> int:
+        with self._lock:
             self.value += 1
-            return str(self.value)
+            return self.value
 
 
-class AsyncWaiter(object):
-    def __init__(self):
-        self.WaiterEvent = asyncio.Event()
-        self.Message = None
+class WebsocketAppException(Exception):
+    """
+    Base class of the exceptions raised by the websocket app library
+    """
+    pass
+
+
+class WebsocketAppRemoteException(WebsocketAppException):
+    """
+    Raised when the remote party responds to a request with an error response
+    """
+    def __init__(self, error, response_message=None):
+        WebsocketAppException.__init__(self, error)
+        self.Error = error
+        self.ResponseMessage = response_message
+
+
+class WebsocketAppOverloadedException(WebsocketAppRemoteException):
+    """
+    Raised when the remote party refuses a request by admission control, because a rate limit is exceeded or it is
+    overloaded. The request can be retried after RetryAfter seconds
+    """
+    def __init__(self, error, response_message=None, retry_after: float = None):
+        WebsocketAppRemoteException.__init__(self, error, response_message)
+        self.RetryAfter = retry_after
+
+
+def get_remote_exception(response_message) -> WebsocketAppRemoteException:
+    """
+    Returns the exception to raise for an error response
+
+    :param response_message: ErrorResponse WebsocketAppMessage object
+    :return: WebsocketAppOverloadedException if the error response carries a retry after hint,
+    WebsocketAppRemoteException otherwise
+    """
+    data = response_message.Data
+    if isinstance(data, dict) and 'RetryAfter' in data:
+        return WebsocketAppOverloadedException(response_message.Error, response_message, data['RetryAfter'])
+    return WebsocketAppRemoteException(response_message.Error, response_message)
+
+
+class WebsocketAppTimeoutException(WebsocketAppException):
+    """
+    Raised when the remote party does not respond to a request within the request timeout
+    """
+    pass
+
+
+class WebsocketAppConnectionClosedException(WebsocketAppException):
+    """
+    Raised for requests that are pending, or started, when the connection is closed
+    """
+    pass
+
+
+class WebsocketAppProtocolException(WebsocketAppException):
+    """
+    Raised when a frame received from the remote party cannot be decoded. The connection is then closed with the
+    protocol error close code
+    """
+    pass
 
 
 class WebsocketAppMessageType:
@@ -39,6 +120,13 @@ class WebsocketAppMessageType:
     Response = 'Response'
     Oneway = 'Oneway'
     ErrorResponse = 'ErrorResponse'
+    # Streamed responses, see WebsocketAppClient.stream_obj_async. The responder sends StreamData messages with the
+    # CorId of the StreamRequest, as long as the requester granted credit with StreamCredit messages, then a
+    # StreamEnd message, or an ErrorResponse message if the stream fails. A StreamCredit of 0 cancels the stream
+    StreamRequest = 'StreamRequest'
+    StreamData = 'StreamData'
+    StreamEnd = 'StreamEnd'
+    StreamCredit = 'StreamCredit'
 
 
 class WebsocketAppError(object):
@@ -52,20 +140,61 @@ class WebsocketAppMessage(object):
     """
     Object used for communication between websocket app server and client
     """
-    def __init__(self, name=None, message_type=None, cor_id=None, json_data=None, error=None, **kwargs):
+    __slots__ = ('Name', 'MessageType', 'CorId', 'Error', '_json_data', '_data')
+
+    def __init__(self, name=None, message_type=None, cor_id=None, json_data=None, error=None, data=None, **kwargs):
         """
         Create a new WebsocketAppMessage object
         :param name: Name of the message
         :param message_type: Message type -> WebsocketAppMessageType
-        :param cor_id: Correlation id, in case of request or response message type
+        :param cor_id: Integer correlation id, in case of request or response message type
         :param json_data: JSON data of the message that is being exchanged between app server and client
         :param error: Any error response from remote party, in case of errors while processing a request message
+        :param data: Payload object of the message, used instead of json_data by the single pass codecs
+        :param kwargs: Message properties by their names (Name, MessageType, CorId, JsonData, Data, Error),
+        used when name is not given
         """
-        if name is None:
-            fill_obj(self, **kwargs)
-        else:
-            self.Name = name
-            self.MessageType: WebsocketAppMessageType = message_type
-            self.CorId = cor_id
-            self.JsonData = json_data
-            self.Error: WebsocketAppError = error
+        if name is None and kwargs:
+            name = kwargs.get('Name')
+            message_type = kwargs.get('MessageType')
+            cor_id = kwargs.get('CorId')
+            json_data = kwargs.get('JsonData')
+            error = kwargs.get('Error')
+            data = kwargs.get('Data')
+
+        self._json_data = json_data
+        self._data = data
+        self.Name = name
+        self.MessageType: WebsocketAppMessageType = message_type
+        self.CorId = cor_id
+        self.Error: WebsocketAppError = error
+
+    @property
+    def JsonData(self):
+        """
+        Payload of the message as a JSON string. Encoded from Data on first access, if the message was created
+        with a payload object
+        """
+        if self._json_data is None and self._data is not None:
+            self._json_data = jsonpickle.encode(self._data, False)
+        return self._json_data
+
+    @JsonData.setter
+    def JsonData(self, value):
+        self._json_data = value
+        self._data = None
+
+    @property
+    def Data(self):
+        """
+        Payload of the message as a python object. Decoded from JsonData on first access, if the message was
+        received as a JSON string
+        """
+        if self._data is None and self._json_data:
+            self._data = jsonpickle.decode(self._json_data)
+        return self._data
+
+    @Data.setter
+    def Data(self, value):
+        self._data = value
+        self._json_data = None
@@ -0,0 +1,319 @@
+import itertools
+import multiprocessing
+import pickle
+import signal
+import socket
+import struct
+
+from .app_logging import *
+from .app_metrics import *
+from .app_types import *
+
+
+# Bus messages are tuples, the first item being one of these kinds
+BusPublish = 'publish'
+BusBroadcast = 'broadcast'
+BusSend = 'send'
+BusReady = 'ready'
+BusMetricsRequest = 'metrics_request'
+BusMetrics = 'metrics'
+BusStop = 'stop'
+
+BusLength = struct.Struct('!I')
+
+
+def write_bus_message(writer: asyncio.StreamWriter, message: tuple):
+    """
+    Writes a message on an inter-worker bus connection, as a length prefixed pickle
+
+    :param writer: Stream writer of the bus connection
+    :param message: Message tuple
+    :return: Void
+    """
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    writer.write(BusLength.pack(len(data)) + data)
+
+
+async def read_bus_message_async(reader: asyncio.StreamReader):
+    """
+    Reads a message from an inter-worker bus connection
+
+    :param reader: Stream reader of the bus connection
+    :return: Message tuple, or None when the other side closed the connection
+    """
+    try:
+        length, = BusLength.unpack(await reader.readexactly(BusLength.size))
+        return pickle.loads(await reader.readexactly(length))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+class WorkerBus(object):
+    """
+    Connection of a worker process to the inter-worker bus of its supervisor. Publish, broadcast and send to
+    connection calls of the worker are posted on the bus, and the supervisor relays them to the other workers.
+    """
+    def __init__(self, server, bus_socket: socket.socket):
+        """
+        Create a new WorkerBus object
+        :param server: WebsocketAppServer object of the worker
+        :param bus_socket: Worker end of the socket pair connected to the supervisor
+        """
+        self.Server = server
+        self.Socket = bus_socket
+        self.Reader = None
+        self.Writer = None
+
+    async def connect_async(self):
+        """
+        Opens the bus connection
+
+        :return: Void
+        """
+        self.Reader, self.Writer = await asyncio.open_connection(sock=self.Socket)
+
+    def post(self, message: tuple):
+        """
+        Posts a message to the supervisor
+
+        :param message: Message tuple
+        :return: Void
+        """
+        write_bus_message(self.Writer, message)
+
+    async def run_async(self):
+        """
+        Handles the messages relayed by the supervisor until it stops the worker or exits
+
+        :return: Void
+        """
+        while True:
+            message = await read_bus_message_async(self.Reader)
+            if message is None or message[0] == BusStop:
+                return
+
+            try:
+                if message[0] == BusPublish:
+                    await self.Server.publish_local_async(*message[1:])
+                elif message[0] == BusBroadcast:
+                    await self.Server.broadcast_local_async(*message[1:])
+                elif message[0] == BusSend:
+                    await self.Server.send_to_local_connection_async(*message[1:])
+                elif message[0] == BusMetricsRequest:
+                    self.post((BusMetrics, message[1], self.Server.Metrics.export_state()))
+            except Exception:
+                logger.exception('Inter-worker bus message %s failed', message[0])
+
+
+def run_worker(server, index: int, workers: int, bus_socket: socket.socket, listen_socket: socket.socket,
+               inherited_sockets):
+    """
+    Entry point of a forked worker process
+
+    :param server: WebsocketAppServer object, inherited from the supervisor
+    :param index: Index of the worker
+    :param workers: Number of workers
+    :param bus_socket: Worker end of the bus socket pair
+    :param listen_socket: Listening socket shared by all the workers, None to bind the port with SO_REUSEPORT
+    :param inherited_sockets: Sockets of the supervisor inherited through the fork, closed here
+    :return: Void
+    """
+    # The supervisor handles Ctrl+C and stops the workers through the bus
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for inherited_socket in inherited_sockets:
+        inherited_socket.close()
+    asyncio.run(server.run_worker_async(index, workers, bus_socket, listen_socket))
+
+
+class WorkerMetricsRegistry(MetricsRegistry):
+    """
+    Metrics served by the supervisor: the metrics of all the workers, collected over the bus on every scrape
+    """
+    def __init__(self, supervisor):
+        MetricsRegistry.__init__(self)
+        self.Supervisor = supervisor
+
+    async def prometheus_text_async(self) -> str:
+        registry = MetricsRegistry()
+        for index, state in enumerate(await self.Supervisor.collect_metrics_async()):
+            registry.merge_state(state, 'worker' + str(index) + '.')
+        return registry.prometheus_text()
+
+
+class WorkerSupervisor(object):
+    """
+    Parent process of a multi-process websocket app server. Forks the worker processes, each running the server
+    on the same port, relays the inter-worker bus messages between them, serves the aggregated metrics, and stops
+    the workers on SIGINT/SIGTERM.
+    """
+    def __init__(self, server, workers: int, reuse_port: bool = True, start_timeout: float = 30,
+                 stop_timeout: float = 10):
+        """
+        Create a new WorkerSupervisor object
+        :param server: WebsocketAppServer object, forked into the workers
+        :param workers: Number of worker processes
+        :param reuse_port: Bind the port in every worker with SO_REUSEPORT, so the kernel balances the connections.
+        Otherwise the supervisor binds the port and the workers accept on the shared listening socket
+        :param start_timeout: Seconds to wait for all the workers to start serving
+        :param stop_timeout: Seconds to wait for the workers to close their connections on stop, before killing them
+        """
+        self.Server = server
+        self.WorkerCount = workers
+        self.ReusePort = reuse_port and hasattr(socket, 'SO_REUSEPORT')
+        self.StartTimeout = start_timeout
+        self.StopTimeout = stop_timeout
+        self.Processes = []
+        self.Writers = []
+        self.Ready = None
+        self.AllReady = None
+        self.Running = 0
+        self.Stopping = None
+        self.MetricsRequestIds = itertools.count(1)
+        self.MetricsRequests = {}
+
+    def run(self):
+        """
+        Starts the workers and supervises them until SIGINT/SIGTERM or until all of them exit
+
+        :return: Void
+        """
+        context = multiprocessing.get_context('fork')
+        listen_socket = None
+        if not self.ReusePort:
+            listen_socket = socket.create_server(('', self.Server.Port), backlog=1024)
+            listen_socket.setblocking(False)
+
+        bus_sockets = []
+        for index in range(self.WorkerCount):
+            bus_socket, worker_bus_socket = socket.socketpair()
+            process = context.Process(target=run_worker, name='wsapp-worker-' + str(index), args=(
+                self.Server, index, self.WorkerCount, worker_bus_socket, listen_socket, bus_sockets + [bus_socket]))
+            process.start()
+            worker_bus_socket.close()
+            bus_sockets.append(bus_socket)
+            self.Processes.append(process)
+
+        if listen_socket is not None:
+            listen_socket.close()
+
+        asyncio.run(self.run_async(bus_sockets))
+
+    async def run_async(self, bus_sockets):
+        """
+        Relays the bus messages of the workers, until stopped
+
+        :param bus_sockets: Supervisor ends of the bus socket pairs, by worker index
+        :return: Void
+        """
+        loop = asyncio.get_running_loop()
+        self.Ready = set()
+        self.AllReady = asyncio.Event()
+        self.Stopping = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.Stopping.set)
+
+        readers = []
+        for bus_socket in bus_sockets:
+            reader, writer = await asyncio.open_connection(sock=bus_socket)
+            readers.append(reader)
+            self.Writers.append(writer)
+        self.Running = len(readers)
+        tasks = [asyncio.create_task(self.relay_async(index, reader)) for index, reader in enumerate(readers)]
+
+        if self.Server.MetricsPort is not None:
+            await WorkerMetricsRegistry(self).start_http_server_async(self.Server.MetricsPort)
+
+        try:
+            await asyncio.wait_for(self.AllReady.wait(), self.StartTimeout)
+            logger.info('%d websocket app workers serving on port %d', self.WorkerCount, self.Server.Port)
+        except asyncio.TimeoutError:
+            logger.error('Only %d of %d websocket app workers started', len(self.Ready), self.WorkerCount)
+
+        await self.Stopping.wait()
+        logger.info('Stopping the websocket app workers')
+        for writer in self.Writers:
+            if not writer.is_closing():
+                write_bus_message(writer, (BusStop,))
+
+        for process in self.Processes:
+            await loop.run_in_executor(None, process.join, self.StopTimeout)
+            if process.is_alive():
+                logger.warning('Killing websocket app worker %s', process.name)
+                process.kill()
+                await loop.run_in_executor(None, process.join)
+
+        for task in tasks:
+            task.cancel()
+        for writer in self.Writers:
+            writer.close()
+
+    async def relay_async(self, index: int, reader: asyncio.StreamReader):
+        """
+        Handles the bus messages of a worker, relaying publish, broadcast and send to connection calls
+
+        :param index: Index of the worker
+        :param reader: Stream reader of the worker bus connection
+        :return: Void
+        """
+        while True:
+            message = await read_bus_message_async(reader)
+            if message is None:
+                break
+
+            if message[0] == BusReady:
+                self.Ready.add(index)
+                if len(self.Ready) == self.WorkerCount:
+                    self.AllReady.set()
+            elif message[0] == BusMetrics:
+                future = self.MetricsRequests.get(message[1])
+                if future is not None and not future.done():
+                    future.set_result(message[2])
+            elif message[0] == BusSend:
+                # Connection ids are assigned round robin, see WebsocketAppServer.run_worker_async
+                self.post((message[1] - 1) % self.WorkerCount, message)
+            else:
+                for other in range(len(self.Writers)):
+                    if other != index:
+                        self.post(other, message)
+
+        if not self.Stopping.is_set():
+            logger.error('Websocket app worker %d exited', index)
+        self.Running -= 1
+        if self.Running == 0:
+            self.Stopping.set()
+
+    def post(self, index: int, message: tuple):
+        """
+        Posts a message to a worker
+
+        :param index: Index of the worker
+        :param message: Message tuple
+        :return: Void
+        """
+        writer = self.Writers[index]
+        if not writer.is_closing():
+            write_bus_message(writer, message)
+
+    async def collect_metrics_async(self, timeout: float = 5) -> list:
+        """
+        Requests the metrics of all the workers
+
+        :param timeout: Seconds to wait for the workers to answer
+        :return: List of the metrics states of the workers that answered, see MetricsRegistry.export_state
+        """
+        if not self.Writers:
+            return []
+
+        request_id = next(self.MetricsRequestIds)
+        futures = []
+        for index in range(len(self.Writers)):
+            future = asyncio.get_running_loop().create_future()
+            self.MetricsRequests[(request_id, index)] = future
+            futures.append(future)
+            self.post(index, (BusMetricsRequest, (request_id, index)))
+        try:
+            await asyncio.wait(futures, timeout=timeout)
+        finally:
+            for index in range(len(self.Writers)):
+                self.MetricsRequests.pop((request_id, index), None)
+        return [future.result() for future in futures if future.done()]
@@ -7,13 +7,15 @@ async def run_client():
 
     client = TradingAppClient()
     await client.connect_async('ws://localhost:8080')
+    place_order_requests = []
     for i in range(100):
         place_order_request = PlaceOrderRequest()
         place_order_request.Symbol = "INFY"
         place_order_request.Market = "NSE"
         place_order_request.Quantity = i + 99
         place_order_request.Price = (i + 99) * 100
-        await client.place_order_async(place_order_request)
+        place_order_requests.append(place_order_request)
+    await client.place_orders_async(place_order_requests)
 
     # Sleep for a few seconds, until the server sends back order execution status
     await asyncio.sleep(10)
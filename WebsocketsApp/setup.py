@@ -4,6 +4,7 @@ setup(
     name='WebsocketsAppLibrary',
     version='1.0.0',
     packages=['WebsocketsAppLibrary'],
+    extras_require={'msgpack': ['msgpack~=1.0']},
     url='',
     license='',
     author='Adityanand Pasumarthi',
@@ -0,0 +1,61 @@
+import asyncio
+import time
+import unittest
+
+import websockets
+
+from WebsocketsAppLibrary.app_server import *
+
+
+class ServerTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case running websocket app servers on free ports of the loopback interface, closed with their clients at the
+    end of each test
+    """
+    async def start_server_async(self, server: WebsocketAppServer) -> str:
+        """
+        Starts serving a websocket app server until the end of the test
+
+        :param server: WebsocketAppServer object
+        :return: Url of the server
+        """
+        serve = await websockets.serve(server.handler_async, '127.0.0.1', 0, **server.get_serve_options())
+        self.addAsyncCleanup(self.stop_server_async, serve)
+        return 'ws://127.0.0.1:' + str(serve.sockets[0].getsockname()[1])
+
+    async def stop_server_async(self, serve):
+        serve.close()
+        await serve.wait_closed()
+
+    async def connect_async(self, url: str, client: WebsocketAppClient = None, codecs=DEFAULT_CODECS) -> \
+            WebsocketAppClient:
+        """
+        Connects a client until the end of the test
+
+        :param url: Url of the server
+        :param client: Optional WebsocketAppClient object, a new one by default
+        :param codecs: Codec names offered to the server
+        :return: Connected WebsocketAppClient object
+        """
+        client = client or WebsocketAppClient()
+        await client.connect_async(url, codecs)
+        self.addAsyncCleanup(self.disconnect_async, client)
+        return client
+
+    async def disconnect_async(self, client: WebsocketAppClient):
+        if not client.Closed:
+            await client.disconnect('Test done')
+
+    async def wait_for_async(self, condition, timeout: float = 5):
+        """
+        Waits until a condition is met
+
+        :param condition: Function returning True once the condition is met
+        :param timeout: Seconds before the test fails
+        :return: Void
+        """
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('Condition not met within ' + str(timeout) + ' seconds')
+            await asyncio.sleep(0.01)
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+
+from tests.support import *
+
+
+class AdmissionServer(WebsocketAppServer):
+    def __init__(self, admission: AdmissionOptions, max_concurrency: int = 16):
+        WebsocketAppServer.__init__(self, 0, max_concurrency=max_concurrency, admission=admission)
+        self.Handled = 0
+        self.add_message_handler('echo', self.echo_handler_async)
+        self.add_message_handler('slow', self.slow_handler_async)
+        self.add_message_handler('rows', self.rows_handler_async)
+
+    async def echo_handler_async(self, client, msg):
+        self.Handled += 1
+        await client.send_response_obj_async(msg, msg.Data)
+
+    async def slow_handler_async(self, client, msg):
+        self.Handled += 1
+        await asyncio.sleep(0.3)
+        await client.send_response_obj_async(msg, msg.Data)
+
+    async def rows_handler_async(self, client, msg):
+        for i in range(3):
+            await asyncio.sleep(0.2)
+            yield i
+
+
+async def get_outcome_async(call) -> str:
+    try:
+        await call
+        return 'ok'
+    except WebsocketAppOverloadedException as e:
+        return 'refused' if e.RetryAfter > 0 else 'no retry after'
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_bucket_refills_at_its_rate(self):
+        bucket = TokenBucket(RateLimit(10, 2), 0.0)
+        self.assertEqual(bucket.get_wait(0.0), 0.0)
+        bucket.Tokens = 0
+        self.assertAlmostEqual(bucket.get_wait(0.0), 0.1)
+        self.assertEqual(bucket.get_wait(0.1), 0.0)
+        self.assertEqual(bucket.get_wait(10.0), 0.0)
+        self.assertEqual(bucket.Tokens, 2)
+
+
+class AdmissionTests(ServerTestCase):
+    async def test_requests_beyond_the_rate_limit_are_refused(self):
+        server = AdmissionServer(AdmissionOptions(name_limits={'echo': RateLimit(5)}))
+        client = await self.connect_async(await self.start_server_async(server))
+        outcomes = await asyncio.gather(*[get_outcome_async(client.execute_obj_async('echo', i, timeout=5))
+                                          for i in range(50)])
+        self.assertEqual(outcomes.count('ok'), server.Handled)
+        self.assertLessEqual(outcomes.count('ok'), 6)
+        self.assertEqual(outcomes.count('refused'), 50 - server.Handled)
+        self.assertEqual(server.Metrics.get_message_metrics('echo').Rejected, 50 - server.Handled)
+
+    async def test_refused_messages_are_not_dispatched(self):
+        server = AdmissionServer(AdmissionOptions(connection_limit=RateLimit(1)))
+        client = await self.connect_async(await self.start_server_async(server))
+        for i in range(200):
+            await client.send_obj_async('slow', i)
+        await asyncio.sleep(0.1)
+        connection = next(iter(server.Connections.values()))
+        self.assertEqual(len(connection.Dispatcher.Tasks), 1)
+        self.assertEqual(server.Metrics.get_message_metrics('slow').Rejected, 199)
+
+    async def test_requests_beyond_max_in_flight_are_refused(self):
+        server = AdmissionServer(AdmissionOptions(max_in_flight=2))
+        url = await self.start_server_async(server)
+        clients = [await self.connect_async(url) for i in range(2)]
+        outcomes = await asyncio.gather(*[get_outcome_async(client.execute_obj_async('slow', i, timeout=5))
+                                          for i in range(3) for client in clients])
+        self.assertEqual(outcomes.count('ok'), 2)
+        self.assertEqual(outcomes.count('refused'), 4)
+        await self.wait_for_async(lambda: server.Admission.InFlight == 0)
+
+    async def test_stream_senders_count_as_background_tasks(self):
+        server = AdmissionServer(AdmissionOptions(max_background_tasks=1))
+        client = await self.connect_async(await self.start_server_async(server))
+
+        async def stream_async():
+            return [msg.Data async for msg in client.stream_obj_async('rows', None, timeout=5)]
+
+        outcomes = await asyncio.gather(stream_async(), get_outcome_async(stream_async()),
+                                        get_outcome_async(client.execute_obj_async('echo', 1, timeout=5)))
+        self.assertEqual(outcomes, [[0, 1, 2], 'refused', 'refused'])
+        self.assertEqual(await get_outcome_async(client.execute_obj_async('echo', 2, timeout=5)), 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+
+from WebsocketsAppLibrary.app_codec import *
+from tests.support import *
+
+ORDER = {'Symbol': 'INFY', 'Market': 'NSE', 'Quantity': 3, 'Price': 100.5, 'Tags': ['day', 'limit'], 'Note': None}
+
+
+class CodecTests(unittest.TestCase):
+    def assert_same_message(self, decoded: WebsocketAppMessage, msg: WebsocketAppMessage):
+        self.assertEqual(decoded.Name, msg.Name)
+        self.assertEqual(decoded.MessageType, msg.MessageType)
+        self.assertEqual(decoded.CorId, msg.CorId)
+        self.assertEqual(decoded.Data, msg.Data)
+
+    def test_round_trip(self):
+        messages = [
+            WebsocketAppMessage('place_order', WebsocketAppMessageType.Request, 1, None, None, ORDER),
+            WebsocketAppMessage('place_order', WebsocketAppMessageType.Response, 1, None, None, {'Status': 'Open'}),
+            WebsocketAppMessage('order_status', WebsocketAppMessageType.Oneway, None, None, None, [1, 'two', 3.0]),
+            WebsocketAppMessage('quote', WebsocketAppMessageType.StreamData, 2 ** 40, None, None, 'text'),
+            WebsocketAppMessage('quote', WebsocketAppMessageType.StreamEnd, 2 ** 40, None, None, None)
+        ]
+        for name in sorted(CODECS):
+            with self.subTest(codec=name):
+                # Binary codecs intern the message names per connection, each party has its own codec object
+                encoder = CODECS[name].create()
+                decoder = CODECS[name].create()
+                for msg in messages + messages:
+                    self.assert_same_message(decoder.decode(encoder.encode(msg)), msg)
+
+    def test_error_response_round_trip(self):
+        msg = WebsocketAppMessage('place_order', WebsocketAppMessageType.ErrorResponse, 7, None, 'Rate limit exceeded',
+                                  {'RetryAfter': 0.5})
+        for name in sorted(CODECS):
+            with self.subTest(codec=name):
+                decoded = CODECS[name].create().decode(CODECS[name].create().encode(msg))
+                self.assert_same_message(decoded, msg)
+                self.assertEqual(decoded.Error, msg.Error)
+
+    def test_batch_round_trip(self):
+        messages = [WebsocketAppMessage('order_status', WebsocketAppMessageType.Oneway, None, None, None, {'Id': i})
+                    for i in range(5)]
+        for name in sorted(CODECS):
+            if not CODECS[name].SupportsBatch:
+                continue
+            with self.subTest(codec=name):
+                encoder = CODECS[name].create()
+                decoder = CODECS[name].create()
+                frame = encoder.encode_batch([encoder.encode(msg) for msg in messages])
+                self.assertTrue(decoder.is_batch(frame))
+                decoded = decoder.decode_batch(frame)
+                self.assertEqual(len(decoded), len(messages))
+                for decoded_msg, msg in zip(decoded, messages):
+                    self.assert_same_message(decoded_msg, msg)
+
+    def test_compressed_round_trip(self):
+        msg = WebsocketAppMessage('snapshot', WebsocketAppMessageType.Response, 3, None, None, [ORDER] * 50)
+        for name in sorted(CODECS):
+            if not CODECS[name].SupportsCompression:
+                continue
+            with self.subTest(codec=name):
+                encoder = CODECS[name].create()
+                encoder.Compression = PayloadCompression(threshold=64)
+                frame = encoder.encode(msg)
+                uncompressed = CODECS[name].create().encode(msg)
+                self.assertLess(len(frame), len(uncompressed))
+                self.assert_same_message(CODECS[name].create().decode(frame), msg)
+
+    def test_binary_codecs_fall_back_to_default_codecs(self):
+        self.assertEqual(BINARY_CODECS[-len(DEFAULT_CODECS):], DEFAULT_CODECS)
+        self.assertIn(BinaryCodec.Name, BINARY_CODECS)
+        self.assertEqual(MsgPackCodec.Name in BINARY_CODECS, msgpack is not None)
+
+    def test_malformed_frames_raise_protocol_errors(self):
+        header = BinaryCodec.Header
+        frames = {
+            'truncated header': b'\x00\x01',
+            'empty frame': b'',
+            'text frame': 'text',
+            'unknown name id': header.pack(0, 1, 7) + b'{}',
+            'truncated name': header.pack(BinaryCodec.NameDefinitionFlag, 1, 0) + b'\x00\x09ab',
+            'truncated error': header.pack(BinaryCodec.NameDefinitionFlag | BinaryCodec.ErrorFlag, 1, 0) +
+                               b'\x00\x01a\x00\x00\x00\x09',
+            'invalid payload': header.pack(BinaryCodec.NameDefinitionFlag, 1, 0) + b'\x00\x01a\xc1',
+            'invalid compressed payload': header.pack(BinaryCodec.NameDefinitionFlag | BinaryCodec.CompressedFlag, 1,
+                                                      0) + b'\x00\x01azz'
+        }
+        for name in (BinaryCodec.Name, MsgPackCodec.Name):
+            if name not in CODECS:
+                continue
+            for case, frame in frames.items():
+                with self.subTest(codec=name, case=case):
+                    codec = CODECS[name].create()
+                    with self.assertRaises(WebsocketAppProtocolException):
+                        if codec.is_batch(frame):
+                            codec.decode_batch(frame)
+                        else:
+                            codec.decode(frame)
+        with self.assertRaises(WebsocketAppProtocolException):
+            BinaryCodec.create().decode_batch(BinaryCodec.BatchHeader.pack(BinaryCodec.BatchFlag, 2) + b'\x00\x00')
+        for name in (JsonCodec.Name, JsonPickleCodec.Name):
+            for frame in ('{', '[]', '"text"'):
+                with self.subTest(codec=name, frame=frame), self.assertRaises(WebsocketAppProtocolException):
+                    CODECS[name].create().decode(frame)
+
+
+class MalformedFrameTests(ServerTestCase):
+    async def test_malformed_frame_closes_the_connection(self):
+        server = WebsocketAppServer(0, BINARY_CODECS)
+        url = await self.start_server_async(server)
+        websocket = await websockets.connect(url, subprotocols=[BinaryCodec.Name])
+        await self.wait_for_async(lambda: len(server.Connections) == 1)
+        await websocket.send(BinaryCodec.Header.pack(0, 1, 7))
+        await asyncio.wait_for(websocket.wait_closed(), 5)
+        self.assertEqual(websocket.close_code, 1002)
+        await self.wait_for_async(lambda: len(server.Connections) == 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+
+from tests.support import *
+
+
+class PriceClient(WebsocketAppClient):
+    def __init__(self):
+        WebsocketAppClient.__init__(self)
+        self.Prices = []
+        self.add_message_handler('price', self.price_handler_async)
+
+    async def price_handler_async(self, msg):
+        self.Prices.append(tuple(msg.Data))
+
+
+class ConflationTests(ServerTestCase):
+    async def connect_server_async(self, server: WebsocketAppServer) -> tuple:
+        client = await self.connect_async(await self.start_server_async(server), PriceClient())
+        await self.wait_for_async(lambda: len(server.Connections) == 1)
+        return client, next(iter(server.Connections.values()))
+
+    async def test_latest_value_per_key_wins_under_a_burst(self):
+        server = WebsocketAppServer(0)
+        client, connection = await self.connect_server_async(server)
+        for i in range(100):
+            for symbol in ('INFY', 'TCS'):
+                self.assertTrue(connection.send_conflated('price', (symbol, i), symbol))
+
+        await self.wait_for_async(lambda: ('TCS', 99) in client.Prices)
+        await asyncio.sleep(0.1)
+        self.assertEqual(client.Prices, [('INFY', 99), ('TCS', 99)])
+        metrics = server.Metrics.get_message_metrics('price')
+        self.assertEqual((metrics.Sent, metrics.Conflated), (2, 198))
+
+    async def test_keys_beyond_the_limit_are_dropped(self):
+        server = WebsocketAppServer(0, conflation_max_keys=2)
+        client, connection = await self.connect_server_async(server)
+        results = [connection.send_conflated('price', (symbol, 1), symbol) for symbol in ('INFY', 'TCS', 'WIPRO')]
+        self.assertEqual(results, [True, True, False])
+        self.assertTrue(connection.send_conflated('price', ('TCS', 2), 'TCS'))
+
+        await self.wait_for_async(lambda: len(client.Prices) == 2)
+        self.assertEqual(client.Prices, [('INFY', 1), ('TCS', 2)])
+        self.assertEqual(server.Metrics.get_message_metrics('price').Dropped, 1)
+
+    async def test_conflated_publish_delivers_the_last_value(self):
+        server = WebsocketAppServer(0)
+        client, connection = await self.connect_server_async(server)
+        server.subscribe(connection, 'NSE:INFY')
+        for i in range(100):
+            self.assertEqual(await server.publish_async('NSE:INFY', 'price', ('INFY', i), conflation_key='INFY'), 1)
+
+        await self.wait_for_async(lambda: client.Prices and client.Prices[-1] == ('INFY', 99))
+        prices = [price for symbol, price in client.Prices]
+        self.assertEqual(prices, sorted(set(prices)))
+        metrics = server.Metrics.get_message_metrics('price')
+        self.assertEqual(metrics.Sent + metrics.Conflated, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+
+from WebsocketsAppLibrary.app_dispatch import *
+from tests.support import *
+
+
+class DispatchServer(WebsocketAppServer):
+    def __init__(self, max_concurrency: int = None):
+        WebsocketAppServer.__init__(self, 0, max_concurrency=max_concurrency)
+        self.Started = 0
+        self.Cancelled = 0
+        self.add_message_handler('slow', self.slow_handler_async)
+        self.add_message_handler('fail', self.fail_handler_async)
+        self.add_message_handler('echo', self.echo_handler_async)
+        self.add_message_handler('ask', self.ask_handler_async)
+
+    async def slow_handler_async(self, client, msg):
+        self.Started += 1
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            self.Cancelled += 1
+            raise
+
+    async def fail_handler_async(self, client, msg):
+        raise ValueError('Invalid order')
+
+    async def echo_handler_async(self, client, msg):
+        await client.send_response_obj_async(msg, msg.Data)
+
+    async def ask_handler_async(self, client, msg):
+        for i in range(msg.Data):
+            await client.send_obj_async('ask', i)
+        await client.send_response_obj_async(msg, True)
+
+
+class AskingClient(WebsocketAppClient):
+    def __init__(self):
+        WebsocketAppClient.__init__(self, max_concurrency=1)
+        self.Answers = []
+        self.add_message_handler('ask', self.ask_handler_async)
+
+    async def ask_handler_async(self, msg):
+        # Waits for a response read by the read loop of the connection, while the dispatcher is saturated
+        response = await self.execute_obj_async('echo', msg.Data, timeout=5)
+        self.Answers.append(response.Data)
+
+
+class ConcurrentDispatcherTests(unittest.IsolatedAsyncioTestCase):
+    async def test_handlers_beyond_the_bound_are_refused(self):
+        dispatcher = ConcurrentDispatcher(2, 1)
+        release = asyncio.Event()
+
+        async def handle_async(msg, route):
+            await release.wait()
+
+        tasks = [dispatcher.dispatch(handle_async, None, None) for i in range(3)]
+        self.assertIsNone(dispatcher.dispatch(handle_async, None, None))
+        self.assertEqual(len(dispatcher.Tasks), 3)
+
+        release.set()
+        await asyncio.wait(tasks)
+        self.assertEqual(len(dispatcher.Tasks), 0)
+        self.assertIsNotNone(dispatcher.dispatch(handle_async, None, None))
+
+    async def test_order_key_handles_messages_in_order(self):
+        dispatcher = ConcurrentDispatcher(4)
+        handled = []
+
+        async def handle_async(msg, route):
+            await asyncio.sleep(0.01 * (5 - msg))
+            handled.append(msg)
+
+        tasks = [dispatcher.dispatch(handle_async, i, None, 'INFY') for i in range(5)]
+        await asyncio.wait(tasks)
+        self.assertEqual(handled, list(range(5)))
+        self.assertEqual(dispatcher.OrderTails, {})
+
+
+class DispatchTests(ServerTestCase):
+    async def test_handlers_are_cancelled_on_close(self):
+        server = DispatchServer(max_concurrency=4)
+        client = await self.connect_async(await self.start_server_async(server))
+        for i in range(20):
+            await client.send_obj_async('slow', i)
+        await self.wait_for_async(lambda: server.Started == 4)
+        connection = next(iter(server.Connections.values()))
+        self.assertEqual(len(connection.Dispatcher.Tasks), 8)
+        self.assertEqual(server.Metrics.get_message_metrics('slow').Rejected, 12)
+
+        await client.disconnect('Test done')
+        await self.wait_for_async(lambda: server.Cancelled == 4)
+        self.assertEqual(len(connection.Dispatcher.Tasks), 0)
+
+    async def test_handlers_awaiting_requests_complete_while_saturated(self):
+        server = DispatchServer()
+        client = await self.connect_async(await self.start_server_async(server), AskingClient())
+        await client.execute_obj_async('ask', 3, timeout=5)
+        await self.wait_for_async(lambda: len(client.Answers) == 2)
+        self.assertEqual(client.Answers, [0, 1])
+        self.assertEqual(client.Metrics.get_message_metrics('ask').Rejected, 1)
+        self.assertFalse(client.CorIdMessageMap)
+
+    async def test_requests_beyond_the_bound_get_a_retry_after_hint(self):
+        server = DispatchServer(max_concurrency=1)
+        client = await self.connect_async(await self.start_server_async(server))
+        await client.send_obj_async('slow', 0)
+        await client.send_obj_async('slow', 1)
+        with self.assertRaises(WebsocketAppOverloadedException) as context:
+            await client.execute_obj_async('echo', 2, timeout=5)
+        self.assertEqual(context.exception.RetryAfter, ConcurrentDispatcher.RetryAfter)
+
+    async def test_handler_errors_are_the_same_inline_and_concurrent(self):
+        for max_concurrency in (None, 4):
+            with self.subTest(max_concurrency=max_concurrency):
+                client = await self.connect_async(await self.start_server_async(DispatchServer(max_concurrency)))
+                with self.assertRaises(WebsocketAppRemoteException) as context:
+                    await client.execute_obj_async('fail', 1, timeout=5)
+                self.assertEqual(context.exception.Error, 'Invalid order')
+                # One-way messages failing do not close the connection either
+                await client.send_obj_async('fail', 2)
+                response = await client.execute_obj_async('echo', 3, timeout=5)
+                self.assertEqual(response.Data, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
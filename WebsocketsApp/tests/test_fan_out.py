@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+
+from tests.support import *
+
+
+class QuoteClient(WebsocketAppClient):
+    def __init__(self):
+        WebsocketAppClient.__init__(self)
+        self.Quotes = []
+        self.add_message_handler('quote', self.quote_handler_async)
+
+    async def quote_handler_async(self, msg):
+        self.Quotes.append(msg.Data)
+
+
+class FanOutTests(ServerTestCase):
+    async def test_slow_consumers_are_skipped_without_blocking_the_publisher(self):
+        server = WebsocketAppServer(0)
+        url = await self.start_server_async(server)
+        fast = await self.connect_async(url, QuoteClient())
+        slow = await self.connect_async(url, QuoteClient())
+        await self.wait_for_async(lambda: len(server.Connections) == 2)
+        # The send queue of the slow consumer stays above its high watermark
+        slow_connection = list(server.Connections.values())[1]
+        slow_connection.SendQueue = SendQueue(slow_connection, SendQueueOptions(high_watermark=0))
+
+        counts = [await asyncio.wait_for(server.broadcast_async('quote', i), 1) for i in range(100)]
+        await self.wait_for_async(lambda: len(fast.Quotes) == 100)
+        self.assertEqual(counts, [1] * 100)
+        self.assertEqual(fast.Quotes, list(range(100)))
+        self.assertEqual(slow.Quotes, [])
+        metrics = server.Metrics.get_message_metrics('quote')
+        self.assertEqual((metrics.Sent, metrics.Dropped), (100, 100))
+
+    async def test_published_messages_stay_in_order_with_direct_sends(self):
+        server = WebsocketAppServer(0)
+        client = await self.connect_async(await self.start_server_async(server), QuoteClient())
+        await self.wait_for_async(lambda: len(server.Connections) == 1)
+        connection = next(iter(server.Connections.values()))
+        for i in range(0, 100, 2):
+            await server.broadcast_async('quote', i)
+            await connection.send_obj_async('quote', i + 1)
+        await self.wait_for_async(lambda: len(client.Quotes) == 100)
+        self.assertEqual(client.Quotes, list(range(100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+
+from WebsocketsAppLibrary.app_router import *
+from tests.support import *
+
+
+class HandlerClient(object):
+    """
+    Client connection the pipelines of a router run with, invoking the handlers directly
+    """
+    async def invoke_message_handler_async(self, handler, msg):
+        await handler(msg)
+
+
+def create_message(name) -> WebsocketAppMessage:
+    return WebsocketAppMessage(name, WebsocketAppMessageType.Oneway, None, None, None, None)
+
+
+class LoginServer(WebsocketAppServer):
+    def __init__(self):
+        WebsocketAppServer.__init__(self, 0)
+        self.add_message_handler('login', self.login_handler_async)
+        self.add_message_handler('orders.place', self.place_handler_async)
+        self.add_middleware(self.require_login, ['orders.*'])
+
+    def require_login(self, next_async, route):
+        async def middleware_async(client, msg):
+            if client.State.get('User') is None:
+                raise PermissionError('Not logged in')
+            await next_async(client, msg)
+        return middleware_async
+
+    async def login_handler_async(self, client, msg):
+        client.State['User'] = msg.Data
+        await client.send_response_obj_async(msg, True)
+
+    async def place_handler_async(self, client, msg):
+        await client.send_response_obj_async(msg, client.State['User'])
+
+
+class WebsocketAppRouterTests(unittest.IsolatedAsyncioTestCase):
+    async def test_middlewares_added_first_run_first(self):
+        router = WebsocketAppRouter()
+        calls = []
+
+        def create_middleware(label):
+            def middleware(next_async, route):
+                async def middleware_async(client, msg):
+                    calls.append(label + ':' + route.Name)
+                    await next_async(client, msg)
+                return middleware_async
+            return middleware
+
+        async def handler_async(msg):
+            calls.append('handler:' + msg.Name)
+
+        router.add_route('quote', handler_async)
+        router.add_route('orders.*', handler_async)
+        router.add_middleware(create_middleware('outer'))
+        router.add_middleware(create_middleware('orders'), ['orders.*'])
+        router.add_middleware(create_middleware('inner'))
+        # Routes added after the middlewares are compiled with them too
+        router.add_route('orders.cancel', handler_async)
+
+        for name in ('quote', 'orders.place', 'orders.cancel'):
+            await router.get_route(name).Pipeline(HandlerClient(), create_message(name))
+        self.assertEqual(calls, [
+            'outer:quote', 'inner:quote', 'handler:quote',
+            'outer:orders.*', 'orders:orders.*', 'inner:orders.*', 'handler:orders.place',
+            'outer:orders.cancel', 'orders:orders.cancel', 'inner:orders.cancel', 'handler:orders.cancel'])
+
+    def test_exact_names_and_longer_prefixes_take_precedence(self):
+        router = WebsocketAppRouter()
+        for name in ('*', 'orders.*', 'orders.status.*', 'orders.status.NSE'):
+            router.add_route(name, None)
+        self.assertEqual(router.get_route('orders.status.NSE').Name, 'orders.status.NSE')
+        self.assertEqual(router.get_route('orders.status.BSE').Name, 'orders.status.*')
+        self.assertEqual(router.get_route('orders.place').Name, 'orders.*')
+        self.assertEqual(router.get_route('quote').Name, '*')
+        self.assertIsNone(router.get_route(['unhashable']))
+
+    def test_cached_names_are_resolved_again_after_route_changes(self):
+        router = WebsocketAppRouter()
+        self.assertIsNone(router.get_route('orders.place'))
+        router.add_route('orders.*', None)
+        self.assertEqual(router.get_route('orders.place').Name, 'orders.*')
+        router.add_route('orders.place', None)
+        self.assertEqual(router.get_route('orders.place').Name, 'orders.place')
+        router.remove_route('orders.place')
+        self.assertEqual(router.get_route('orders.place').Name, 'orders.*')
+        router.remove_route('orders.*')
+        self.assertIsNone(router.get_route('orders.place'))
+
+    def test_cache_is_bounded(self):
+        router = WebsocketAppRouter()
+        router.MaxCachedNames = 3
+        router.add_route('*', None)
+        for i in range(10):
+            self.assertEqual(router.get_route('name' + str(i)).Name, '*')
+        self.assertEqual(len(router.Cache), 3)
+
+
+class MiddlewareTests(ServerTestCase):
+    async def test_middleware_guards_the_matching_routes(self):
+        client = await self.connect_async(await self.start_server_async(LoginServer()))
+        with self.assertRaises(WebsocketAppRemoteException) as context:
+            await client.execute_obj_async('orders.place', 1, timeout=5)
+        self.assertEqual(context.exception.Error, 'Not logged in')
+
+        await client.execute_obj_async('login', 'trader', timeout=5)
+        response = await client.execute_obj_async('orders.place', 1, timeout=5)
+        self.assertEqual(response.Data, 'trader')
+
+
+if __name__ == '__main__':
+    unittest.main()
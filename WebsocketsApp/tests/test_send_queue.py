@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from WebsocketsAppLibrary.app_codec import *
+from WebsocketsAppLibrary.app_outbound import *
+from tests.support import *
+
+
+class GatedConnection(object):
+    """
+    Connection of a send queue whose socket only drains while Open is set
+    """
+    def __init__(self):
+        self.Codec = JsonCodec.create()
+        self.Frames = []
+        self.Open = asyncio.Event()
+
+    async def write_frame_async(self, frame):
+        await self.Open.wait()
+        self.Frames.append(frame)
+
+
+class SendQueueTests(unittest.IsolatedAsyncioTestCase):
+    async def fill_async(self, policy) -> tuple:
+        """
+        Returns a send queue above its high watermark, with its writer waiting for the socket to drain
+        """
+        connection = GatedConnection()
+        queue = SendQueue(connection, SendQueueOptions(high_watermark=10, low_watermark=5, policy=policy))
+        self.assertTrue(await queue.wait_writable_async())
+        queue.put('a' * 10)
+        await asyncio.sleep(0)
+        queue.put('b' * 10)
+        return connection, queue
+
+    async def test_senders_block_above_the_high_watermark_until_drained(self):
+        connection, queue = await self.fill_async(SendQueuePolicy.Block)
+        blocked = asyncio.ensure_future(queue.wait_writable_async())
+        await asyncio.sleep(0.05)
+        self.assertFalse(blocked.done())
+
+        connection.Open.set()
+        self.assertTrue(await asyncio.wait_for(blocked, 1))
+        queue.put('c' * 10)
+        await asyncio.sleep(0)
+        self.assertEqual(connection.Frames, ['a' * 10, 'b' * 10, 'c' * 10])
+        self.assertEqual(queue.Bytes, 0)
+
+    async def test_messages_above_the_high_watermark_are_dropped(self):
+        connection, queue = await self.fill_async(SendQueuePolicy.Drop)
+        self.assertFalse(await asyncio.wait_for(queue.wait_writable_async(), 1))
+
+    async def test_blocked_senders_fail_when_the_queue_is_closed(self):
+        connection, queue = await self.fill_async(SendQueuePolicy.Block)
+        blocked = asyncio.ensure_future(queue.wait_writable_async())
+        await asyncio.sleep(0)
+        queue.close()
+        with self.assertRaises(WebsocketAppConnectionClosedException):
+            await asyncio.wait_for(blocked, 1)
+
+    async def test_queued_frames_are_sent_as_one_batch(self):
+        connection = GatedConnection()
+        connection.Open.set()
+        queue = SendQueue(connection, SendQueueOptions(batch_window=0))
+        messages = [WebsocketAppMessage('quote', WebsocketAppMessageType.Oneway, None, None, None, i) for i in range(5)]
+        for msg in messages:
+            queue.put(connection.Codec.encode(msg))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(len(connection.Frames), 1)
+        self.assertTrue(connection.Codec.is_batch(connection.Frames[0]))
+        self.assertEqual([msg.Data for msg in connection.Codec.decode_batch(connection.Frames[0])], list(range(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+
+from WebsocketsAppLibrary.app_session import *
+from tests.support import *
+
+
+class SessionServer(WebsocketAppServer):
+    def __init__(self):
+        WebsocketAppServer.__init__(self, 0, max_concurrency=4, session_timeout=5)
+        self.add_message_handler('start', self.start_handler_async)
+        self.add_message_handler('slow_echo', self.slow_echo_handler_async)
+
+    async def push_status_async(self, client, count: int):
+        for i in range(count):
+            await asyncio.sleep(0.05)
+            await client.send_obj_async('status', i)
+
+    async def start_handler_async(self, client, msg):
+        client.create_background_task(self.push_status_async(client, msg.Data))
+        await client.send_response_obj_async(msg, True)
+
+    async def slow_echo_handler_async(self, client, msg):
+        await asyncio.sleep(0.3)
+        await client.send_response_obj_async(msg, msg.Data)
+
+
+class StatusClient(WebsocketAppClient):
+    def __init__(self):
+        WebsocketAppClient.__init__(self, reconnect=ReconnectOptions(initial_delay=0.05))
+        self.Statuses = []
+        self.add_message_handler('status', self.status_handler_async)
+
+    async def status_handler_async(self, msg):
+        self.Statuses.append(msg.Data)
+
+
+class WebsocketAppSessionTests(unittest.TestCase):
+    def test_replay_after_acknowledge(self):
+        session = WebsocketAppSession('session', max_replay=10)
+        for i in range(5):
+            session.record_sent(i)
+        session.acknowledge(2)
+        self.assertTrue(session.can_replay(2))
+        self.assertEqual(session.get_replay(2), [2, 3, 4])
+        self.assertEqual(session.get_replay(4), [4])
+        self.assertFalse(session.can_replay(1))
+
+    def test_replay_buffer_is_bounded(self):
+        session = WebsocketAppSession('session', max_replay=3)
+        for i in range(5):
+            session.record_sent(i)
+        self.assertEqual(session.get_replay(2), [2, 3, 4])
+        self.assertFalse(session.can_replay(1))
+
+    def test_received_messages_are_acknowledged_every_interval(self):
+        session = WebsocketAppSession('session', ack_interval=3)
+        self.assertEqual([session.record_received() for i in range(6)], [False, False, True, False, False, True])
+
+
+class SessionResumeTests(ServerTestCase):
+    async def test_messages_sent_while_disconnected_are_replayed(self):
+        server = SessionServer()
+        client = await self.connect_async(await self.start_server_async(server), StatusClient())
+        await client.execute_obj_async('start', 10, timeout=5)
+        await self.wait_for_async(lambda: len(client.Statuses) >= 2)
+
+        websocket = client.Websocket
+        websocket.transport.abort()
+        await self.wait_for_async(lambda: len(client.Statuses) == 10)
+        self.assertIsNot(client.Websocket, websocket)
+        self.assertEqual(client.Statuses, list(range(10)))
+        self.assertFalse(client.Closed)
+        self.assertEqual(len(server.Connections), 1)
+
+    async def test_pending_request_gets_its_response_after_resume(self):
+        server = SessionServer()
+        client = await self.connect_async(await self.start_server_async(server), StatusClient())
+        response = asyncio.ensure_future(client.execute_obj_async('slow_echo', 'order', timeout=5))
+        await asyncio.sleep(0.1)
+
+        client.Websocket.transport.abort()
+        self.assertEqual((await response).Data, 'order')
+
+    async def test_session_is_not_resumed_after_disconnect(self):
+        server = SessionServer()
+        client = await self.connect_async(await self.start_server_async(server), StatusClient())
+        await client.disconnect('Test done')
+        await asyncio.sleep(0.2)
+        self.assertTrue(client.Closed)
+        self.assertIsNone(client.ReconnectOptions)
+
+
+if __name__ == '__main__':
+    unittest.main()
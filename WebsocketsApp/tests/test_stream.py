@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+
+from tests.support import *
+
+
+class StreamServer(WebsocketAppServer):
+    def __init__(self):
+        WebsocketAppServer.__init__(self, 0)
+        self.Produced = 0
+        self.Closed = asyncio.Event()
+        self.add_message_handler('rows', self.rows_handler_async)
+
+    async def rows_handler_async(self, client, msg):
+        try:
+            for i in range(msg.Data):
+                self.Produced += 1
+                yield i
+        finally:
+            self.Closed.set()
+
+
+class StreamTests(ServerTestCase):
+    async def test_sender_waits_for_credit(self):
+        server = StreamServer()
+        client = await self.connect_async(await self.start_server_async(server))
+        stream = client.stream_obj_async('rows', 20, credit=4, timeout=5)
+
+        rows = [(await stream.__anext__()).Data]
+        await asyncio.sleep(0.1)
+        # The handler is not resumed past the credit granted with the request
+        self.assertEqual(server.Produced, 4)
+
+        # Half the window consumed grants that much credit again, when the next message is asked for
+        rows.append((await stream.__anext__()).Data)
+        await asyncio.sleep(0.1)
+        self.assertEqual(server.Produced, 4)
+        rows.append((await stream.__anext__()).Data)
+        await self.wait_for_async(lambda: server.Produced == 6)
+        await asyncio.sleep(0.1)
+        self.assertEqual(server.Produced, 6)
+
+        rows.extend([msg.Data async for msg in stream])
+        self.assertEqual(rows, list(range(20)))
+
+    async def test_leaving_the_loop_cancels_the_stream(self):
+        server = StreamServer()
+        client = await self.connect_async(await self.start_server_async(server))
+        async for msg in client.stream_obj_async('rows', 1000, credit=2, timeout=5):
+            break
+        await asyncio.wait_for(server.Closed.wait(), 5)
+        self.assertLessEqual(server.Produced, 2)
+        await self.wait_for_async(lambda: not next(iter(server.Connections.values())).StreamSenders)
+
+
+if __name__ == '__main__':
+    unittest.main()
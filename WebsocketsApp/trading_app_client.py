@@ -7,23 +7,41 @@ class TradingAppClient(WebsocketAppClient):
     def __init__(self):
         WebsocketAppClient.__init__(self)
 
-        self.add_message_handler("order_status", self.order_status_handler_async)
+        self.add_message_handler("order_status", self.order_status_handler_async, payload_type=Order)
 
     async def order_status_handler_async(self, msg: WebsocketAppMessage):
-        # Get the Order object from the message JSON data
-        order_dict = jsonpickle.decode(msg.JsonData)
-        order = Order(**order_dict)
+        # The message payload is decoded into an Order object
+        order: Order = msg.Data
 
         print('Order Id:' + order.Id + ', Order Status: ' + order.OrderStatus)
 
     async def place_order_async(self, place_order_request: PlaceOrderRequest):
-        msg: WebsocketAppMessage = await self.execute_obj_async("place_order", place_order_request)
+        msg: WebsocketAppMessage = await self.execute_obj_async("place_order", place_order_request,
+                                                                response_type=Order)
 
-        # Get the Order object from the message JSON data
-        order_dict = jsonpickle.decode(msg.JsonData)
-        order = Order(**order_dict)
+        # The response payload is decoded into an Order object
+        order: Order = msg.Data
 
         print('Order Id:' + order.Id + ', Order Status: ' + order.OrderStatus)
 
+    async def place_orders_async(self, place_order_requests):
+        # All the orders are sent in one batch frame, the responses are printed as they arrive
+        async for index, result in self.execute_many_iter_async("place_order", place_order_requests,
+                                                                response_type=Order):
+            if isinstance(result, WebsocketAppRemoteException):
+                print('Order ' + str(index) + ' failed: ' + str(result.Error))
+                continue
+
+            order: Order = result.Data
+
+            print('Order Id:' + order.Id + ', Order Status: ' + order.OrderStatus)
+
+    async def place_order_stream_async(self, place_order_request: PlaceOrderRequest):
+        # The order status changes are streamed back for this request, until the order is completed
+        async for msg in self.stream_obj_async("place_order_stream", place_order_request, response_type=Order):
+            order: Order = msg.Data
+
+            print('Order Id:' + order.Id + ', Order Status: ' + order.OrderStatus)
+
     async def on_connection_closed_async(self):
         print('server connection closed')
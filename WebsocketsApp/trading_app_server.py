@@ -7,10 +7,14 @@ from trading_types import *
 
 class TradingAppServer(WebsocketAppServer):
     def __init__(self, port):
-        WebsocketAppServer.__init__(self, port)
+        # Limit each client to 100 orders per second and 1000 orders pending execution
+        WebsocketAppServer.__init__(self, port, admission=AdmissionOptions(
+            name_limits={"place_order*": RateLimit(100)}, max_background_tasks=1000))
 
         # Add message handlers here
-        self.add_message_handler("place_order", self.place_order_handler_async)
+        self.add_message_handler("place_order", self.place_order_handler_async, payload_type=PlaceOrderRequest)
+        self.add_message_handler("place_order_stream", self.place_order_stream_handler_async,
+                                 payload_type=PlaceOrderRequest)
 
     # Function to simulate order execution and sending order status
     # back to the client
@@ -31,9 +35,8 @@ class TradingAppServer(WebsocketAppServer):
 
     # Handler function to handle place order requests
     async def place_order_handler_async(self, client: WebsocketAppClientHandler, msg: WebsocketAppMessage):
-        # Get the PlaceOrderRequest object from the message JSON data
-        place_order_request_dict = jsonpickle.decode(msg.JsonData)
-        place_order_request = PlaceOrderRequest(**place_order_request_dict)
+        # The message payload is decoded into a PlaceOrderRequest object
+        place_order_request: PlaceOrderRequest = msg.Data
 
         # Create a new order object with Pending status
         new_order = Order()
@@ -47,7 +50,27 @@ class TradingAppServer(WebsocketAppServer):
         await client.send_response_obj_async(msg, new_order)
 
         # Invoke the order execution
-        asyncio.create_task(self.execute_order_async(client, place_order_request, new_order))
+        client.create_background_task(self.execute_order_async(client, place_order_request, new_order))
+
+    # Stream handler to handle place order requests, streaming the order status changes back to the client
+    async def place_order_stream_handler_async(self, client: WebsocketAppClientHandler, msg: WebsocketAppMessage):
+        place_order_request: PlaceOrderRequest = msg.Data
+
+        new_order = Order()
+        new_order.Id = uuid.uuid4().hex
+        new_order.Symbol = place_order_request.Symbol
+        new_order.Market = place_order_request.Market
+        new_order.Quantity = place_order_request.Quantity
+        new_order.AveragePrice = place_order_request.Price * 90/100
+
+        # The order is pending
+        yield new_order
+
+        # Simulate the order execution
+        await asyncio.sleep(5)
+
+        new_order.OrderStatus = "Completed"
+        yield new_order
 
     async def on_connection_closed_async(self, client):
         print('client closed ' + str(hash(client)))
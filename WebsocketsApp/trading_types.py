@@ -2,24 +2,20 @@ from datetime import datetime
 from WebsocketsAppLibrary.app_types import *
 
 
+@websocket_app_payload
 class PlaceOrderRequest(object):
-    def __init__(self, **kwargs):
-        self.Symbol = None
-        self.Price: float = 0.0
-        self.Quantity: int = 0
-        self.Market = None
-
-        fill_obj(self, **kwargs)
+    Symbol: str = None
+    Price: float = 0.0
+    Quantity: int = 0
+    Market: str = None
 
 
+@websocket_app_payload
 class Order(object):
-    def __init__(self, **kwargs):
-        self.Id = None
-        self.Symbol = None
-        self.AveragePrice: float = 0.0
-        self.Quantity: int = 0
-        self.Market = None
-        self.Timestamp: datetime
-        self.OrderStatus = "Pending"
-
-        fill_obj(self, **kwargs)
+    Id: str = None
+    Symbol: str = None
+    AveragePrice: float = 0.0
+    Quantity: int = 0
+    Market: str = None
+    Timestamp: datetime = None
+    OrderStatus: str = "Pending"